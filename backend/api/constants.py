@@ -36,17 +36,40 @@ class BackendConf:
     project_quota: int = 0
     chunk_size: int = 1024  # reading/writing received files
     illustration_quota: int = 0
+    batch_max_files: int = int(os.getenv("BATCH_MAX_FILES") or "1000")
     api_version_prefix: str = "/v1"  # our API
 
+    # Execution pools (blocking work off the event loop)
+    io_workers: int = int(os.getenv("IO_WORKERS") or "16")
+    cpu_workers: int = int(os.getenv("CPU_WORKERS") or os.cpu_count() or 1)
+
     # single-user mode (Kiwix only)
     single_user_id: str = os.getenv("SINGLE_USER_ID", "").strip() or ""
 
     # Database
     postgres_uri: str = os.getenv("POSTGRES_URI") or "nodb"
+    # connections pool of the async engine (request handlers), per process
+    postgres_pool_size: int = int(os.getenv("POSTGRES_POOL_SIZE") or "10")
+    postgres_max_overflow: int = int(os.getenv("POSTGRES_MAX_OVERFLOW") or "10")
+    # test connections on checkout (a round-trip) to survive DB restarts
+    postgres_pool_pre_ping: bool = bool(os.getenv("POSTGRES_POOL_PRE_PING") or "")
+    # compiled SQL statements kept per engine
+    postgres_statement_cache_size: int = int(
+        os.getenv("POSTGRES_STATEMENT_CACHE_SIZE") or "500"
+    )
+    # statements run that many times on a connection are prepared server-side.
+    # 0 disables it (required behind a transaction-pooling PgBouncer)
+    postgres_prepare_threshold: int = int(
+        os.getenv("POSTGRES_PREPARE_THRESHOLD") or "5"
+    )
 
     # Scheduler process
     redis_uri: str = os.getenv("REDIS_URI") or "redis://localhost:6379/0"
     channel_name: str = os.getenv("CHANNEL_NAME") or "storage_upload"
+    # a project's uploads past this many pending ones go to the bulk queue
+    bulk_uploads_threshold: int = int(os.getenv("BULK_UPLOADS_THRESHOLD") or "50")
+    # jobs a worker runs at once (in threads) from each of its queues
+    worker_concurrency: int = int(os.getenv("WORKER_CONCURRENCY") or "1")
 
     # Transient (on host disk) Storage
     transient_storage_path: Path = Path()
@@ -57,12 +80,67 @@ class BackendConf:
     s3_retry_wait: int = int(
         humanfriendly.parse_timespan(os.getenv("S3_RETRY_TIMES") or "10s")
     )
+    # objects larger than threshold are uploaded in parts, concurrently
+    s3_multipart_threshold: int = 0
+    s3_part_size: int = 0
+    s3_upload_workers: int = int(os.getenv("S3_UPLOAD_WORKERS") or "8")
+    # a failing part is retried on its own before failing the upload job
+    s3_part_max_tries: int = int(os.getenv("S3_PART_MAX_TRIES") or "5")
+    s3_part_retry_wait: float = float(
+        humanfriendly.parse_timespan(os.getenv("S3_PART_RETRY_WAIT") or "1s")
+    )
+    # incomplete multipart uploads are resumable until then, aborted after
+    s3_multipart_stale_after: datetime.timedelta = datetime.timedelta(
+        seconds=humanfriendly.parse_timespan(
+            os.getenv("S3_MULTIPART_STALE_AFTER") or "1d"
+        )
+    )
+    # Files of a project uploaded at once by its upload job
+    project_upload_workers: int = int(os.getenv("PROJECT_UPLOAD_WORKERS") or "8")
+    # a File upload job holds a lock on its Storage path, lost if it dies
+    upload_lock_timeout: int = int(
+        humanfriendly.parse_timespan(os.getenv("UPLOAD_LOCK_TIMEOUT") or "5m")
+    )
+    # a project's upload job may run that long, plus that per File to upload
+    upload_job_timeout: int = int(
+        humanfriendly.parse_timespan(os.getenv("UPLOAD_JOB_TIMEOUT") or "10m")
+    )
+    upload_job_timeout_per_file: int = int(
+        humanfriendly.parse_timespan(os.getenv("UPLOAD_JOB_TIMEOUT_PER_FILE") or "1m")
+    )
+    # Files being uploaded are leased to a job, renewed while it's alive
+    upload_lease_duration: datetime.timedelta = datetime.timedelta(
+        seconds=humanfriendly.parse_timespan(os.getenv("UPLOAD_LEASE_DURATION") or "5m")
+    )
+    # periodic cleanup of stale uploads (see sweep_storage_uploads)
+    storage_sweep_interval: datetime.timedelta = datetime.timedelta(
+        seconds=humanfriendly.parse_timespan(
+            os.getenv("STORAGE_SWEEP_INTERVAL") or "1h"
+        )
+    )
+    # resumable uploads not resumed for that long are removed (on storage sweep)
+    upload_expire_after: datetime.timedelta = datetime.timedelta(
+        seconds=humanfriendly.parse_timespan(os.getenv("UPLOAD_EXPIRE_AFTER") or "1d")
+    )
+    # hashes of in-progress uploads kept in memory (per process), latest ones
+    upload_hashers_max: int = int(os.getenv("UPLOAD_HASHERS_MAX") or "100")
+    # content (Blob) expiring sooner is not reused for new Files (precheck): its
+    # Storage objects would be autodeleted before their expiry is extended
+    known_content_min_lifetime: datetime.timedelta = datetime.timedelta(
+        seconds=humanfriendly.parse_timespan(
+            os.getenv("KNOWN_CONTENT_MIN_LIFETIME") or "1d"
+        )
+    )
     s3_deletion_delay: datetime.timedelta = datetime.timedelta(
         hours=int(os.getenv("S3_REMOVE_DELETEDUPLOADING_AFTER_HOURS", "25"))
     )
     private_salt = os.getenv(
         "PRIVATE_SALT", uuid.uuid4().hex
     )  # used to make S3 keys unguessable
+    s3_request_timeout_sec: int = int(os.getenv("S3_REQUEST_TIMEOUT_SEC") or "60")
+
+    # connections pool of async Storage clients (request handlers)
+    storage_max_connections: int = int(os.getenv("STORAGE_MAX_CONNECTIONS") or "20")
 
     # WebDAV Storage
     webdav_url_with_credentials: str = os.getenv("WEBDAV_URL_WITH_CREDENTIALS") or ""
@@ -103,6 +181,25 @@ class BackendConf:
     zimfarm_callback_token = os.getenv("ZIMFARM_CALLBACK_TOKEN", uuid.uuid4().hex)
     zimfarm_task_worker: str = os.getenv("ZIMFARM_TASK_WORKER") or "-"
     zimfarm_request_timeout_sec: int = 10
+    # connections kept alive to (and max concurrent requests on) Zimfarm API
+    zimfarm_max_connections: int = int(os.getenv("ZIMFARM_MAX_CONNECTIONS") or "4")
+    # archives submitted within that window are requested to Zimfarm at once
+    # (0 to request each as soon as its files are uploaded)
+    zimfarm_batch_window: datetime.timedelta = datetime.timedelta(
+        seconds=humanfriendly.parse_timespan(os.getenv("ZIMFARM_BATCH_WINDOW") or "5s")
+    )
+    zimfarm_batch_size: int = int(os.getenv("ZIMFARM_BATCH_SIZE") or "50")
+    # archives still SUBMITTING that long after are reverted to PENDING
+    # (their submission died), checked at that interval
+    archive_submission_deadline: datetime.timedelta = datetime.timedelta(
+        seconds=humanfriendly.parse_timespan(
+            os.getenv("ARCHIVE_SUBMISSION_DEADLINE") or "1h"
+        )
+    )
+    # delete requests' temporary schedules from a job instead of while requesting
+    zimfarm_delete_schedule_in_background: bool = bool(
+        os.getenv("ZIMFARM_DELETE_SCHEDULE_IN_BACKGROUND") or ""
+    )
     zim_download_url: str = (
         os.getenv("ZIM_DOWNLOAD_URL")
         or "https://s3.us-west-1.wasabisys.com/org-kiwix-zimit"
@@ -132,6 +229,13 @@ class BackendConf:
 
         self.chunk_size = humanfriendly.parse_size(os.getenv("CHUNK_SIZE", "2MiB"))
 
+        self.s3_part_size = humanfriendly.parse_size(
+            os.getenv("S3_PART_SIZE") or "8MiB"
+        )
+        self.s3_multipart_threshold = humanfriendly.parse_size(
+            os.getenv("S3_MULTIPART_THRESHOLD") or "16MiB"
+        )
+
         self.illustration_quota = humanfriendly.parse_size(
             os.getenv("ILLUSTRATION_QUOTA", "2MiB")
         )
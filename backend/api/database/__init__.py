@@ -1,10 +1,14 @@
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, Generator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
 from uuid import UUID
 
 import pydantic_core
 from bson.json_util import DEFAULT_JSON_OPTIONS, loads
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session as OrmSession
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession as AsyncOrmSession
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from api.constants import constants
@@ -22,22 +26,73 @@ def my_loads(s, *args, **kwargs):
     )
 
 
-Session = sessionmaker(
-    bind=create_engine(
-        constants.postgres_uri,
-        echo=False,
-        json_serializer=pydantic_core.to_json,
-        json_deserializer=my_loads,  # use custom bson deserializer for same reason
-    )
+engine_options = {
+    "echo": False,
+    "json_serializer": pydantic_core.to_json,
+    "json_deserializer": my_loads,  # use custom bson deserializer for same reason
+    "query_cache_size": constants.postgres_statement_cache_size,
+}
+
+# blocking sessions, for rq jobs and code run in the I/O pool
+engine = create_engine(constants.postgres_uri, **engine_options)
+Session = sessionmaker(bind=engine)
+
+# request handlers' sessions, awaited on the event loop
+async_engine = create_async_engine(
+    constants.postgres_uri,
+    pool_size=constants.postgres_pool_size,
+    max_overflow=constants.postgres_max_overflow,
+    pool_pre_ping=constants.postgres_pool_pre_ping,
+    connect_args={"prepare_threshold": constants.postgres_prepare_threshold or None},
+    **engine_options,
+)
+AsyncSession = async_sessionmaker(
+    bind=async_engine,
+    # attributes stay readable once committed (would otherwise be awaited)
+    expire_on_commit=False,
 )
 
 
-def gen_session() -> Generator[OrmSession, None, None]:
-    """FastAPI's Depends() compatible helper to provide a began DB Session"""
-    with Session.begin() as session:
+@dataclass(kw_only=True)
+class QueryCounter:
+    count: int = 0
+
+
+# SQL statements counter of the current context (a request), when counting
+query_counter: ContextVar[QueryCounter | None] = ContextVar(
+    "query_counter", default=None
+)
+
+
+@contextmanager
+def count_queries() -> Generator[QueryCounter, None, None]:
+    """Count SQL statements run in this context, I/O pool's threads included"""
+    counter = QueryCounter()
+    token = query_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        query_counter.reset(token)
+
+
+@event.listens_for(engine, "before_cursor_execute")
+@event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+def record_query(*_args):
+    if counter := query_counter.get():
+        counter.count += 1
+
+
+async def gen_session() -> AsyncGenerator[AsyncOrmSession, None]:
+    """FastAPI's Depends() compatible helper to provide a began async DB Session"""
+    async with AsyncSession.begin() as session:
         yield session
 
 
 def get_local_fpath_for(file_hash: str, project_id: UUID):
     """Generates the local file path for a given file hash and project ID."""
     return constants.transient_storage_path.joinpath(f"{project_id}-{file_hash}")
+
+
+def get_blob_fpath(file_hash: str):
+    """Local file path of a content (blob), shared by all projects' Files"""
+    return constants.transient_storage_path.joinpath(f"blob-{file_hash}")
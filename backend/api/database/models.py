@@ -4,8 +4,9 @@ from typing import Any, ClassVar, TypeVar
 from uuid import UUID
 
 from pydantic import BaseModel
-from sqlalchemy import DateTime, ForeignKey, String, text, types
+from sqlalchemy import DateTime, ForeignKey, Index, String, text, types
 from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import (
     DeclarativeBase,
     Mapped,
@@ -22,7 +23,7 @@ from zimscraperlib.zim.metadata import (
     validate_title,
 )
 
-from api.database import get_local_fpath_for
+from api.database import get_blob_fpath, get_local_fpath_for
 
 T = TypeVar("T", bound="ArchiveConfig")
 
@@ -66,6 +67,9 @@ class ArchiveConfig(BaseModel):
 class ArchiveStatus(str, Enum):
     # It's in database but not requested and can be modified
     PENDING = "PENDING"
+    # request accepted, its files being uploaded and its task requested to ZimFarm
+    # (in background); can not be modified by user
+    SUBMITTING = "SUBMITTING"
     # it has been ZF-requested; can not be modified by user,
     # awaiting callback from ZimFarm
     REQUESTED = "REQUESTED"
@@ -86,7 +90,12 @@ class ArchiveConfigType(types.TypeDecorator):
             return value
         return dict(value) if value else {}
 
-    def process_result_value(self, value, dialect) -> ArchiveConfig:  # noqa: ARG002
+    def process_result_value(
+        self, value, dialect  # noqa: ARG002
+    ) -> ArchiveConfig | None:
+        # outer-joined without an Archive
+        if value is None:
+            return None
         if isinstance(value, ArchiveConfig):
             return value
         return ArchiveConfig.model_validate(dict(value) if value else {})
@@ -97,7 +106,9 @@ class ArchiveConfigType(types.TypeDecorator):
         )  # pyright: ignore [reportCallIssue]
 
 
-class Base(MappedAsDataclass, DeclarativeBase):
+# AsyncAttrs: in async sessions, relationships are loaded by awaiting
+# `obj.awaitable_attrs.<name>` (implicit loads are not allowed)
+class Base(AsyncAttrs, MappedAsDataclass, DeclarativeBase):
     # This map details the specific transformation of types between Python and
     # PostgreSQL. This is only needed for the case where a specific PostgreSQL
     # type has to be used or when we want to ensure a specific setting (like the
@@ -119,7 +130,7 @@ class Base(MappedAsDataclass, DeclarativeBase):
     # alembic to generate constraints names (indexes, unique constraints, ...)
     metadata = MetaData(
         naming_convention={
-            "ix": "ix_%(column_0_label)s",
+            "ix": "ix_%(column_0_N_label)s",
             "uq": "uq_%(table_name)s_%(column_0_name)s",
             "ck": "ck_%(table_name)s_%(constraint_name)s",
             "fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s",
@@ -156,6 +167,8 @@ class Project(Base):
     """
 
     __tablename__ = "project"
+    # user's projects, latest first
+    __table_args__ = (Index(None, "user_id", "created_on"),)
 
     id: Mapped[UUID] = mapped_column(
         init=False, primary_key=True, server_default=text("uuid_generate_v4()")
@@ -175,10 +188,17 @@ class Project(Base):
     archives: Mapped[list["Archive"]] = relationship(
         cascade="all, delete-orphan", order_by="desc(Archive.created_on)"
     )
+    uploads: Mapped[list["Upload"]] = relationship(
+        cascade="all, delete-orphan", init=False
+    )
 
-    @property
-    def used_space(self):
-        return sum([file.filesize for file in self.files])
+    # total size and number of its files, maintained as they're added/removed
+    used_space: Mapped[int] = mapped_column(
+        init=False, default=0, server_default=text("0")
+    )
+    file_count: Mapped[int] = mapped_column(
+        init=False, default=0, server_default=text("0")
+    )
 
 
 class File(Base):
@@ -189,6 +209,14 @@ class File(Base):
     """
 
     __tablename__ = "file"
+    __table_args__ = (
+        # project's files, in order
+        Index(None, "project_id", "order"),
+        # project's file at a WebDAV path
+        Index(None, "project_id", "path"),
+        # project's files of a content
+        Index(None, "project_id", "hash"),
+    )
 
     id: Mapped[UUID] = mapped_column(
         init=False, primary_key=True, server_default=text("uuid_generate_v4()")
@@ -206,10 +234,56 @@ class File(Base):
     type: Mapped[str]
     status: Mapped[str]
     order: Mapped[int] = mapped_column(server_default=text("1"))
+    # upload to Storage in progress (PROCESSING): by which worker and until when
+    leased_by: Mapped[str | None] = mapped_column(init=False, default=None)
+    lease_expire_on: Mapped[datetime | None] = mapped_column(init=False, default=None)
+
+    @property
+    def local_fpath(self):
+        return get_blob_fpath(self.hash)
+
+
+class Blob(Base):
+    """
+    Blob model, used for sharing content across Files.
+    A Blob is a content (by hash), stored once locally and in Storage
+    whatever the number of Files (of any project) referencing it.
+    It is removed once no File references it anymore.
+    """
+
+    __tablename__ = "blob"
+
+    hash: Mapped[str] = mapped_column(primary_key=True)
+    filesize: Mapped[int]
+    refcount: Mapped[int]
+    # latest expiry of referencing projects, for Storage autodelete
+    expire_on: Mapped[datetime | None]
+
+
+class Upload(Base):
+    """
+    Upload model, used for resumable uploads.
+    An Upload receives a File's content in chunks, into a transient partial file,
+    until it is finalized into a File.
+    """
+
+    __tablename__ = "upload"
+
+    id: Mapped[UUID] = mapped_column(
+        init=False, primary_key=True, server_default=text("uuid_generate_v4()")
+    )
+    project_id: Mapped[UUID] = mapped_column(ForeignKey("project.id"), init=False)
+
+    filename: Mapped[str]
+    filesize: Mapped[int]
+    offset: Mapped[int]
+    created_on: Mapped[datetime]
+    # removed if not resumed until then
+    expire_on: Mapped[datetime]
 
     @property
     def local_fpath(self):
-        return get_local_fpath_for(self.hash, self.project_id)
+        return get_local_fpath_for(f"upload-{self.id}", self.project_id)
 
 
 class Archive(Base):
@@ -220,6 +294,8 @@ class Archive(Base):
     """
 
     __tablename__ = "archive"
+    # project's archives, latest first
+    __table_args__ = (Index(None, "project_id", "created_on"),)
 
     id: Mapped[UUID] = mapped_column(
         init=False, primary_key=True, server_default=text("uuid_generate_v4()")
@@ -236,3 +312,5 @@ class Archive(Base):
     zimfarm_task_id: Mapped[UUID | None]
     email: Mapped[str | None]
     config: Mapped[ArchiveConfig]
+    # start of its latest submission (SUBMITTING)
+    submitted_on: Mapped[datetime | None] = mapped_column(init=False, default=None)
@@ -1,10 +1,25 @@
+import collections
 import datetime
 from uuid import UUID
 
-from sqlalchemy import func, select
+from sqlalchemy import (
+    ARRAY,
+    Integer,
+    String,
+    any_,
+    delete,
+    func,
+    literal,
+    select,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session as OrmSession
 
+from api.constants import constants
 from api.database import Session as DBSession
-from api.database.models import File, Project, User
+from api.database import get_blob_fpath
+from api.database.models import Blob, File, Project, User
 
 
 def get_file_by_id(file_id: UUID) -> File:
@@ -40,3 +55,127 @@ def ensure_user_with(id_: UUID) -> bool:
         user.id = id_
         session.add(user)
     return True
+
+
+def get_blob_by_hash(file_hash: str) -> Blob | None:
+    """Get Blob instance by its hash, if any."""
+    with DBSession.begin() as session:
+        blob = session.get(Blob, file_hash)
+        if blob:
+            session.expunge(blob)
+        return blob
+
+
+def reference_blob(
+    session: OrmSession,
+    *,
+    file_hash: str,
+    filesize: int,
+    expire_on: datetime.datetime | None,
+    count: int = 1,
+):
+    """Record count new Files referencing content, creating its Blob if needed
+
+    Blob's expiry is extended to expire_on if that's later"""
+    stmt = insert(Blob).values(
+        hash=file_hash, filesize=filesize, refcount=count, expire_on=expire_on
+    )
+    session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[Blob.hash],
+            set_={
+                "refcount": Blob.refcount + stmt.excluded.refcount,
+                "expire_on": func.greatest(Blob.expire_on, stmt.excluded.expire_on),
+            },
+        )
+    )
+
+
+def release_blobs(session: OrmSession, file_hashes: list[str]) -> list[str]:
+    """Record Files not referencing their content anymore, at once
+
+    Returns the contents (hashes) which lost their last reference. Their Blobs
+    are kept, unreferenced, for purge_blobs() to remove once this is committed.
+    Content without Blob (WebDAV-synced Files) has no other reference.
+    Hashes are passed as arrays, whatever their number"""
+    counts = collections.Counter(file_hashes)
+    released = (
+        func.unnest(
+            literal(list(counts.keys()), ARRAY(String)),
+            literal(list(counts.values()), ARRAY(Integer)),
+        )
+        .table_valued("hash", "nb_files")
+        .render_derived()
+    )
+    refcounts = dict(
+        session.execute(
+            update(Blob)
+            .filter(Blob.hash == released.c.hash)
+            .values(refcount=Blob.refcount - released.c.nb_files)
+            .returning(Blob.hash, Blob.refcount)
+        ).all()
+    )
+    return [file_hash for file_hash in counts if refcounts.get(file_hash, 0) <= 0]
+
+
+def purge_blobs(session: OrmSession, file_hashes: list[str]) -> list[str]:
+    """Remove unreferenced contents: their Blob and local copy
+
+    Returns the contents (hashes) removed. Blobs are locked meanwhile: one
+    referenced again (a File added) is kept, and a File being added waits
+    for its content to be removed before looking for a local copy"""
+    hashes = literal(list(set(file_hashes)), ARRAY(String))
+    refcounts = dict(
+        session.execute(
+            select(Blob.hash, Blob.refcount)
+            .filter(Blob.hash == any_(hashes))
+            .with_for_update()
+        ).all()
+    )
+    # content without Blob has no other reference, as in release_blobs()
+    purged = [
+        file_hash for file_hash in set(file_hashes) if refcounts.get(file_hash, 0) <= 0
+    ]
+    if refcounts.keys() & purged:
+        session.execute(
+            delete(Blob).filter(Blob.hash == any_(literal(purged, ARRAY(String))))
+        )
+    for file_hash in purged:
+        get_blob_fpath(file_hash).unlink(missing_ok=True)
+    return purged
+
+
+def reserve_project_space(
+    session: OrmSession, project_id: UUID, *, filesize: int, count: int = 1
+) -> bool:
+    """Record count new Files of filesize (in total) in Project, if within quota
+
+    Returns whether they were. Checked and recorded in a single conditional
+    UPDATE so concurrent additions can't exceed the quota together"""
+    return (
+        session.execute(
+            update(Project)
+            .filter_by(id=project_id)
+            .filter(Project.used_space + filesize <= constants.project_quota)
+            .values(
+                used_space=Project.used_space + filesize,
+                file_count=Project.file_count + count,
+            )
+            .returning(Project.id)
+        ).scalar()
+        is not None
+    )
+
+
+def adjust_project_space(
+    session: OrmSession, project_id: UUID, *, filesize: int, count: int = 0
+):
+    """Record Files' removal or resize (filesize and count being deltas)"""
+    session.execute(
+        update(Project)
+        .filter_by(id=project_id)
+        .values(
+            used_space=Project.used_space + filesize,
+            file_count=Project.file_count + count,
+        )
+    )
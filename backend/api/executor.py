@@ -0,0 +1,39 @@
+import functools
+from collections.abc import Callable
+from typing import Any, ParamSpec, TypeVar
+
+import anyio.to_process
+import anyio.to_thread
+from anyio import CapacityLimiter
+
+from api.constants import constants
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+
+@functools.cache
+def get_io_limiter() -> CapacityLimiter:
+    """Limiter bounding the nb of threads running blocking I/O"""
+    return CapacityLimiter(constants.io_workers)
+
+
+@functools.cache
+def get_cpu_limiter() -> CapacityLimiter:
+    """Limiter bounding the nb of processes running CPU-bound work"""
+    return CapacityLimiter(constants.cpu_workers)
+
+
+async def run_in_io_pool(func: Callable[P, T], *args: P.args, **kwargs: P.kwargs) -> T:
+    """Run blocking func (disk, network, DB) in the bounded thread pool"""
+    return await anyio.to_thread.run_sync(
+        functools.partial(func, *args, **kwargs), limiter=get_io_limiter()
+    )
+
+
+async def run_in_cpu_pool(func: Callable[..., T], *args: Any) -> T:
+    """Run CPU-bound func in the bounded process pool
+
+    func must be importable from a module not depending on the API's state
+    and args must be picklable"""
+    return await anyio.to_process.run_sync(func, *args, limiter=get_cpu_limiter())
@@ -1,11 +1,37 @@
 import hashlib
+import os
+import tempfile
 from collections.abc import Iterator
+from dataclasses import dataclass
 from pathlib import Path
 from typing import BinaryIO
 from uuid import UUID
 
+from zimscraperlib import filesystem
+
 from api.constants import constants
-from api.database import get_local_fpath_for
+from api.database import get_blob_fpath
+
+# nb of leading bytes used to guess a file's mimetype
+MIMETYPE_SNIFF_SIZE = 2048
+
+
+class FileTooLargeError(ValueError):
+    """Ingested file exceeded the allowed size"""
+
+
+@dataclass(kw_only=True)
+class IngestedFile:
+    """A file received in transient storage, not yet at its final location"""
+
+    fpath: Path
+    size: int
+    hash: str
+    mimetype: str
+
+    def discard(self):
+        """Remove the transient copy"""
+        self.fpath.unlink(missing_ok=True)
 
 
 def calculate_file_size(file: BinaryIO) -> int:
@@ -28,9 +54,9 @@ def read_file_in_chunks(
     reader.seek(0)
 
 
-def save_file(file: BinaryIO, file_name: str, project_id: UUID) -> Path:
-    """Saves a binary file to a specific location and returns its path."""
-    fpath = get_local_fpath_for(file_name, project_id)
+def save_file(file: BinaryIO, file_hash: str) -> Path:
+    """Saves a binary file to its blob location and returns its path."""
+    fpath = get_blob_fpath(file_hash)
     if not fpath.is_file():
         with open(fpath, "wb") as file_object:
             for chunk in read_file_in_chunks(file):
@@ -46,6 +72,63 @@ def generate_file_hash(file: BinaryIO) -> str:
     return hasher.hexdigest()
 
 
+class FileIngestor:
+    """Receives a file's content chunk by chunk, in a single pass
+
+    Size, mimetype and hash are computed while content is copied to a temporary
+    file in transient storage. Once finished, that file must either be moved into
+    place using save_ingested_file() or discarded.
+
+    write() raises FileTooLargeError as soon as more than max_size bytes are fed"""
+
+    def __init__(self, project_id: UUID, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+        self.head = b""
+        self.hasher = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(
+            prefix=f"{project_id}-",
+            suffix=".part",
+            dir=constants.transient_storage_path,
+        )
+        self.fpath = Path(temp_path)
+        self.file_object = open(fd, "wb")
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self.max_size:
+            raise FileTooLargeError(f"File exceeds {self.max_size} bytes")
+        if len(self.head) < MIMETYPE_SNIFF_SIZE:
+            self.head += chunk[: MIMETYPE_SNIFF_SIZE - len(self.head)]
+        self.hasher.update(chunk)
+        self.file_object.write(chunk)
+
+    def finish(self) -> IngestedFile:
+        self.file_object.close()
+        return IngestedFile(
+            fpath=self.fpath,
+            size=self.size,
+            hash=self.hasher.hexdigest(),
+            mimetype=filesystem.get_content_mimetype(self.head),
+        )
+
+    def abort(self):
+        self.file_object.close()
+        self.fpath.unlink(missing_ok=True)
+
+
+def save_ingested_file(ingested: IngestedFile) -> Path:
+    """Move an ingested file to its blob location and returns it
+
+    Content already held (for any project) is kept and ingested file discarded"""
+    fpath = get_blob_fpath(ingested.hash)
+    if fpath.is_file():
+        ingested.discard()
+    else:
+        os.replace(ingested.fpath, fpath)
+    return fpath
+
+
 def normalize_filename(filename: str) -> str:
     """filesystem (ext4,apfs,hfs+,ntfs,exfat) and S3 compliant filename"""
 
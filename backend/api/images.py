@@ -0,0 +1,21 @@
+import io
+
+import zimscraperlib.image
+
+
+def convert_image_to_png(data: bytes) -> bytes:
+    """PNG version of an image's bytes
+
+    Kept free of any api import so it can run in the CPU process pool"""
+    src, dst = io.BytesIO(data), io.BytesIO()
+    zimscraperlib.image.convert_image(
+        src, dst, fmt="PNG"  # pyright: ignore [reportGeneralTypeIssues]
+    )
+    return dst.getvalue()
+
+
+def resize_image_to(data: bytes, width: int, height: int) -> bytes:
+    """Image's bytes resized to cover width x height"""
+    image = io.BytesIO(data)
+    zimscraperlib.image.resize_image(image, width=width, height=height, method="cover")
+    return image.getvalue()
@@ -1,14 +1,16 @@
 from contextlib import asynccontextmanager
 from http import HTTPStatus
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import RedirectResponse
 
 from api import __description__, __titile__, __version__
 from api.constants import constants, determine_mandatory_environment_variables
+from api.database import async_engine, count_queries
 from api.database.utils import ensure_user_with
-from api.routes import archives, files, projects, users, utils
+from api.routes import archives, files, projects, uploads, users, utils
+from api.storage import async_storage
 
 
 @asynccontextmanager
@@ -18,7 +20,19 @@ async def lifespan(_: FastAPI):
     if constants.single_user_id:
         # make sure said user is present in DB (creates otherwise)
         ensure_user_with(id_=constants.single_user)
+
+    # connected to Storage (blocking) before requests use it
+    await async_storage.setup()
+
+    # periodic cleanup of uploads to storage
+    files.schedule_storage_sweep()
+    files.schedule_blob_sweep()
+    files.schedule_lease_watchdog()
+    uploads.schedule_upload_sweep()
+    archives.schedule_submission_watchdog()
     yield
+    await async_storage.aclose()
+    await async_engine.dispose()
 
 
 def create_app() -> FastAPI:
@@ -65,9 +79,21 @@ def create_app() -> FastAPI:
         allow_methods=["*"],
         allow_headers=["*"],
     )
+
+    @api.middleware("http")
+    async def add_query_count(request: Request, call_next):
+        """Number of SQL statements the request ran, in debug mode"""
+        if not constants.debug:
+            return await call_next(request)
+        with count_queries() as counter:
+            response = await call_next(request)
+        response.headers["X-Query-Count"] = str(counter.count)
+        return response
+
     api.include_router(utils.router)
     api.include_router(users.router)
     projects.router.include_router(files.router)
+    projects.router.include_router(uploads.router)
     projects.router.include_router(archives.router)
     api.include_router(projects.router)
     app.mount(constants.api_version_prefix, api)
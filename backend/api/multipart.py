@@ -0,0 +1,199 @@
+from collections.abc import AsyncGenerator, AsyncIterator
+from dataclasses import dataclass
+from uuid import UUID
+
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+
+from api.constants import constants
+from api.executor import run_in_io_pool
+from api.files import FileIngestor, FileTooLargeError, IngestedFile
+
+
+class MultipartError(ValueError):
+    """Request body is not a valid multipart/form-data one"""
+
+
+@dataclass(kw_only=True)
+class ReceivedFile:
+    """A file part of a multipart body
+
+    ingested is None if the file was too large (its content is then dropped)"""
+
+    filename: str
+    ingested: IngestedFile | None = None
+    too_large: bool = False
+
+
+def decode_option(value: bytes) -> str:
+    try:
+        return value.decode("utf-8")
+    except UnicodeDecodeError:
+        return value.decode("latin-1")
+
+
+class MultipartIngestor:
+    """Parses a multipart/form-data body as it is received
+
+    File parts of field_name are ingested straight into transient storage as
+    they arrive, instead of being spooled to a temporary file first (as does
+    UploadFile) and then copied: each byte is written to disk once.
+    Other parts are ignored."""
+
+    def __init__(
+        self,
+        content_type: str,
+        *,
+        project_id: UUID,
+        field_name: str,
+        max_size: int,
+        max_files: int = 1000,
+    ):
+        _, params = parse_options_header(content_type)
+        if b"boundary" not in params:
+            raise MultipartError("Missing boundary in multipart.")
+
+        self.project_id = project_id
+        self.field_name = field_name
+        self.max_size = max_size
+        self.max_files = max_files
+        # ends each part: buffered data is parsed as soon as it contains one
+        self.delimiter = b"\r\n--" + params[b"boundary"]
+        self.files: list[ReceivedFile] = []
+        # complete file parts, not handed over yet
+        self._received: list[ReceivedFile] = []
+
+        self._header_field = b""
+        self._header_value = b""
+        self._content_disposition = b""
+        self._current: ReceivedFile | None = None
+        self._ingestor: FileIngestor | None = None
+
+        self.parser = MultipartParser(
+            params[b"boundary"],
+            {
+                "on_part_begin": self.on_part_begin,
+                "on_part_data": self.on_part_data,
+                "on_part_end": self.on_part_end,
+                "on_header_field": self.on_header_field,
+                "on_header_value": self.on_header_value,
+                "on_header_end": self.on_header_end,
+                "on_headers_finished": self.on_headers_finished,
+            },
+        )
+
+    def on_part_begin(self):
+        self._content_disposition = b""
+        self._current = None
+        self._ingestor = None
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        if self._header_field.lower() == b"content-disposition":
+            self._content_disposition = self._header_value
+        self._header_field = self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._content_disposition)
+        if (
+            decode_option(options.get(b"name", b"")) != self.field_name
+            or b"filename" not in options
+        ):
+            return
+        if len(self.files) >= self.max_files:
+            raise MultipartError(f"Too many files (max {self.max_files}).")
+        self._current = ReceivedFile(filename=decode_option(options[b"filename"]))
+        self.files.append(self._current)
+        self._ingestor = FileIngestor(self.project_id, self.max_size)
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if not self._ingestor:
+            return
+        try:
+            self._ingestor.write(data[start:end])
+        except FileTooLargeError:
+            self._ingestor.abort()
+            self._ingestor = None
+            if self._current:
+                self._current.too_large = True
+
+    def on_part_end(self):
+        if not self._current:
+            return
+        if self._ingestor:
+            self._current.ingested = self._ingestor.finish()
+            self._ingestor = None
+        self._received.append(self._current)
+        self._current = None
+
+    def feed(self, data: bytes):
+        try:
+            self.parser.write(data)
+        except MultipartParseError as exc:
+            raise MultipartError(str(exc)) from exc
+
+    def discard(self):
+        """Remove everything ingested so far and not handed over"""
+        if self._ingestor:
+            self._ingestor.abort()
+            self._ingestor = None
+        for file in self._received:
+            if file.ingested:
+                file.ingested.discard()
+        self._received.clear()
+
+    def ends_part(self, buffer: bytearray, received: int) -> bool:
+        """Whether the last received bytes of buffer complete a part delimiter"""
+        return (
+            buffer.find(
+                self.delimiter, max(0, len(buffer) - received - len(self.delimiter))
+            )
+            >= 0
+        )
+
+    async def iter_parse(
+        self, stream: AsyncIterator[bytes]
+    ) -> AsyncGenerator[ReceivedFile, None]:
+        """Ingest file parts from the body stream, yielding each once complete
+
+        Parsing (and thus writing to disk) happens in the I/O pool,
+        on chunk_size batches of received data, or sooner when a part ends.
+        Yielded files are the caller's: on failure, only those not yielded
+        yet are discarded"""
+        buffer = bytearray()
+        try:
+            async for chunk in stream:
+                buffer += chunk
+                if len(buffer) >= constants.chunk_size or self.ends_part(
+                    buffer, len(chunk)
+                ):
+                    await run_in_io_pool(self.feed, bytes(buffer))
+                    buffer.clear()
+                    while self._received:
+                        yield self._received.pop(0)
+            await run_in_io_pool(self.feed, bytes(buffer))
+            if self._current:
+                raise MultipartError("Incomplete multipart body.")
+            while self._received:
+                yield self._received.pop(0)
+        except BaseException:
+            self.discard()
+            raise
+
+    async def parse(self, stream: AsyncIterator[bytes]) -> list[ReceivedFile]:
+        """Ingest file parts from the body stream, all of them"""
+        received: list[ReceivedFile] = []
+        try:
+            async for file in self.iter_parse(stream):
+                received.append(file)
+        except BaseException:
+            for file in received:
+                if file.ingested:
+                    file.ingested.discard()
+            raise
+        return received
@@ -1,66 +1,147 @@
 from http import HTTPStatus
-from typing import Annotated
+from typing import Annotated, Any
 from uuid import UUID
 
 from fastapi import Cookie, Depends, HTTPException, Response
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy import Select, and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import QueryableAttribute, joinedload
 
 from api.constants import constants
 from api.database import gen_session
-from api.database.models import Project, User
+from api.database.models import Archive, File, Project, Upload, User
 
 
-async def validated_user(
-    response: Response,
+def authenticated_user_id(
     user_id: Annotated[UUID | None, Cookie()] = None,
-    session: Session = Depends(gen_session),
-) -> User:
-    """Depends()-able User from request, ensuring it exists"""
+) -> UUID:
+    """Depends()-able User ID from request's cookie, ensuring it's present"""
     if not user_id:
         raise HTTPException(
             status_code=HTTPStatus.UNAUTHORIZED, detail="Missing User ID."
         )
+    return user_id
+
+
+def user_not_found(response: Response, user_id: UUID) -> HTTPException:
+    """Error for an unknown User, removing its cookie"""
+    # using delete_cookie to construct the cookie header
+    # but passing it to HTTPException as FastAPI middleware creates Response for it
+    response.delete_cookie(
+        key=constants.authentication_cookie_name,
+        domain=constants.cookie_domain,
+        secure=True,
+        httponly=True,
+    )
+    headers = {"set-cookie": response.headers["set-cookie"]}
+    return HTTPException(
+        status_code=HTTPStatus.UNAUTHORIZED,
+        detail=f"User Not Found, ID: {user_id}.",
+        headers=headers,
+    )
+
+
+async def validated_user(
+    response: Response,
+    user_id: UUID = Depends(authenticated_user_id),
+    session: AsyncSession = Depends(gen_session),
+) -> User:
+    """Depends()-able User from request, ensuring it exists"""
     stmt = select(User).filter_by(id=user_id)
-    user = session.execute(stmt).scalar()
+    user = (await session.execute(stmt)).scalar()
     if not user:
-        # using delete_cookie to construct the cookie header
-        # but passing it to HTTPException as FastAPI middleware creates Response for it
-        response.delete_cookie(
-            key=constants.authentication_cookie_name,
-            domain=constants.cookie_domain,
-            secure=True,
-            httponly=True,
+        raise user_not_found(response, user_id)
+    return user
+
+
+def select_project(
+    *,
+    user_id: UUID,
+    project_id: UUID,
+    item: tuple[type[File | Archive | Upload], UUID] | None = None,
+    load: QueryableAttribute[Any] | None = None,
+) -> Select[Any]:
+    """User and its Project (and item), outer-joined so each can be told missing"""
+    stmt = (
+        select(User, Project)
+        .outerjoin(Project, and_(Project.user_id == User.id, Project.id == project_id))
+        .filter(User.id == user_id)
+    )
+    if item:
+        model, item_id = item
+        stmt = stmt.add_columns(model).outerjoin(
+            model, and_(model.project_id == Project.id, model.id == item_id)
         )
-        headers = {"set-cookie": response.headers["set-cookie"]}
+    if load is not None:
+        stmt = stmt.options(joinedload(load))
+    return stmt
+
+
+async def fetch_project(
+    session: AsyncSession,
+    response: Response,
+    *,
+    user_id: UUID,
+    project_id: UUID,
+    item: tuple[type[File | Archive | Upload], UUID] | None = None,
+    load: QueryableAttribute[Any] | None = None,
+) -> tuple[Project, Any]:
+    """User's Project and one of its items, in a single query, ensuring they exist
+
+    Project is returned with its `load` relationship loaded, along with the
+    item (File, Archive or Upload) if requested, None otherwise"""
+    stmt = select_project(user_id=user_id, project_id=project_id, item=item, load=load)
+    row = (await session.execute(stmt)).unique().one_or_none()
+
+    if not row:
+        raise user_not_found(response, user_id)
+    if not row.Project:
+        raise HTTPException(HTTPStatus.NOT_FOUND, f"Project not found: {project_id}")
+    if item and not row[2]:
         raise HTTPException(
-            status_code=HTTPStatus.UNAUTHORIZED,
-            detail=f"User Not Found, ID: {user_id}.",
-            headers=headers,
+            HTTPStatus.NOT_FOUND, f"{item[0].__name__} not found: {item[1]}"
         )
-    return user
+    return row.Project, row[2] if item else None
 
 
 async def validated_project(
     project_id: UUID,
-    user: User = Depends(validated_user),
-    session: Session = Depends(gen_session),
+    response: Response,
+    user_id: UUID = Depends(authenticated_user_id),
+    session: AsyncSession = Depends(gen_session),
 ) -> Project:
     """Depends()-able Project from request, ensuring it exists"""
-    stmt = select(Project).filter_by(id=project_id).filter_by(user_id=user.id)
-    project = session.execute(stmt).scalar()
-    if not project:
-        raise HTTPException(HTTPStatus.NOT_FOUND, f"Project not found: {project_id}")
+    project, _ = await fetch_project(
+        session, response, user_id=user_id, project_id=project_id
+    )
     return project
 
 
-async def userless_validated_project(
+async def validated_project_with_files(
     project_id: UUID,
-    session: Session = Depends(gen_session),
+    response: Response,
+    user_id: UUID = Depends(authenticated_user_id),
+    session: AsyncSession = Depends(gen_session),
 ) -> Project:
-    """Depends()-able Project from request, ensuring it exists"""
-    stmt = select(Project).filter_by(id=project_id)
-    project = session.execute(stmt).scalar()
-    if not project:
-        raise HTTPException(HTTPStatus.NOT_FOUND, f"Project not found: {project_id}")
+    """Depends()-able Project from request, its Files loaded, ensuring it exists"""
+    project, _ = await fetch_project(
+        session, response, user_id=user_id, project_id=project_id, load=Project.files
+    )
+    return project
+
+
+async def validated_project_with_archives(
+    project_id: UUID,
+    response: Response,
+    user_id: UUID = Depends(authenticated_user_id),
+    session: AsyncSession = Depends(gen_session),
+) -> Project:
+    """Depends()-able Project from request, its Archives loaded, ensuring it exists"""
+    project, _ = await fetch_project(
+        session,
+        response,
+        user_id=user_id,
+        project_id=project_id,
+        load=Project.archives,
+    )
     return project
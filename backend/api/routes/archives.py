@@ -2,35 +2,56 @@ import base64
 import datetime
 import io
 import json
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
 from http import HTTPStatus
 from typing import Any, BinaryIO
 from uuid import UUID
 
 import dateutil.parser
-import zimscraperlib.image
-from fastapi import APIRouter, Depends, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, Response, UploadFile
 from pydantic import BaseModel, ConfigDict, TypeAdapter
-from sqlalchemy import select, update
-from sqlalchemy.orm import Session
+from rq import get_current_job
+from rq.exceptions import NoSuchJobError
+from rq.job import Job
+from sqlalchemy import and_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql.base import Executable as ExecutableStatement
 from zimscraperlib import filesystem
 
 from api.constants import constants, logger
+from api.database import AsyncSession as AsyncDBSession
+from api.database import Session as DBSession
 from api.database import gen_session
 from api.database.models import Archive, ArchiveConfig, ArchiveStatus, Project
 from api.email import get_context, jinja_env, send_email_via_mailgun
-from api.files import (
-    calculate_file_size,
-    generate_file_hash,
-    normalize_filename,
-    read_file_in_chunks,
+from api.executor import run_in_cpu_pool, run_in_io_pool
+from api.files import calculate_file_size, generate_file_hash, normalize_filename
+from api.images import convert_image_to_png, resize_image_to
+from api.routes import (
+    authenticated_user_id,
+    fetch_project,
+    validated_project_with_archives,
+)
+from api.routes.files import schedule_periodic
+from api.storage import async_storage, storage
+from api.store import archives_queue, redis_conn
+from api.zimfarm import (
+    RequestSchema,
+    WebhookPayload,
+    create_schedule,
+    delete_schedules,
+    request_task,
+    request_tasks,
 )
-from api.routes import userless_validated_project, validated_project
-from api.storage import storage
-from api.zimfarm import RequestSchema, WebhookPayload, request_task
 
 router = APIRouter()
 
+# Redis list of archives (PendingZimfarmRequest) to request in next batch
+ZIMFARM_BATCH_KEY = "zimfarm-batch"
+# Redis list of those taken by batch jobs, until requested (or reverted)
+ZIMFARM_BATCH_PROCESSING_KEY = "zimfarm-batch-processing"
+
 
 class ArchiveConfigRequest(BaseModel):
     email: str | None
@@ -59,35 +80,83 @@ class ArchiveModel(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
-def validated_archive(
+class SubmissionStep(str, Enum):
+    # illustration, main logo and collection.json uploaded to Storage
+    companion_files = "companion_files"
+    # awaiting to be requested to Zimfarm along with others
+    zimfarm_batch = "zimfarm_batch"
+    zimfarm = "zimfarm"
+    done = "done"
+
+
+class ArchiveSubmissionModel(BaseModel):
+    # submission job's status: queued, started, finished, failed, scheduled (retry)
+    status: str
+    # step started last (or done)
+    step: SubmissionStep | None
+    retries_left: int | None
+
+
+class PendingZimfarmRequest(BaseModel):
+    """Archive with its files in Storage, to be requested to Zimfarm"""
+
+    archive_id: UUID
+    project_id: UUID
+    email: str | None
+    request_def: RequestSchema
+    collection_json_path: str
+    # temporarily recording Archive filesize as the sum of its content
+    filesize: int
+
+
+async def validated_project_archive(
+    project_id: UUID,
     archive_id: UUID,
-    project: Project = Depends(validated_project),
-    session: Session = Depends(gen_session),
+    response: Response,
+    user_id: UUID = Depends(authenticated_user_id),
+    session: AsyncSession = Depends(gen_session),
+) -> tuple[Project, Archive]:
+    """Depends()-able archive and its project from request, ensuring they exist"""
+    return await fetch_project(
+        session,
+        response,
+        user_id=user_id,
+        project_id=project_id,
+        item=(Archive, archive_id),
+    )
+
+
+async def validated_archive(
+    project_archive: tuple[Project, Archive] = Depends(validated_project_archive),
 ) -> Archive:
     """Depends()-able archive from request, ensuring it exists"""
-    stmt = select(Archive).filter_by(id=archive_id).filter_by(project_id=project.id)
-    archive = session.execute(stmt).scalar()
-    if not archive:
-        raise HTTPException(HTTPStatus.NOT_FOUND, f"Archive not found: {archive_id}")
-    return archive
+    return project_archive[1]
 
 
-def userless_validated_archive(
+async def userless_validated_archive(
+    project_id: UUID,
     archive_id: UUID,
-    project: Project = Depends(userless_validated_project),
-    session: Session = Depends(gen_session),
+    session: AsyncSession = Depends(gen_session),
 ) -> Archive:
-    """Depends()-able archive from request, ensuring it exists"""
-    stmt = select(Archive).filter_by(id=archive_id).filter_by(project_id=project.id)
-    archive = session.execute(stmt).scalar()
-    if not archive:
+    """Depends()-able archive from request, ensuring it (and its project) exists"""
+    stmt = (
+        select(Project, Archive)
+        .outerjoin(
+            Archive, and_(Archive.project_id == Project.id, Archive.id == archive_id)
+        )
+        .filter(Project.id == project_id)
+    )
+    row = (await session.execute(stmt)).one_or_none()
+    if not row:
+        raise HTTPException(HTTPStatus.NOT_FOUND, f"Project not found: {project_id}")
+    if not row.Archive:
         raise HTTPException(HTTPStatus.NOT_FOUND, f"Archive not found: {archive_id}")
-    return archive
+    return row.Archive
 
 
 @router.get("/{project_id}/archives", response_model=list[ArchiveModel])
 async def get_all_archives(
-    project: Project = Depends(validated_project),
+    project: Project = Depends(validated_project_with_archives),
 ) -> list[ArchiveModel]:
     """Get all archives of a project"""
     return TypeAdapter(list[ArchiveModel]).validate_python(project.archives)
@@ -106,7 +175,7 @@ async def get_archive(archive: Archive = Depends(validated_archive)) -> ArchiveM
 async def update_archive(
     archive_request: ArchiveConfigRequest,
     archive: Archive = Depends(validated_archive),
-    session: Session = Depends(gen_session),
+    session: AsyncSession = Depends(gen_session),
 ):
     """Update a metadata of a archive"""
     archive_request.config.filename = normalize_filename(
@@ -120,7 +189,7 @@ async def update_archive(
             config=archive_request.config,
         )
     )
-    session.execute(stmt)
+    await session.execute(stmt)
 
 
 def validate_illustration_image(upload_file: UploadFile):
@@ -213,19 +282,14 @@ def validate_main_logo_image(upload_file: UploadFile):
 async def upload_illustration(
     uploaded_illustration: UploadFile,
     archive: Archive = Depends(validated_archive),
-    session: Session = Depends(gen_session),
+    session: AsyncSession = Depends(gen_session),
 ):
     """Upload an illustration of a archive."""
-    validate_illustration_image(uploaded_illustration)
+    await run_in_io_pool(validate_illustration_image, uploaded_illustration)
 
-    src = io.BytesIO()
-    for chunk in read_file_in_chunks(uploaded_illustration.file):
-        src.write(chunk)
-    dst = io.BytesIO()
+    src = await uploaded_illustration.read()
     try:
-        zimscraperlib.image.convert_image(
-            src, dst, fmt="PNG"  # pyright: ignore [reportGeneralTypeIssues]
-        )
+        png = await run_in_cpu_pool(convert_image_to_png, src)
     except Exception as exc:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
@@ -233,16 +297,16 @@ async def upload_illustration(
         ) from exc
 
     try:
-        zimscraperlib.image.resize_image(dst, width=48, height=48, method="cover")
+        illustration = await run_in_cpu_pool(resize_image_to, png, 48, 48)
     except Exception as exc:
         raise HTTPException(
             status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
             detail="Illustration cannot be resized",
         ) from exc
     else:
-        archive.config.illustration = base64.b64encode(dst.getvalue()).decode("utf-8")
+        archive.config.illustration = base64.b64encode(illustration).decode("utf-8")
         stmt = update(Archive).filter_by(id=archive.id).values(config=archive.config)
-        session.execute(stmt)
+        await session.execute(stmt)
 
 
 @router.post(
@@ -252,28 +316,23 @@ async def upload_illustration(
 async def upload_main_logo(
     uploaded_logo: UploadFile,
     archive: Archive = Depends(validated_archive),
-    session: Session = Depends(gen_session),
+    session: AsyncSession = Depends(gen_session),
 ):
     """Upload an illustration of a archive."""
-    validate_main_logo_image(uploaded_logo)
+    await run_in_io_pool(validate_main_logo_image, uploaded_logo)
 
-    src = io.BytesIO()
-    for chunk in read_file_in_chunks(uploaded_logo.file):
-        src.write(chunk)
-    dst = io.BytesIO()
+    src = await uploaded_logo.read()
     try:
-        zimscraperlib.image.convert_image(
-            src, dst, fmt="PNG"  # pyright: ignore [reportGeneralTypeIssues]
-        )
+        main_logo = await run_in_cpu_pool(convert_image_to_png, src)
     except Exception as exc:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
             detail="Illustration cannot be converted to PNG",
         ) from exc
 
-    archive.config.main_logo = base64.b64encode(dst.getvalue()).decode("utf-8")
+    archive.config.main_logo = base64.b64encode(main_logo).decode("utf-8")
     stmt = update(Archive).filter_by(id=archive.id).values(config=archive.config)
-    session.execute(stmt)
+    await session.execute(stmt)
 
 
 def gen_collection_for(project: Project) -> tuple[list[dict[str, Any]], BinaryIO, str]:
@@ -304,10 +363,27 @@ def gen_collection_for(project: Project) -> tuple[list[dict[str, Any]], BinaryIO
     return collection, file, digest
 
 
-def upload_file_to_storage(project: Project, file: BinaryIO, storage_path: str):
+async def upload_file_to_storage(project: Project, file: BinaryIO, storage_path: str):
+
+    try:
+        # only in single-user mode are users allowed to overwrite
+        if not constants.single_user_id and await async_storage.has(storage_path):
+            logger.debug(f"Object `{storage_path}` already in Storage… weird but OK")
+            return
+        logger.debug(f"Uploading file to `{storage_path}`")
+        await async_storage.upload_fileobj(fileobj=file, path=storage_path)
+        logger.debug(f"Setting autodelete to `{project.expire_on}`")
+        await async_storage.set_autodelete_on(storage_path, project.expire_on)
+    except Exception as exc:
+        logger.error(f"File failed to upload to Storage `{storage_path}`: {exc}")
+        raise exc
+
 
+def upload_companion_to_storage(project: Project, file: BinaryIO, storage_path: str):
+    """Upload an archive's companion file (from a job), as upload_file_to_storage"""
     try:
         # only in single-user mode are users allowed to overwrite
+        # (objects are retention-locked by their autodelete)
         if not constants.single_user_id and storage.has(storage_path):
             logger.debug(f"Object `{storage_path}` already in Storage… weird but OK")
             return
@@ -320,19 +396,323 @@ def upload_file_to_storage(project: Project, file: BinaryIO, storage_path: str):
         raise exc
 
 
+def upload_companions_to_storage(
+    project: Project, companions: dict[str, bytes]
+) -> dict[str, str]:
+    """Upload an archive's companion files (content by suffix) concurrently
+
+    Returns their Storage path by suffix"""
+    paths = {
+        suffix: storage.get_companion_file_path(
+            project=project,
+            file_hash=generate_file_hash(io.BytesIO(content)),
+            suffix=suffix,
+        )
+        for suffix, content in companions.items()
+    }
+
+    with ThreadPoolExecutor(
+        max_workers=len(companions), thread_name_prefix="companion"
+    ) as executor:
+        futures = [
+            executor.submit(
+                upload_companion_to_storage,
+                project=project,
+                file=io.BytesIO(content),
+                storage_path=paths[suffix],
+            )
+            for suffix, content in companions.items()
+        ]
+    for future in futures:
+        future.result()
+    return paths
+
+
+def get_submission_job_id(archive_id: UUID | str) -> str:
+    return f"submit-archive-{archive_id}"
+
+
+def submit_archive(archive_id: UUID | str):
+    """Upload SUBMITTING archive's companion files then request its ZIM to Zimfarm
+
+    Current step is recorded in job's meta, for the submission to be followed.
+    Archive is back to PENDING (so it can be requested again) if its last try
+    fails"""
+    current_job = get_current_job()
+
+    def record_step(step: SubmissionStep):
+        logger.debug(f"Submitting archive {archive_id}: {step.value}")
+        if current_job:
+            current_job.meta["step"] = step.value
+            current_job.save_meta()
+
+    with DBSession.begin() as session:
+        archive = session.execute(select(Archive).filter_by(id=archive_id)).scalar()
+        if not archive or archive.status != ArchiveStatus.SUBMITTING:
+            logger.warning(f"Archive {archive_id} is not being submitted, skipping")
+            return
+        project = session.execute(
+            select(Project).filter_by(id=archive.project_id)
+        ).scalar_one()
+        # gen collection and stream
+        _, collection_file, _ = gen_collection_for(project=project)
+        # temporarily recording Archive filesize as the sum of its content
+        # actual ZIM size will be updated upon completion
+        archive_files_size = project.used_space
+        session.expunge_all()
+
+    try:
+        record_step(SubmissionStep.companion_files)
+        companions = {
+            "illustration.png": base64.b64decode(archive.config.illustration),
+            "collection.json": collection_file.read(),
+        }
+        if archive.config.main_logo:
+            companions["main-logo.png"] = base64.b64decode(archive.config.main_logo)
+        paths = upload_companions_to_storage(project=project, companions=companions)
+        illus_key = paths["illustration.png"]
+        collection_key = paths["collection.json"]
+
+        # Everything's on Storage, prepare and submit a ZF request
+        request_def = RequestSchema(
+            collection_url=f"{storage.public_url}/{collection_key}",
+            name=archive.config.name,
+            title=archive.config.title,
+            description=archive.config.description,
+            long_description=None,
+            language=archive.config.languages,
+            creator=archive.config.creator,
+            publisher=archive.config.publisher,
+            tags=archive.config.tags,
+            main_logo_url=(
+                f"{storage.public_url}/{paths['main-logo.png']}"
+                if archive.config.main_logo
+                else ""
+            ),
+            illustration_url=f"{storage.public_url}/{illus_key}",
+        )
+        pending = PendingZimfarmRequest(
+            archive_id=archive.id,
+            project_id=project.id,
+            email=archive.email,
+            request_def=request_def,
+            collection_json_path=collection_key,
+            filesize=archive_files_size,
+        )
+        if constants.zimfarm_batch_window:
+            record_step(SubmissionStep.zimfarm_batch)
+            add_to_zimfarm_batch(pending)
+            return
+        record_step(SubmissionStep.zimfarm)
+        task_id = request_task(
+            project_id=project.id,
+            archive_id=archive.id,
+            request_def=request_def,
+            email=archive.email,
+        )
+    except Exception as exc:
+        logger.error(f"Failed to submit archive {archive_id}: {exc}")
+        if not current_job or not current_job.retries_left:
+            revert_archive_to_pending(archive.id)
+        raise exc
+
+    mark_archive_requested(pending, task_id=task_id)
+    record_step(SubmissionStep.done)
+
+
+def mark_archive_requested(pending: PendingZimfarmRequest, *, task_id: UUID):
+    """request new status in DB (requested with the ZF ID)"""
+    with DBSession.begin() as session:
+        session.execute(
+            update(Archive)
+            .filter_by(id=pending.archive_id, status=ArchiveStatus.SUBMITTING)
+            .values(
+                filesize=pending.filesize,
+                requested_on=datetime.datetime.now(tz=datetime.UTC),
+                collection_json_path=pending.collection_json_path,
+                status=ArchiveStatus.REQUESTED,
+                zimfarm_task_id=task_id,
+            )
+        )
+
+
+def revert_archive_to_pending(archive_id: UUID):
+    """Failed submission: archive can be requested again"""
+    with DBSession.begin() as session:
+        session.execute(
+            update(Archive)
+            .filter_by(id=archive_id, status=ArchiveStatus.SUBMITTING)
+            .values(status=ArchiveStatus.PENDING)
+        )
+
+
+def add_to_zimfarm_batch(pending: PendingZimfarmRequest):
+    """Add archive to those requested to Zimfarm at the end of current window"""
+    redis_conn.rpush(ZIMFARM_BATCH_KEY, pending.model_dump_json())
+    seconds = constants.zimfarm_batch_window.total_seconds()
+    slot = int(datetime.datetime.now(tz=datetime.UTC).timestamp() // seconds) + 1
+    # Job ID is that of the window so it's scheduled once whatever the archives
+    archives_queue.enqueue_at(
+        datetime.datetime.fromtimestamp(slot * seconds, tz=datetime.UTC),
+        submit_zimfarm_batch,
+        job_id=f"submit_zimfarm_batch-{slot}",
+        retry=constants.job_retry,
+    )
+
+
+def take_zimfarm_batch() -> dict[bytes, PendingZimfarmRequest]:
+    """Next archives to request, moved (not popped) to the processing list
+
+    So that a job dying before they're requested doesn't lose them.
+    Archives not SUBMITTING anymore (reverted meanwhile) are dropped"""
+    pipeline = redis_conn.pipeline()
+    for _ in range(constants.zimfarm_batch_size):
+        pipeline.lmove(ZIMFARM_BATCH_KEY, ZIMFARM_BATCH_PROCESSING_KEY)
+    batch = {
+        item: PendingZimfarmRequest.model_validate_json(item)
+        for item in pipeline.execute()
+        if item
+    }
+    if not batch:
+        return batch
+    with DBSession.begin() as session:
+        submitting = set(
+            session.execute(
+                select(Archive.id)
+                .filter(
+                    Archive.id.in_([pending.archive_id for pending in batch.values()])
+                )
+                .filter_by(status=ArchiveStatus.SUBMITTING)
+            ).scalars()
+        )
+    skipped = [
+        item for item, pending in batch.items() if pending.archive_id not in submitting
+    ]
+    if skipped:
+        logger.warning(f"Skipping {len(skipped)} archives not being submitted anymore")
+        release_from_zimfarm_batch(skipped)
+    return {item: batch[item] for item in batch if item not in skipped}
+
+
+def release_from_zimfarm_batch(items: list[bytes], *, requeue: bool = False):
+    """Remove items from the processing list, back in batch if requeue"""
+    pipeline = redis_conn.pipeline()
+    for item in items:
+        pipeline.lrem(ZIMFARM_BATCH_PROCESSING_KEY, 1, item)
+    if requeue:
+        pipeline.rpush(ZIMFARM_BATCH_KEY, *items)
+    pipeline.execute()
+
+
+def submit_zimfarm_batch():
+    """Request Zimfarm tasks of archives in batch, in a single call
+
+    Each archive has its schedule created; tasks of all are then requested
+    at once and their IDs recorded to respective archives"""
+    current_job = get_current_job()
+    batch = take_zimfarm_batch()
+    if not batch:
+        return
+    if redis_conn.llen(ZIMFARM_BATCH_KEY):
+        # more than a batch in that window
+        archives_queue.enqueue(submit_zimfarm_batch, retry=constants.job_retry)
+
+    item_by_schedule: dict[str, bytes] = {}
+    for item, pending in batch.items():
+        try:
+            schedule_name = create_schedule(
+                project_id=pending.project_id,
+                archive_id=pending.archive_id,
+                request_def=pending.request_def,
+                email=pending.email,
+            )
+        except Exception as exc:
+            logger.error(f"Failed to submit archive {pending.archive_id}: {exc}")
+            revert_archive_to_pending(pending.archive_id)
+            release_from_zimfarm_batch([item])
+        else:
+            item_by_schedule[schedule_name] = item
+    if not item_by_schedule:
+        return
+
+    try:
+        task_ids = request_tasks(list(item_by_schedule))
+    except Exception as exc:
+        logger.error(f"Failed to request batch of {len(item_by_schedule)}: {exc}")
+        if current_job and current_job.retries_left:
+            # back in batch, for the retry (or next batch) to request them
+            release_from_zimfarm_batch(list(item_by_schedule.values()), requeue=True)
+        else:
+            for item in item_by_schedule.values():
+                revert_archive_to_pending(batch[item].archive_id)
+            release_from_zimfarm_batch(list(item_by_schedule.values()))
+        raise exc
+    finally:
+        # remove newly created schedules (not needed anymore)
+        delete_schedules(list(item_by_schedule))
+
+    for schedule_name, item in item_by_schedule.items():
+        pending = batch[item]
+        if task_id := task_ids.get(schedule_name):
+            mark_archive_requested(pending, task_id=task_id)
+        else:
+            logger.error(f"No task requested for archive {pending.archive_id}")
+            revert_archive_to_pending(pending.archive_id)
+    release_from_zimfarm_batch(list(item_by_schedule.values()))
+
+
+def revert_stuck_submissions():
+    """Watchdog reverting archives SUBMITTING past deadline, rescheduling itself
+
+    Their submission died without reverting them (as a batch job killed once
+    it took them): they're PENDING again, to be requested anew"""
+    now = datetime.datetime.now(tz=datetime.UTC)
+    try:
+        with DBSession.begin() as session:
+            stuck = set(
+                session.execute(
+                    update(Archive)
+                    .filter_by(status=ArchiveStatus.SUBMITTING)
+                    .filter(
+                        Archive.submitted_on
+                        < now - constants.archive_submission_deadline
+                    )
+                    .values(status=ArchiveStatus.PENDING)
+                    .returning(Archive.id)
+                ).scalars()
+            )
+        if not stuck:
+            return
+        logger.warning(f"Reverting {len(stuck)} archives stuck in submission")
+        # not to be requested by a later batch
+        pipeline = redis_conn.pipeline()
+        for key in (ZIMFARM_BATCH_KEY, ZIMFARM_BATCH_PROCESSING_KEY):
+            for item in redis_conn.lrange(key, 0, -1):
+                if PendingZimfarmRequest.model_validate_json(item).archive_id in stuck:
+                    pipeline.lrem(key, 1, item)
+        pipeline.execute()
+    finally:
+        schedule_submission_watchdog()
+
+
+def schedule_submission_watchdog():
+    schedule_periodic(revert_stuck_submissions, constants.archive_submission_deadline)
+
+
 @router.post(
-    "/{project_id}/archives/{archive_id}/request", status_code=HTTPStatus.CREATED
+    "/{project_id}/archives/{archive_id}/request",
+    status_code=HTTPStatus.ACCEPTED,
+    response_model=ArchiveModel,
 )
 async def request_archive(
     archive_request: ArchiveRequest,
-    archive: Archive = Depends(validated_archive),
-    project: Project = Depends(validated_project),
-    session: Session = Depends(gen_session),
-):
-    # update archive email
-    stmt = update(Archive).filter_by(id=archive.id).values(email=archive_request.email)
-    session.execute(stmt)
+    project_archive: tuple[Project, Archive] = Depends(validated_project_archive),
+) -> ArchiveModel:
+    """Request a ZIM of the archive, submitted in background
 
+    Archive is SUBMITTING until it's REQUESTED to Zimfarm, which can be followed
+    via GET on this endpoint"""
+    project, archive = project_archive
     if archive.status != ArchiveStatus.PENDING:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
@@ -352,89 +732,70 @@ async def request_archive(
             detail="Project is not ready (no archive or no files)",
         )
 
-    # upload illustration
-    illustration = io.BytesIO(base64.b64decode(archive.config.illustration))
-    illus_key = storage.get_companion_file_path(
-        project=project,
-        file_hash=generate_file_hash(illustration),
-        suffix="illustration.png",
-    )
-    illustration.seek(0)
-    # upload it to Storage
-    upload_file_to_storage(project=project, file=illustration, storage_path=illus_key)
-
-    # upload main-logo
-    if archive.config.main_logo:
-        main_logo = io.BytesIO(base64.b64decode(archive.config.main_logo))
-        main_logo_key = storage.get_companion_file_path(
-            project=project,
-            file_hash=generate_file_hash(main_logo),
-            suffix="main-logo.png",
-        )
-        main_logo.seek(0)
-        # upload it to Storage
-        upload_file_to_storage(
-            project=project, file=main_logo, storage_path=main_logo_key
-        )
+    # committed before the job is enqueued, so it finds the archive SUBMITTING
+    async with AsyncDBSession.begin() as session:
+        submitting = (
+            await session.execute(
+                update(Archive)
+                .filter_by(id=archive.id, status=ArchiveStatus.PENDING)
+                .values(
+                    email=archive_request.email,
+                    status=ArchiveStatus.SUBMITTING,
+                    submitted_on=datetime.datetime.now(tz=datetime.UTC),
+                )
+                .returning(Archive)
+            )
+        ).scalar()
+        if not submitting:
+            # requested concurrently
+            raise HTTPException(
+                status_code=HTTPStatus.BAD_REQUEST,
+                detail="Non-pending archive cannot be requested",
+            )
+        response = ArchiveModel.model_validate(submitting)
 
-    # gen collection and stream
-    collection, collection_file, collection_hash = gen_collection_for(project=project)
-    collection_key = storage.get_companion_file_path(
-        project=project, file_hash=collection_hash, suffix="collection.json"
+    archives_queue.enqueue(
+        submit_archive,
+        str(archive.id),
+        job_id=get_submission_job_id(archive.id),
+        retry=constants.job_retry,
     )
+    return response
 
-    # upload it to Storage
-    upload_file_to_storage(
-        project=project, file=collection_file, storage_path=collection_key
-    )
 
-    # Everything's on Storage, prepare and submit a ZF request
-    request_def = RequestSchema(
-        collection_url=f"{storage.public_url}/{collection_key}",
-        name=archive.config.name,
-        title=archive.config.title,
-        description=archive.config.description,
-        long_description=None,
-        language=archive.config.languages,
-        creator=archive.config.creator,
-        publisher=archive.config.publisher,
-        tags=archive.config.tags,
-        main_logo_url=(
-            f"{storage.public_url}/{main_logo_key}" if archive.config.main_logo else ""
-        ),
-        illustration_url=f"{storage.public_url}/{illus_key}",
-    )
-    task_id = request_task(
-        project_id=project.id,
-        archive_id=archive.id,
-        request_def=request_def,
-        email=archive.email,
+def get_submission(archive_id: UUID) -> ArchiveSubmissionModel | None:
+    try:
+        job = Job.fetch(get_submission_job_id(archive_id), connection=redis_conn)
+    except NoSuchJobError:
+        return None
+    return ArchiveSubmissionModel(
+        status=job.get_status(refresh=False),
+        step=job.meta.get("step"),
+        retries_left=job.retries_left,
     )
 
-    # temporarily recording Archive filesize as the sum of its content
-    # actual ZIM size will be updated upon completion
-    archive_files_size = sum([file.filesize for file in project.files])
 
-    # request new statis in DB (requested with the ZF ID)
-    stmt = (
-        update(Archive)
-        .filter_by(id=archive.id)
-        .values(
-            filesize=archive_files_size,
-            requested_on=datetime.datetime.now(tz=datetime.UTC),
-            collection_json_path=collection_key,
-            status=ArchiveStatus.REQUESTED,
-            zimfarm_task_id=task_id,
+@router.get(
+    "/{project_id}/archives/{archive_id}/request",
+    response_model=ArchiveSubmissionModel,
+)
+async def get_archive_submission(
+    archive: Archive = Depends(validated_archive),
+) -> ArchiveSubmissionModel:
+    """Progress of the archive's (latest) submission to Zimfarm"""
+    submission = await run_in_io_pool(get_submission, archive.id)
+    if not submission:
+        raise HTTPException(
+            HTTPStatus.NOT_FOUND, f"No submission found for archive: {archive.id}"
         )
-    )
-    session.execute(stmt)
+    return submission
 
 
 @router.post("/{project_id}/archives/{archive_id}/hook", status_code=HTTPStatus.CREATED)
 async def record_task_feedback(
     payload: WebhookPayload,
     archive: Archive = Depends(userless_validated_archive),
-    session: Session = Depends(gen_session),
+    session: AsyncSession = Depends(gen_session),
     token: str = "",
     target: str = "",
 ):
@@ -489,7 +850,7 @@ async def record_task_feedback(
         )
     if stmt is not None:
         try:
-            session.execute(stmt)
+            await session.execute(stmt)
         except Exception as exc:
             logger.error(
                 "Failed to update Archive with FAILED status {archive.id}: {exc!s}"
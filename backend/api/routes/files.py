@@ -1,26 +1,80 @@
 import datetime
+import mimetypes
+import os
+import socket
+import threading
+from collections.abc import AsyncGenerator, Callable, Collection, Generator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from enum import Enum
 from http import HTTPStatus
+from pathlib import Path
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile
-from pydantic import BaseModel, ConfigDict, TypeAdapter
-from sqlalchemy import func, select, update
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
+from rq import Queue, get_current_job
+from sqlalchemy import ColumnElement, Select, and_, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from zimscraperlib import filesystem
+from starlette.requests import ClientDisconnect
+from starlette.types import Receive, Scope, Send
 
 from api.constants import constants, logger
 from api.database import Session as DBSession
-from api.database import gen_session
-from api.database.models import File, Project
-from api.database.utils import get_file_by_id, get_project_by_id
-from api.files import calculate_file_size, generate_file_hash, save_file
-from api.routes import validated_project
+from api.database import gen_session, get_blob_fpath
+from api.database.models import Blob, File, Project
+from api.database.utils import (
+    adjust_project_space,
+    get_blob_by_hash,
+    get_file_by_id,
+    get_project_by_id,
+    purge_blobs,
+    reference_blob,
+    release_blobs,
+    reserve_project_space,
+)
+from api.executor import run_in_io_pool
+from api.files import IngestedFile, save_ingested_file
+from api.multipart import MultipartError, MultipartIngestor, ReceivedFile
+from api.routes import (
+    authenticated_user_id,
+    fetch_project,
+    validated_project,
+    validated_project_with_files,
+)
 from api.storage import storage
-from api.store import task_queue
+from api.store import (
+    deletions_queue,
+    get_uploads_queue_for,
+    held_lock,
+    maintenance_queue,
+    redis_conn,
+    uploads_queue,
+)
 
 router = APIRouter()
 
+# OpenAPI description of the multipart body, which is parsed by hand
+UPLOADED_FILE_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["uploaded_file"],
+                    "properties": {
+                        "uploaded_file": {"type": "string", "format": "binary"}
+                    },
+                }
+            }
+        },
+    }
+}
+
 
 class FileMetadataUpdateRequest(BaseModel):
     filename: str
@@ -54,57 +108,124 @@ class FileStatus(str, Enum):
     PROCESSING = "PROCESSING"
 
 
-def validated_file(
+async def validated_file(
+    project_id: UUID,
     file_id: UUID,
-    project: Project = Depends(validated_project),
-    session: Session = Depends(gen_session),
+    response: Response,
+    user_id: UUID = Depends(authenticated_user_id),
+    session: AsyncSession = Depends(gen_session),
 ) -> File:
-    """Depends()-able file from request, ensuring it exists"""
-    stmt = select(File).filter_by(id=file_id).filter_by(project_id=project.id)
-    file = session.execute(stmt).scalar()
-    if not file:
-        raise HTTPException(HTTPStatus.NOT_FOUND, f"File not found: {file_id}")
+    """Depends()-able file from request, ensuring it (and its project) exists"""
+    _, file = await fetch_project(
+        session,
+        response,
+        user_id=user_id,
+        project_id=project_id,
+        item=(File, file_id),
+    )
     return file
 
 
-def validate_uploaded_file(upload_file: UploadFile):
+def validate_uploaded_file(received: ReceivedFile) -> IngestedFile:
     """
-    Validates the uploaded file to ensure it meets the requirements.
+    Ensures a file received in a multipart body meets the requirements.
 
     Args:
-        upload_file (UploadFile): The uploaded file object.
+        received (ReceivedFile): The file part, already ingested.
 
     Returns:
-        tuple: A tuple containing filename, size, and mimetype of the file.
+        IngestedFile: the file, in transient storage, with its size, mimetype and hash
 
     Raises:
-        HTTPException: If the filename is invalid, the file is empty.
+        HTTPException: If the filename is invalid, the file is empty or too large.
     """
-    filename = upload_file.filename
-    size = calculate_file_size(upload_file.file)
+    if received.too_large or not received.ingested:
+        raise HTTPException(
+            status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+            detail="Uploaded File is too large.",
+        )
+
+    if received.ingested.size == 0:
+        received.ingested.discard()
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="Empty file.")
 
-    if not filename:
+    if not received.filename:
+        received.ingested.discard()
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST, detail="Filename is invalid."
-        )  # pragma: no cover
+        )
+
+    return received.ingested
 
-    if size == 0:
-        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="Empty file.")
 
-    if size > constants.project_quota:
+def make_ingestor(
+    request: Request, project: Project, *, max_files: int
+) -> MultipartIngestor:
+    """Ingestor of uploaded_file parts of request's multipart body"""
+    with ingestion_errors():
+        return MultipartIngestor(
+            request.headers.get("content-type", ""),
+            project_id=project.id,
+            field_name="uploaded_file",
+            max_size=constants.project_quota,
+            max_files=max_files,
+        )
+
+
+@contextmanager
+def ingestion_errors() -> Generator[None]:
+    """Failures to ingest the multipart body as HTTPException"""
+    try:
+        yield
+    except MultipartError as exc:
+        raise HTTPException(HTTPStatus.BAD_REQUEST, str(exc)) from exc
+    except (ClientDisconnect, HTTPException):
+        raise
+    except Exception as exc:
+        logger.error(exc)
         raise HTTPException(
-            status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
-            detail="Uploaded File is too large.",
+            HTTPStatus.INTERNAL_SERVER_ERROR, "Server unable to save file."
+        ) from exc
+
+
+async def receive_uploaded_files(
+    request: Request, project: Project, *, max_files: int
+) -> list[ReceivedFile]:
+    """Ingest uploaded_file parts of request's multipart body as it is received"""
+    ingestor = make_ingestor(request, project, max_files=max_files)
+    with ingestion_errors():
+        received = await ingestor.parse(request.stream())
+
+    if not received:
+        raise HTTPException(
+            HTTPStatus.UNPROCESSABLE_ENTITY, "Missing uploaded_file in body."
         )
+    return received
 
-    mimetype = filesystem.get_content_mimetype(upload_file.file.read(2048))
-    upload_file.file.seek(0)
 
-    return (filename, size, mimetype)
+async def iter_uploaded_files(
+    request: Request, project: Project, *, max_files: int
+) -> AsyncGenerator[ReceivedFile, None]:
+    """Ingest uploaded_file parts of request's multipart body, yielding each
+
+    Each part is yielded as soon as it is complete"""
+    ingestor = make_ingestor(request, project, max_files=max_files)
+    files = ingestor.iter_parse(request.stream())
+    try:
+        while True:
+            with ingestion_errors():
+                received = await anext(files, None)
+            if not received:
+                return
+            yield received
+    finally:
+        await files.aclose()
 
 
 def validate_project_quota(file_size: int, project: Project):
-    """Validates total size of uploaded files to ensure it meets the requirements."""
+    """Validates total size of uploaded files to ensure it meets the requirements.
+
+    Early check only: space is actually reserved when files are recorded"""
     total_size = file_size + project.used_space
     if total_size > constants.project_quota:
         raise HTTPException(
@@ -113,6 +234,17 @@ def validate_project_quota(file_size: int, project: Project):
         )
 
 
+def reserve_project_quota(
+    session: Session, project_id: UUID, *, file_size: int, count: int = 1
+):
+    """Record new files in project's used space, raising if it exceeds quota"""
+    if not reserve_project_space(session, project_id, filesize=file_size, count=count):
+        raise HTTPException(
+            status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+            detail="Uploaded files exceeded project quota",
+        )
+
+
 def update_file_status_and_path(file: File, status: str, path: str):
     """Update file's Status and Path."""
     with DBSession.begin() as session:
@@ -131,38 +263,356 @@ def update_file_path(file: File, path: str):
     update_file_status_and_path(file, file.status, path)
 
 
+def upload_project_files_to_storage(project_id: UUID):
+    """Upload all project's Files not in Storage yet
+
+    Requested on each File addition but coalescing: a single job runs per
+    project at a time, uploading every pending File. Requests made while one
+    runs only have another one requested once done (with a timeout fitting
+    the Files then pending)."""
+    rerun_key = get_project_upload_rerun_key(project_id)
+    requested = False
+    while True:
+        with held_lock(
+            get_project_upload_lock_name(project_id),
+            timeout=constants.upload_lock_timeout,
+        ) as acquired:
+            if acquired:
+                redis_conn.delete(rerun_key)
+                upload_pending_files(project_id)
+        if acquired:
+            if redis_conn.exists(rerun_key):
+                with DBSession.begin() as session:
+                    nb_pending = count_pending_uploads(session, project_id)
+                enqueue_project_upload(project_id, nb_pending=nb_pending)
+            return
+        elif requested:
+            # holder is released after our request: it requests another run
+            return
+        else:
+            redis_conn.set(rerun_key, 1, ex=constants.upload_lock_timeout)
+            requested = True
+
+
 def upload_file_to_storage(new_file_id: UUID):
-    """Update local file to Storage and update file status"""
-    new_file = get_file_by_id(new_file_id)
-    project = get_project_by_id(new_file.project_id)
+    """Upload File's project pending Files (job enqueued before they were batched)"""
+    upload_project_files_to_storage(get_file_by_id(new_file_id).project_id)
+
+
+def upload_pending_files(project_id: UUID):
+    """Upload project's LOCAL Files to Storage, concurrently, and update them
+
+    Files are claimed (as PROCESSING) and loaded in a single query and their
+    status updated in a single bulk UPDATE. Content shared by several of them
+    is uploaded once. Only one job uploads a given content at a time: Files
+    of a content being uploaded by another job are postponed.
+
+    Claim is a lease, renewed while uploading: Files of a job that died are
+    claimable again once it expired."""
+    project = get_project_by_id(project_id)
     if not constants.single_user_id and not project.expire_on:
         raise ValueError(f"Project: {project.id} does not have expire date.")
 
-    if new_file.status == FileStatus.PROCESSING:
+    current_job = get_current_job()
+    leased_by = get_worker_identity()
+    now = datetime.datetime.now(tz=datetime.UTC)
+    with DBSession.begin() as session:
+        # rows locked by a concurrent claim are left to it
+        claimable = (
+            select(File.id)
+            .filter_by(project_id=project_id)
+            .filter(
+                or_(
+                    File.status == FileStatus.LOCAL.value,
+                    and_(
+                        File.status == FileStatus.PROCESSING.value,
+                        is_lease_expired(now),
+                    ),
+                )
+            )
+            .with_for_update(skip_locked=True)
+        )
+        files = (
+            session.execute(
+                update(File)
+                .filter(File.id.in_(claimable))
+                .values(
+                    status=FileStatus.PROCESSING.value,
+                    leased_by=leased_by,
+                    lease_expire_on=now + constants.upload_lease_duration,
+                )
+                .returning(File)
+            )
+            .scalars()
+            .all()
+        )
+        blobs_expire_on = dict(
+            session.execute(
+                select(Blob.hash, Blob.expire_on).filter(
+                    Blob.hash.in_({file.hash for file in files})
+                )
+            ).all()
+        )
+        session.expunge_all()
+    if not files:
         return
-    else:
-        update_file_status(new_file, FileStatus.PROCESSING)
 
-    try:
-        storage_path = storage.get_file_path(file=new_file)
-        if storage.has(storage_path):
-            logger.debug(
-                f"Object `{storage_path}` for File {new_file_id} already in Storage"
+    # Files by Storage path, shared by those with same content if content-addressed
+    files_at: dict[str, list[File]] = {}
+    for file in files:
+        files_at.setdefault(storage.get_file_path(file=file), []).append(file)
+
+    last_try = not current_job or not current_job.retries_left
+
+    def upload(storage_path: str) -> FileStatus:
+        file = files_at[storage_path][0]
+        with held_lock(
+            get_upload_lock_name(storage_path), timeout=constants.upload_lock_timeout
+        ) as acquired:
+            if not acquired:
+                logger.debug(f"`{storage_path}` being uploaded, postponing")
+                return FileStatus.LOCAL
+            try:
+                # content might be shared with a project expiring later
+                autodelete_on = blobs_expire_on.get(file.hash) or project.expire_on
+                if storage.has(storage_path):
+                    logger.debug(f"Object `{storage_path}` already in Storage")
+                else:
+                    logger.debug(f"Uploading `{file.local_fpath}` to `{storage_path}`")
+                    storage.upload_file(fpath=file.local_fpath, path=storage_path)
+                storage.set_autodelete_on(storage_path, autodelete_on)
+            except Exception as exc:
+                logger.error(f"`{storage_path}` failed to upload to Storage: {exc}")
+                # retried along with the job, unless it was its last try
+                return FileStatus.FAILURE if last_try else FileStatus.LOCAL
+        return FileStatus.STORAGE
+
+    with (
+        renewed_lease([file.id for file in files], leased_by=leased_by),
+        ThreadPoolExecutor(max_workers=constants.project_upload_workers) as executor,
+    ):
+        statuses = dict(zip(files_at, executor.map(upload, files_at), strict=True))
+
+    with DBSession.begin() as session:
+        # Files deleted or re-claimed (lease lost) meanwhile are skipped
+        session.execute(
+            update(File).filter_by(leased_by=leased_by),
+            [
+                {
+                    "id": file.id,
+                    "status": statuses[storage_path].value,
+                    "path": (
+                        storage_path
+                        if statuses[storage_path] == FileStatus.STORAGE
+                        else file.path
+                    ),
+                    "leased_by": None,
+                    "lease_expire_on": None,
+                }
+                for storage_path, path_files in files_at.items()
+                for file in path_files
+            ],
+            execution_options={"synchronize_session": None},
+        )
+        uploaded = {
+            file.hash
+            for storage_path, path_files in files_at.items()
+            if statuses[storage_path] == FileStatus.STORAGE
+            for file in path_files
+        }
+        # other Files sharing the content find it in Storage from now on,
+        # unless Storage paths are File's own: those to upload need it locally
+        if not storage.content_addressed:
+            uploaded -= set(
+                session.execute(
+                    select(File.hash)
+                    .filter(File.hash.in_(uploaded))
+                    .filter(
+                        File.status.in_(
+                            [FileStatus.LOCAL.value, FileStatus.PROCESSING.value]
+                        )
+                    )
+                ).scalars()
             )
-            update_file_status_and_path(new_file, FileStatus.STORAGE, storage_path)
-            return
-        logger.debug(
-            f"Uploading {new_file_id}: `{new_file.local_fpath}` to `{storage_path}`"
+    for file_hash in uploaded:
+        get_blob_fpath(file_hash).unlink(missing_ok=True)
+    logger.info(
+        f"Uploaded {list(statuses.values()).count(FileStatus.STORAGE)}/"
+        f"{len(statuses)} contents of project {project_id}"
+    )
+
+    if FileStatus.LOCAL in statuses.values():
+        if not last_try:
+            raise OSError(f"Some Files of project {project_id} failed to upload")
+        # postponed ones only
+        queue = (
+            Queue(current_job.origin, connection=redis_conn)
+            if current_job
+            else uploads_queue
         )
-        storage.upload_file(fpath=new_file.local_fpath, path=storage_path)
-        logger.debug(f"Uploaded {new_file_id}. Removing `{new_file.local_fpath}`…")
-        new_file.local_fpath.unlink(missing_ok=True)
-        storage.set_autodelete_on(storage_path, project.expire_on)
-        update_file_status_and_path(new_file, FileStatus.STORAGE, storage_path)
-    except Exception as exc:
-        logger.error(f"File: {new_file_id} failed to upload to Storage: {exc}")
-        update_file_status(new_file, FileStatus.FAILURE)
-        raise exc
+        queue.enqueue_in(
+            datetime.timedelta(seconds=constants.s3_retry_wait),
+            upload_project_files_to_storage,
+            project_id,
+            retry=constants.job_retry,
+            job_timeout=get_upload_job_timeout(
+                sum(
+                    len(files_at[storage_path])
+                    for storage_path, status in statuses.items()
+                    if status == FileStatus.LOCAL
+                )
+            ),
+        )
+
+
+def get_worker_identity() -> str:
+    """rq worker and current job (or process and thread), holding leases
+
+    Distinct for each job a worker runs at once (see ThreadPoolWorker)"""
+    current_job = get_current_job()
+    if current_job:
+        worker_name = current_job.worker_name or socket.gethostname()
+        return f"{worker_name}:{current_job.id}"
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def is_lease_expired(now: datetime.datetime) -> ColumnElement[bool]:
+    """Whether File's upload lease expired (its job died), if PROCESSING"""
+    return or_(File.lease_expire_on.is_(None), File.lease_expire_on < now)
+
+
+@contextmanager
+def renewed_lease(file_ids: list[UUID], *, leased_by: str) -> Generator[None]:
+    """Keep Files' upload lease from expiring while in context"""
+    released = threading.Event()
+    interval = constants.upload_lease_duration.total_seconds() / 3
+
+    def renew():
+        while not released.wait(interval):
+            with DBSession.begin() as session:
+                session.execute(
+                    update(File)
+                    .filter(File.id.in_(file_ids))
+                    .filter_by(leased_by=leased_by)
+                    .values(
+                        lease_expire_on=datetime.datetime.now(tz=datetime.UTC)
+                        + constants.upload_lease_duration
+                    )
+                )
+
+    renewer = threading.Thread(target=renew, daemon=True)
+    renewer.start()
+    try:
+        yield
+    finally:
+        released.set()
+        renewer.join()
+
+
+def get_upload_lock_name(storage_path: str) -> str:
+    return f"upload-lock:{storage_path}"
+
+
+def get_project_upload_lock_name(project_id: UUID) -> str:
+    return f"project-upload-lock:{project_id}"
+
+
+def get_project_upload_rerun_key(project_id: UUID) -> str:
+    return f"project-upload-rerun:{project_id}"
+
+
+def enqueue_project_upload(project_id: UUID, *, nb_pending: int):
+    """Request upload of project's pending Files, nb_pending of them
+
+    Projects with many pending go to the bulk queue so a project uploading
+    many files doesn't delay others' uploads"""
+    get_uploads_queue_for(nb_pending).enqueue(
+        upload_project_files_to_storage,
+        str(project_id),
+        retry=constants.job_retry,
+        job_timeout=get_upload_job_timeout(nb_pending),
+    )
+
+
+def get_upload_job_timeout(nb_pending: int) -> int:
+    """Seconds a project's upload job may run for, nb_pending Files to upload
+
+    rq kills jobs past their timeout: their Files' leases then expire and the
+    watchdog re-dispatches them, to a job with the same timeout"""
+    return constants.upload_job_timeout + nb_pending * (
+        constants.upload_job_timeout_per_file
+    )
+
+
+def sweep_storage_uploads():
+    """Abort multipart uploads not resumed for too long, rescheduling itself"""
+    now = datetime.datetime.now(tz=datetime.UTC)
+    try:
+        storage.abort_stale_uploads(before=now - constants.s3_multipart_stale_after)
+    finally:
+        schedule_storage_sweep()
+
+
+def requeue_expired_leases():
+    """Watchdog re-dispatching uploads whose job died, rescheduling itself
+
+    Their Files are PROCESSING with an expired lease, which the new job claims"""
+    now = datetime.datetime.now(tz=datetime.UTC)
+    try:
+        with DBSession.begin() as session:
+            nb_pending = {
+                project_id: count_pending_uploads(session, project_id)
+                for project_id in set(
+                    session.execute(
+                        select(File.project_id)
+                        .filter_by(status=FileStatus.PROCESSING.value)
+                        .filter(is_lease_expired(now))
+                    ).scalars()
+                )
+            }
+        for project_id, count in nb_pending.items():
+            logger.warning(f"Re-dispatching expired uploads of project {project_id}")
+            enqueue_project_upload(project_id, nb_pending=count)
+    finally:
+        schedule_lease_watchdog()
+
+
+def schedule_periodic(func: Callable[[], None], interval: datetime.timedelta):
+    """Schedule next run of func, once whatever the number of callers
+
+    Job ID is that of the next time slot so scheduling is idempotent"""
+    seconds = interval.total_seconds()
+    slot = int(datetime.datetime.now(tz=datetime.UTC).timestamp() // seconds) + 1
+    maintenance_queue.enqueue_at(
+        datetime.datetime.fromtimestamp(slot * seconds, tz=datetime.UTC),
+        func,
+        job_id=f"{func.__name__}-{slot}",
+    )
+
+
+def schedule_storage_sweep():
+    schedule_periodic(sweep_storage_uploads, constants.storage_sweep_interval)
+
+
+def schedule_lease_watchdog():
+    schedule_periodic(requeue_expired_leases, constants.upload_lease_duration)
+
+
+def get_autodelete_on(file: File, project: Project) -> datetime.datetime | None:
+    """When File's content should be removed from Storage
+
+    Latest expiry of projects sharing it, or File's project one"""
+    blob = get_blob_by_hash(file.hash)
+    return blob.expire_on if blob and blob.expire_on else project.expire_on
+
+
+def extend_autodelete(file_id: UUID):
+    """Update autodelete of a File already in Storage, as its content is shared"""
+    file = get_file_by_id(file_id)
+    project = get_project_by_id(file.project_id)
+    storage.set_autodelete_on(
+        storage.get_file_path(file=file), get_autodelete_on(file, project)
+    )
 
 
 def delete_from_storage(storage_path: str):
@@ -178,15 +628,21 @@ def delete_from_storage(storage_path: str):
         logger.exception(exc)
 
 
-@router.post("/{project_id}/files", status_code=HTTPStatus.CREATED)
+@router.post(
+    "/{project_id}/files",
+    status_code=HTTPStatus.CREATED,
+    openapi_extra=UPLOADED_FILE_BODY,
+)
 async def create_file(
-    uploaded_file: UploadFile,
+    request: Request,
     project: Project = Depends(validated_project),
-    session: Session = Depends(gen_session),
 ) -> FileModel:
     """
     Uploads a new file and creates a corresponding FileModel.
 
+    Body is a multipart/form-data one with the file as uploaded_file.
+    It is written to disk as it is received.
+
     Returns:
 
         FileModel: The created FileModel.
@@ -200,60 +656,420 @@ async def create_file(
         HTTPException(416, "Uploaded files exceeded quota"):
             the file size exceeds the maximum allowed size.
     """
-    now = datetime.datetime.now(tz=datetime.UTC)
+    (received,) = await receive_uploaded_files(request, project, max_files=1)
+    ingested = validate_uploaded_file(received)
+    return await run_in_io_pool(
+        add_file_to_project,
+        project,
+        ingested=ingested,
+        filename=received.filename,
+    )
 
-    filename, size, mimetype = validate_uploaded_file(uploaded_file)
-    validate_project_quota(size, project)
-    file_hash = generate_file_hash(uploaded_file.file)
-    try:
-        fpath = save_file(uploaded_file.file, file_hash, project.id)
-    except Exception as exc:
-        logger.error(exc)
-        raise HTTPException(
-            HTTPStatus.INTERNAL_SERVER_ERROR, "Server unable to save file."
-        ) from exc
 
-    if len(project.files) == 0:
-        project.expire_on = now + constants.project_expire_after
+def make_file(
+    ingested: IngestedFile, *, filename: str, fpath: Path, now: datetime.datetime
+) -> File:
+    """New LOCAL File for an ingested file saved at fpath"""
+    return File(
+        filename=filename,
+        filesize=ingested.size,
+        title=filename,
+        authors=None,
+        description=None,
+        uploaded_on=now,
+        hash=ingested.hash,
+        path=str(fpath),
+        type=ingested.mimetype,
+        status=FileStatus.LOCAL.value,
+        order=1,
+    )
+
+
+def add_file_to_project(
+    project: Project, *, ingested: IngestedFile, filename: str
+) -> FileModel:
+    """Record an ingested file as a new File and request its upload to Storage
+
+    Ingested file is moved to its transient storage location (or discarded)"""
+    file, nb_pending = record_file_in_project(
+        project.id, ingested=ingested, filename=filename
+    )
+    # request file upload by rq-worker
+    enqueue_project_upload(project.id, nb_pending=nb_pending)
+    return file
+
+
+def record_file_in_project(
+    project_id: UUID, *, ingested: IngestedFile, filename: str
+) -> tuple[FileModel, int]:
+    """Record an ingested file as a new File, within project's quota
+
+    Ingested file is moved to its transient storage location (or discarded).
+    Returns the new File and the number of project's Files pending upload"""
+    now = datetime.datetime.now(tz=datetime.UTC)
 
     # adding file in an independant session that gets commited before enquing
     # so its visible by other processes (rq-worker)
     with DBSession.begin() as indep_session:
+        try:
+            reserve_project_quota(indep_session, project_id, file_size=ingested.size)
+        except HTTPException:
+            ingested.discard()
+            raise
+
         # get project again but from this session
         project_: Project | None = indep_session.execute(
-            select(Project).filter_by(id=str(project.id))
+            select(Project).filter_by(id=str(project_id))
         ).scalar()
         if not project_:
+            ingested.discard()
             raise OSError("Failed to re-fetch Project")
-        new_file = File(
-            filename=filename,
-            filesize=size,
-            title=filename,
-            authors=None,
-            description=None,
-            uploaded_on=now,
-            hash=file_hash,
-            path=str(fpath),
-            type=mimetype,
-            status=FileStatus.LOCAL.value,
-            order=1,
+        # first file of the project (space reserved above)
+        if project_.file_count == 1:
+            project_.expire_on = now + constants.project_expire_after
+        # referenced (its Blob locked) before looking for a local copy, so that
+        # one can't be purged from under the new File
+        reference_blob(
+            indep_session,
+            file_hash=ingested.hash,
+            filesize=ingested.size,
+            expire_on=project_.expire_on,
         )
-        project_.files.append(new_file)
+        try:
+            fpath = save_ingested_file(ingested)
+        except Exception as exc:
+            ingested.discard()
+            logger.error(exc)
+            raise HTTPException(
+                HTTPStatus.INTERNAL_SERVER_ERROR, "Server unable to save file."
+            ) from exc
+        new_file = make_file(ingested, filename=filename, fpath=fpath, now=now)
+        # not through project_.files, which would load all of them
+        new_file.project_id = project_.id
         indep_session.add(new_file)
         indep_session.flush()
         indep_session.refresh(new_file)
-        file_id = str(new_file.id)
-    # request file upload by rq-worker
-    task_queue.enqueue(upload_file_to_storage, file_id, retry=constants.job_retry)
+        return (
+            FileModel.model_validate(new_file),
+            count_pending_uploads(indep_session, project_id),
+        )
+
+
+class BatchFileResult(BaseModel):
+    """Outcome of a single file of a batch upload (a line of the response)
+
+    Without filename for a failure of the body itself, ending the batch"""
+
+    filename: str | None
+    status: int
+    detail: str | None = None
+    file: FileModel | None = None
+
+
+class IngestingResponse(StreamingResponse):
+    """StreamingResponse sent while its request's body is still being received
+
+    StreamingResponse listens for client disconnection on the receive channel,
+    which would consume the body: here, the content reads it (through
+    request.stream(), which raises ClientDisconnect) and is the only one to"""
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send  # noqa: ARG002
+    ) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+@router.post(
+    "/{project_id}/files/batch",
+    openapi_extra=UPLOADED_FILE_BODY,
+    response_class=StreamingResponse,
+    responses={
+        HTTPStatus.OK.value: {
+            "description": "A BatchFileResult per uploaded file, one per line",
+            "content": {"application/x-ndjson": {}},
+        }
+    },
+)
+async def create_files(
+    request: Request, project: Project = Depends(validated_project)
+) -> StreamingResponse:
+    """
+    Uploads several files at once, creating a FileModel for each.
+
+    Body is a multipart/form-data one with any number of uploaded_file parts.
+    Each file is recorded (within project quota) as soon as it is received.
+
+    Returns:
+
+        application/x-ndjson stream of BatchFileResult, in upload order,
+        each sent once its file is received, with the created FileModel or
+        the reason the file was refused. Should the body itself turn invalid,
+        a last BatchFileResult without filename tells why.
+
+    Note:
+
+        HTTPException(400): the body is not a valid multipart one.
+
+        HTTPException(422, "Missing uploaded_file in body."): there is no file.
+    """
+    files = iter_uploaded_files(request, project, max_files=constants.batch_max_files)
+    # errors until the first file is received are the request's own
+    try:
+        first = await anext(files, None)
+    except BaseException:
+        await files.aclose()
+        raise
+    if not first:
+        raise HTTPException(
+            HTTPStatus.UNPROCESSABLE_ENTITY, "Missing uploaded_file in body."
+        )
+
+    return IngestingResponse(
+        stream_batch_results(project.id, first, files),
+        media_type="application/x-ndjson",
+    )
+
+
+async def stream_batch_results(
+    project_id: UUID, first: ReceivedFile, files: AsyncGenerator[ReceivedFile, None]
+) -> AsyncGenerator[str, None]:
+    """Record received files as new Files, yielding a BatchFileResult line for each
+
+    Their upload to Storage is requested once, when the body is over"""
+    nb_pending = 0
+    received: ReceivedFile | None = first
+    try:
+        while received:
+            result = BatchFileResult(
+                filename=received.filename, status=HTTPStatus.CREATED
+            )
+            try:
+                ingested = validate_uploaded_file(received)
+                result.file, nb_pending = await run_in_io_pool(
+                    record_file_in_project,
+                    project_id,
+                    ingested=ingested,
+                    filename=received.filename,
+                )
+            except HTTPException as exc:
+                result.status, result.detail = exc.status_code, exc.detail
+            yield result.model_dump_json() + "\n"
+            received = await anext(files, None)
+    except HTTPException as exc:
+        yield BatchFileResult(
+            filename=None, status=exc.status_code, detail=exc.detail
+        ).model_dump_json() + "\n"
+    except ClientDisconnect:
+        logger.warning(f"Client disconnected during batch upload to {project_id}")
+    finally:
+        await files.aclose()
+        # request files upload by rq-worker, all in a single job
+        if nb_pending:
+            with anyio.CancelScope(shield=True):
+                await run_in_io_pool(
+                    enqueue_project_upload, project_id, nb_pending=nb_pending
+                )
+
+
+def count_pending_uploads(session: Session, project_id: UUID) -> int:
+    """Number of project's Files not yet uploaded to Storage"""
+    return session.execute(
+        select(func.count())
+        .select_from(File)
+        .filter_by(project_id=project_id)
+        .filter(File.status.in_([FileStatus.LOCAL.value, FileStatus.PROCESSING.value]))
+    ).scalar_one()
+
+
+class FilePrecheckRequest(BaseModel):
+    filename: str
+    filesize: int
+    hash: str = Field(pattern=r"^[0-9a-f]{64}$")
+
+
+class FilePrecheckResult(BaseModel):
+    filename: str
+    hash: str
+    known: bool
+    file: FileModel | None = None
 
-    # fetch File from DB in this session to return it
-    file = session.execute(select(File).filter_by(id=file_id)).scalar()
-    return FileModel.model_validate(file)
+
+@router.post("/{project_id}/files/precheck", response_model=list[FilePrecheckResult])
+async def precheck_files(
+    precheck_requests: list[FilePrecheckRequest],
+    project: Project = Depends(validated_project),
+) -> list[FilePrecheckResult]:
+    """
+    Creates Files for content the project already holds, without any transfer.
+
+    Client sends size and sha256 of the files it is about to upload. Those
+    matching a File of the project are added right away (known) ; others
+    (not known) are to be uploaded.
+
+    Returns:
+
+        list[FilePrecheckResult]: in request order, with the created FileModel
+            for known files.
+
+    Note:
+
+        HTTPException(413, "Uploaded files exceeded project quota"):
+            the known files' size exceeds the project's remaining quota.
+    """
+    if len(precheck_requests) > constants.batch_max_files:
+        raise HTTPException(
+            HTTPStatus.BAD_REQUEST,
+            f"Too many files (max {constants.batch_max_files}).",
+        )
+    return await run_in_io_pool(add_known_files_to_project, project, precheck_requests)
+
+
+def select_known_files(project_id: UUID, hashes: Collection[str]) -> Select:
+    """Project's Files (but failed ones) of any of these contents"""
+    return (
+        select(File)
+        .filter_by(project_id=project_id)
+        .filter(File.hash.in_(hashes))
+        .filter(File.status != FileStatus.FAILURE.value)
+    )
+
+
+def add_known_files_to_project(
+    project: Project, precheck_requests: list[FilePrecheckRequest]
+) -> list[FilePrecheckResult]:
+    """Record requested files the project already holds content for as new Files
+
+    Files of which content is already in Storage are immediately STORAGE ones.
+    Others share the local copy and are requested for upload, as if uploaded.
+    With a content-addressed Storage, content of other projects (a Blob) is
+    known too: Files for it are requested for upload, which finds it there.
+    Content in Storage is only known if not about to be autodeleted.
+
+    Blocking (DB, redis): to be run in the I/O pool"""
+    now = datetime.datetime.now(tz=datetime.UTC)
+    requested = {request.hash for request in precheck_requests}
+    added: list[tuple[FilePrecheckResult, File]] = []
+    with DBSession.begin() as indep_session:
+        # referenced contents that'll remain in Storage until re-uploaded.
+        # Locked so that none is purged before the new Files reference it
+        lasting_sizes = {
+            file_hash: filesize
+            for file_hash, filesize, is_lasting in indep_session.execute(
+                select(
+                    Blob.hash,
+                    Blob.filesize,
+                    and_(
+                        Blob.refcount > 0,
+                        or_(
+                            Blob.expire_on.is_(None),
+                            Blob.expire_on > now + constants.known_content_min_lifetime,
+                        ),
+                    ),
+                )
+                .filter(Blob.hash.in_(requested))
+                .with_for_update()
+            ).all()
+            if is_lasting
+        }
+        # one File per known content, preferring one already in Storage
+        sources: dict[str, File] = {}
+        for file in indep_session.execute(
+            select_known_files(project.id, requested)
+        ).scalars():
+            if file.status == FileStatus.STORAGE and file.hash not in lasting_sizes:
+                continue
+            if file.hash not in sources or file.status == FileStatus.STORAGE:
+                sources[file.hash] = file
+        known_sizes = {file_hash: file.filesize for file_hash, file in sources.items()}
+        if storage.content_addressed:
+            known_sizes = lasting_sizes | known_sizes
+
+        results = [
+            FilePrecheckResult(
+                filename=request.filename,
+                hash=request.hash,
+                known=known_sizes.get(request.hash) == request.filesize,
+            )
+            for request in precheck_requests
+        ]
+        nb_known = sum(1 for result in results if result.known)
+        reserve_project_quota(
+            indep_session,
+            project.id,
+            file_size=sum(
+                known_sizes[result.hash] for result in results if result.known
+            ),
+            count=nb_known,
+        )
+        project_: Project | None = indep_session.execute(
+            select(Project).filter_by(id=str(project.id))
+        ).scalar()
+        if not project_:
+            raise OSError("Failed to re-fetch Project")
+        # first files of the project (space reserved above)
+        if nb_known and project_.file_count == nb_known:
+            project_.expire_on = now + constants.project_expire_after
+        for result in results:
+            if not result.known:
+                continue
+            source = sources.get(result.hash)
+            in_storage = source is not None and source.status == FileStatus.STORAGE
+            new_file = File(
+                filename=result.filename,
+                filesize=known_sizes[result.hash],
+                title=result.filename,
+                authors=None,
+                description=None,
+                uploaded_on=now,
+                hash=result.hash,
+                # other projects' content is at its blob path (if not uploaded)
+                path=source.path if source else str(get_blob_fpath(result.hash)),
+                type=(
+                    source.type
+                    if source
+                    else mimetypes.types_map.get(
+                        Path(result.filename).suffix, "application/octet-stream"
+                    )
+                ),
+                status=(FileStatus.STORAGE if in_storage else FileStatus.LOCAL).value,
+                order=1,
+            )
+            new_file.project_id = project_.id
+            indep_session.add(new_file)
+            reference_blob(
+                indep_session,
+                file_hash=result.hash,
+                filesize=known_sizes[result.hash],
+                expire_on=project_.expire_on,
+            )
+            added.append((result, new_file))
+        indep_session.flush()
+        for result, new_file in added:
+            indep_session.refresh(new_file)
+            result.file = FileModel.model_validate(new_file)
+        nb_pending = count_pending_uploads(indep_session, project.id)
+
+    # files not in Storage yet are uploaded (or marked uploaded) by rq-worker
+    # while content in Storage might need to outlive its previous projects
+    if any(
+        result.file and result.file.status == FileStatus.LOCAL for result, _ in added
+    ):
+        enqueue_project_upload(project.id, nb_pending=nb_pending)
+    to_extend = [
+        Queue.prepare_data(extend_autodelete, args=(str(result.file.id),))
+        for result, _ in added
+        if result.file and result.file.status == FileStatus.STORAGE
+    ]
+    if to_extend:
+        maintenance_queue.enqueue_many(to_extend)
+    return results
 
 
 @router.get("/{project_id}/files", response_model=list[FileModel])
 async def get_all_files(
-    project: Project = Depends(validated_project),
+    project: Project = Depends(validated_project_with_files),
 ) -> list[FileModel]:
     """Get all files of a project."""
     return TypeAdapter(list[FileModel]).validate_python(project.files)
@@ -269,7 +1085,7 @@ async def get_file(file: File = Depends(validated_file)) -> FileModel:
 async def update_file(
     update_request: FileMetadataUpdateRequest,
     file: File = Depends(validated_file),
-    session: Session = Depends(gen_session),
+    session: AsyncSession = Depends(gen_session),
 ):
     """Update a specific file's metadata by its id."""
     stmt = (
@@ -282,30 +1098,112 @@ async def update_file(
             description=update_request.description,
         )
     )
-    session.execute(stmt)
+    await session.execute(stmt)
 
 
 @router.delete("/{project_id}/files/{file_id}", status_code=HTTPStatus.NO_CONTENT)
 async def delete_file(
-    file: File = Depends(validated_file), session: Session = Depends(gen_session)
+    file: File = Depends(validated_file), session: AsyncSession = Depends(gen_session)
 ):
     """Delete a specific file by its id."""
-    stmt = (
-        select(func.count())
-        .select_from(File)
-        .filter_by(project_id=file.project_id)
-        .filter_by(hash=file.hash)
+    contents = await session.run_sync(release_files, [file])
+    await session.run_sync(
+        adjust_project_space, file.project_id, filesize=-file.filesize, count=-1
     )
-    number_of_duplicate_files = session.scalars(stmt).one()
-    if number_of_duplicate_files == 1:
-        if file.status == FileStatus.LOCAL:
-            file.local_fpath.unlink(missing_ok=True)
-        if file.status == FileStatus.STORAGE:
-            task_queue.enqueue(delete_from_storage, storage.get_file_path(file=file))
-        if file.status == FileStatus.PROCESSING:
-            task_queue.enqueue_at(
-                datetime.datetime.now(tz=datetime.UTC) + constants.s3_deletion_delay,
-                delete_from_storage,
-                storage.get_file_path(file=file),
+    await session.delete(file)
+    await session.commit()
+    await run_in_io_pool(purge_contents, contents)
+
+
+def release_files(
+    session: Session, files: list[File]
+) -> dict[str, set[tuple[str, str]]]:
+    """Release Files' content, removing their own Storage objects
+
+    Content is shared by all Files with the same hash, whatever their project:
+    references are released at once. Objects at Files' own paths are removed,
+    unless another File was added at the same path (precheck).
+    Returns the contents which lost their last reference, with their objects
+    at content paths (and their Files' status): to pass to purge_contents()
+    once this is committed"""
+    unreferenced = release_blobs(session, [file.hash for file in files])
+    contents: dict[str, set[tuple[str, str]]] = {
+        file_hash: set() for file_hash in unreferenced
+    }
+
+    objects = {
+        (storage.get_file_path(file=file), file.status, file.hash)
+        for file in files
+        if file.status in (FileStatus.STORAGE, FileStatus.PROCESSING)
+    }
+    own_paths = {path for path, _, _ in objects if not storage.is_content_path(path)}
+    in_use = (
+        set(
+            session.execute(
+                select(File.path)
+                .filter(File.path.in_(own_paths))
+                .filter(File.id.not_in([file.id for file in files]))
+            ).scalars()
+        )
+        if own_paths
+        else set()
+    )
+    for storage_path, status, file_hash in objects:
+        if storage.is_content_path(storage_path):
+            if file_hash in contents:
+                contents[file_hash].add((storage_path, status))
+        elif storage_path not in in_use:
+            request_storage_deletion(storage_path, status=status)
+    return contents
+
+
+def purge_contents(contents: dict[str, set[tuple[str, str]]]):
+    """Remove contents released by release_files(), locally and from Storage
+
+    Run once their release is committed, so that a content referenced again
+    meanwhile (by any project) is kept"""
+    if not contents:
+        return
+    with DBSession.begin() as session:
+        purged = purge_blobs(session, list(contents))
+    for file_hash in purged:
+        for storage_path, status in contents[file_hash]:
+            request_storage_deletion(storage_path, status=status)
+
+
+def request_storage_deletion(storage_path: str, *, status: str):
+    """Request removal of a File's object from Storage, by rq-worker
+
+    Object of a File being uploaded is removed once its upload had time to end"""
+    if status == FileStatus.STORAGE:
+        deletions_queue.enqueue(delete_from_storage, storage_path)
+    else:
+        deletions_queue.enqueue_at(
+            datetime.datetime.now(tz=datetime.UTC) + constants.s3_deletion_delay,
+            delete_from_storage,
+            storage_path,
+        )
+
+
+def sweep_unreferenced_blobs():
+    """Remove contents left unreferenced, rescheduling itself
+
+    Those whose release was committed but not followed by their purge (API
+    process stopped, WebDAV synchronisation). Their Storage objects, at content
+    paths, are left to their autodelete"""
+    try:
+        with DBSession.begin() as session:
+            purge_blobs(
+                session,
+                list(
+                    session.execute(
+                        select(Blob.hash).filter(Blob.refcount <= 0)
+                    ).scalars()
+                ),
             )
-    session.delete(file)
+    finally:
+        schedule_blob_sweep()
+
+
+def schedule_blob_sweep():
+    schedule_periodic(sweep_unreferenced_blobs, constants.storage_sweep_interval)
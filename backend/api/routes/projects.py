@@ -5,14 +5,24 @@ from pathlib import Path
 from urllib.parse import unquote, urljoin
 from uuid import UUID, uuid4
 
-import requests
+import httpx
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, ConfigDict, TypeAdapter
-from sqlalchemy import select, update
-from sqlalchemy.orm import Session
+from sqlalchemy import (
+    ARRAY,
+    Row,
+    Uuid,
+    any_,
+    delete,
+    func,
+    insert,
+    literal,
+    select,
+    update,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from api.constants import StorageType, constants, logger
-from api.database import Session as DBSession
 from api.database import gen_session
 from api.database.models import (
     Archive,
@@ -22,10 +32,21 @@ from api.database.models import (
     Project,
     User,
 )
-from api.routes import validated_project, validated_user
+from api.database.utils import adjust_project_space, release_blobs
+from api.executor import run_in_io_pool
+from api.routes import (
+    validated_project,
+    validated_project_with_files,
+    validated_user,
+)
 from api.routes.archives import gen_collection_for, upload_file_to_storage
-from api.routes.files import FileStatus, validate_project_quota
-from api.storage import storage
+from api.routes.files import (
+    FileStatus,
+    purge_contents,
+    release_files,
+    reserve_project_quota,
+)
+from api.storage import StorageEntry, async_storage, storage
 
 router = APIRouter(prefix="/projects")
 
@@ -44,6 +65,8 @@ class ProjectModel(BaseModel):
     created_on: datetime.datetime
     expire_on: datetime.datetime | None
     webdav_path: str | None
+    used_space: int
+    file_count: int
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -52,7 +75,7 @@ class ProjectModel(BaseModel):
 async def create_project(
     project: ProjectRequest,
     user: User = Depends(validated_user),
-    session: Session = Depends(gen_session),
+    session: AsyncSession = Depends(gen_session),
 ):
     """Creates a new Project"""
     now = datetime.datetime.now(tz=datetime.UTC)
@@ -76,12 +99,13 @@ async def create_project(
         zimfarm_task_id=None,
         email=None,
     )
-    user.projects.append(new_project)
+    # not through user.projects, which would load all of them
+    new_project.user_id = user.id
     new_project.archives.append(new_archive)
     session.add(new_project)
     session.add(new_archive)
-    session.flush()
-    session.refresh(new_project)
+    await session.flush()
+    await session.refresh(new_project)
     return ProjectModel.model_validate(new_project)
 
 
@@ -90,7 +114,9 @@ async def get_all_projects(
     user: User = Depends(validated_user),
 ) -> list[ProjectModel]:
     """Get all projects of a user."""
-    return TypeAdapter(list[ProjectModel]).validate_python(user.projects)
+    return TypeAdapter(list[ProjectModel]).validate_python(
+        await user.awaitable_attrs.projects
+    )
 
 
 @router.get("/{project_id}", response_model=ProjectModel)
@@ -101,29 +127,32 @@ async def get_project(project: Project = Depends(validated_project)) -> ProjectM
 
 @router.delete("/{project_id}", status_code=HTTPStatus.NO_CONTENT)
 async def delete_project(
-    project: Project = Depends(validated_project),
-    session: Session = Depends(gen_session),
+    project: Project = Depends(validated_project_with_files),
+    session: AsyncSession = Depends(gen_session),
 ):
     """Delete a specific project by its id."""
-    session.delete(project)
+    contents = await session.run_sync(release_files, project.files)
+    await session.delete(project)
+    await session.commit()
+    await run_in_io_pool(purge_contents, contents)
 
 
 @router.patch("/{project_id}", status_code=HTTPStatus.NO_CONTENT)
 async def update_project(
     project_request: ProjectRequest,
     project: Project = Depends(validated_project),
-    session: Session = Depends(gen_session),
+    session: AsyncSession = Depends(gen_session),
 ):
     """Update a specific project by its id."""
     stmt = update(Project).filter_by(id=project.id).values(name=project_request.name)
-    session.execute(stmt)
+    await session.execute(stmt)
 
 
 @router.post("/{project_id}.dav", response_model=ProjectModel)
 async def update_project_webdav(
     project_request: ProjectWebdavRequest,
     project: Project = Depends(validated_project),
-    session: Session = Depends(gen_session),
+    session: AsyncSession = Depends(gen_session),
 ):
     """Update a project's WebDAV path and update its Files accordingly"""
 
@@ -139,13 +168,15 @@ async def update_project_webdav(
         raise HTTPException(HTTPStatus.FORBIDDEN, "Directory traversal not allowed")
 
     stmt = update(Project).filter_by(id=project.id).values(webdav_path=webdav_path)
-    session.execute(stmt)
-    session.refresh(project)
+    await session.execute(stmt)
+    await session.refresh(project)
 
     # update Files from WebDAV folder
-    await update_project_files_from_webdav(session, project)
+    contents = await update_project_files_from_webdav(session, project)
 
-    session.refresh(project)
+    await session.refresh(project)
+    await session.commit()
+    await run_in_io_pool(purge_contents, contents)
     return ProjectModel.model_validate(project)
 
 
@@ -187,37 +218,58 @@ class NautilusCollection:
 
 
 async def read_remote_collection(url: str):
-    resp = requests.get(url, timeout=constants.webdav_request_timeout_sec)
+    async with httpx.AsyncClient(
+        timeout=constants.webdav_request_timeout_sec, follow_redirects=True
+    ) as client:
+        resp = await client.get(url)
     resp.raise_for_status()
     return NautilusCollection(resp.json())
 
 
-async def update_project_files_from_webdav(session: Session, project: Project):
+async def update_project_files_from_webdav(
+    session: AsyncSession, project: Project
+) -> dict[str, set[tuple[str, str]]]:
+    """Update project's Files from its WebDAV folder, in session's transaction
+
+    Returns contents released by Files removed, to purge_contents() once
+    committed"""
     if project.webdav_path is None:
         logger.warning(
             f"[project #{project.id}] requested webdav update "
             "but project has no webdav_path"
         )
-        return
+        return {}
 
     logger.debug(f"[project #{project.id}] refreshing from {project.webdav_path}")
 
     prefix = Path(project.webdav_path)
 
     # create a folder if this prefix does not exists
-    if not storage.has(path=project.webdav_path):
+    if not await async_storage.has(path=project.webdav_path):
         logger.debug(f"[project #{project.id}] mkdir {project.webdav_path}")
-        storage.mkdir(path=project.webdav_path)
+        await async_storage.mkdir(path=project.webdav_path)
 
     entries = {
         str(Path(entry.path).relative_to(prefix)): entry
-        for entry in list(storage.list(prefix=project.webdav_path))
+        async for entry in async_storage.list(prefix=project.webdav_path)
     }
 
-    remote_paths = list(entries.keys())
-    db_paths = [file.path for file in project.files]
-    to_add = [path for path in remote_paths if path not in db_paths]
-    to_remove = [path for path in db_paths if path not in remote_paths]
+    # only what's needed of the project's Files, by path
+    files = {
+        file.path: file
+        for file in await session.execute(
+            select(File.id, File.path, File.filesize, File.hash).filter_by(
+                project_id=project.id
+            )
+        )
+    }
+    to_update = entries.keys() & files.keys()
+    to_add = entries.keys() - files.keys()
+    to_remove = files.keys() - entries.keys()
+    logger.debug(
+        f"[project #{project.id}] {len(to_update)} to update, "
+        f"{len(to_add)} to add, {len(to_remove)} to remove"
+    )
 
     collection = None
     if entries.get("collection.json"):
@@ -232,46 +284,76 @@ async def update_project_files_from_webdav(session: Session, project: Project):
         else:
             logger.debug(f"[project #{project.id}] collection: {len(collection)} files")
 
-    # first, update DB entries with data from webdav (modified_pn, size)
+    # all in session's transaction, a statement or so per step whatever the number
+    # of entries. First, update DB entries with data from webdav (modified_on, size)
     await _update_existing_entries(
         session=session,
         project=project,
-        entries={
-            path: entries[path]
-            for path in remote_paths
-            if path not in to_add and path not in to_remove
-        },
+        entries={path: (files[path], entries[path]) for path in to_update},
+    )
+    # then clean up what's not in WebDAV anymore, freeing space
+    contents = await _delete_removed_entries(
+        session=session, project=project, files=[files[path] for path in to_remove]
     )
-    # then add new entries
+    # eventually add new entries
     await _add_new_entries(
+        session=session,
         project=project,
         entries={path: entries[path] for path in to_add},
         collection=collection,
+        is_empty=not to_update,
     )
-    # eventually clean up what's not in WebDAV anymore
-    await _delete_removed_entries(
-        session=session, project=project, paths_to_remove=to_remove
-    )
+    return contents
 
 
-async def _update_existing_entries(session: Session, project: Project, entries: dict):
+async def _update_existing_entries(
+    session: AsyncSession,
+    project: Project,
+    entries: dict[str, tuple[Row, StorageEntry]],
+):
+    if not entries:
+        return
 
-    # update existing Files without removing metadata
-    for path, entry in entries.items():
-        logger.debug(f"[project #{project.id}] updating {path}")
-        stmt = select(File).filter_by(project_id=project.id).filter_by(path=str(path))
-        file = session.execute(stmt).scalar_one()
-        file.filesize = entry.size
-        file.uploaded_on = entry.modified_on
-        file.type = entry.mimetype
-        file.status = FileStatus.STORAGE.value
-        session.add(file)
+    # update existing Files without removing metadata, from arrays of values
+    files, listing = zip(*entries.values(), strict=True)
+    listed = (
+        func.unnest(
+            literal([file.id for file in files], ARRAY(Uuid)),
+            literal([entry.size for entry in listing], ARRAY(File.filesize.type)),
+            literal(
+                [entry.modified_on for entry in listing],
+                ARRAY(File.uploaded_on.type),
+            ),
+            literal([entry.mimetype for entry in listing], ARRAY(File.type.type)),
+        )
+        .table_valued("id", "filesize", "uploaded_on", "type")
+        .render_derived()
+    )
+    await session.execute(
+        update(File)
+        .filter(File.id == listed.c.id)
+        .values(
+            filesize=listed.c.filesize,
+            uploaded_on=listed.c.uploaded_on,
+            type=listed.c.type,
+            status=FileStatus.STORAGE.value,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await session.run_sync(
+        adjust_project_space,
+        project.id,
+        filesize=sum(entry.size - file.filesize for file, entry in entries.values()),
+    )
 
 
 async def _add_new_entries(
+    session: AsyncSession,
     project: Project,
-    entries: dict,
+    entries: dict[str, StorageEntry],
     collection: NautilusCollection | None,
+    *,
+    is_empty: bool,
 ):
     now = datetime.datetime.now(tz=datetime.UTC)
     prefix = Path(project.webdav_path or "")
@@ -279,10 +361,9 @@ async def _add_new_entries(
     if collection:
         entries = dict(sorted(entries.items(), key=lambda x: collection.index_of(x[0])))
 
-    # add new files
+    new_files = []
     for path, entry in entries.items():
         order = collection.index_of(path) if collection else 1
-        logger.debug(f"[project #{project.id}] adding {path} ## {order}")
         filepath = Path(entry.path).relative_to(prefix)
         filename = filepath.name
 
@@ -290,9 +371,6 @@ async def _add_new_entries(
         if collection and str(filepath) == "collection.json":
             continue
 
-        # TODO
-        validate_project_quota(entry.size, project)
-
         title, authors, description = filename, None, None
         if collection and path in collection:
             authors = str(collection[path].get("authors", "")) or authors
@@ -301,53 +379,73 @@ async def _add_new_entries(
             description = str(collection[path].get("description", "")) or description
             title = str(collection[path].get("title", "")) or title
 
-        file_hash = f"unknown:{uuid4().hex}"
-        if len(project.files) == 0:
-            project.expire_on = now + constants.project_expire_after
-
-        # adding file in an independant session that gets commited before enquing
-        # so its visible by other processes (rq-worker)
-        with DBSession.begin() as indep_session:
-            # get project again but from this session
-            project_: Project | None = indep_session.execute(
-                select(Project).filter_by(id=str(project.id))
-            ).scalar()
-            if not project_:
-                raise OSError("Failed to re-fetch Project")
-            new_file = File(
-                filename=filename,
-                filesize=entry.size,
-                title=title,
-                authors=authors,
-                description=description,
-                uploaded_on=entry.modified_on,
-                hash=file_hash,
-                path=str(filepath),
-                type=entry.mimetype,
-                status=FileStatus.STORAGE.value,
-                order=order,
-            )
-            project_.files.append(new_file)
-            indep_session.add(new_file)
-            indep_session.flush()
-            indep_session.refresh(new_file)
+        new_files.append(
+            {
+                "project_id": project.id,
+                "filename": filename,
+                "filesize": entry.size,
+                "title": title,
+                "authors": authors,
+                "description": description,
+                "uploaded_on": entry.modified_on,
+                "hash": f"unknown:{uuid4().hex}",
+                "path": str(filepath),
+                "type": entry.mimetype,
+                "status": FileStatus.STORAGE.value,
+                "order": order,
+            }
+        )
+    if not new_files:
+        return
+
+    await session.run_sync(
+        reserve_project_quota,
+        project.id,
+        file_size=sum(file["filesize"] for file in new_files),
+        count=len(new_files),
+    )
+    if is_empty:
+        await session.execute(
+            update(Project)
+            .filter_by(id=project.id)
+            .values(expire_on=now + constants.project_expire_after)
+        )
+    # RETURNING has them inserted by batches (multi-VALUES statements)
+    # instead of one by one
+    await session.execute(insert(File).returning(File.id), new_files)
 
 
 async def _delete_removed_entries(
-    session: Session, project: Project, paths_to_remove: list[str]
-):
+    session: AsyncSession, project: Project, files: list[Row]
+) -> dict[str, set[tuple[str, str]]]:
+    if not files:
+        return {}
 
     # delete those that dont exist anymore
-    for path in paths_to_remove:
-        logger.debug(f"[project #{project.id}] deleting {path}")
-        stmt = select(File).filter_by(path=path).filter_by(project_id=project.id)
-        file = session.execute(stmt).scalar()
-        if file:
-            session.delete(file)
+    await session.execute(
+        delete(File)
+        .filter(File.id == any_(literal([file.id for file in files], ARRAY(Uuid))))
+        .execution_options(synchronize_session=False)
+    )
+    await session.run_sync(
+        adjust_project_space,
+        project.id,
+        filesize=-sum(file.filesize for file in files),
+        count=-len(files),
+    )
+    # already gone from Storage, only their local copies might remain
+    return {
+        file_hash: set()
+        for file_hash in await session.run_sync(
+            release_blobs, [file.hash for file in files]
+        )
+    }
 
 
 @router.post("/{project_id}.json", response_model=ProjectModel)
-async def update_project_json_collection(project: Project = Depends(validated_project)):
+async def update_project_json_collection(
+    project: Project = Depends(validated_project_with_files),
+):
     """Request the update of the WebDAV-enable project's JSON collection"""
 
     if constants.storage_type != StorageType.WEBDAV:
@@ -362,7 +460,7 @@ async def update_project_json_collection(project: Project = Depends(validated_pr
     )
 
     # upload it to Storage
-    upload_file_to_storage(
+    await upload_file_to_storage(
         project=project, file=collection_file, storage_path=collection_key
     )
 
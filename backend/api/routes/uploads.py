@@ -0,0 +1,346 @@
+import datetime
+import fcntl
+import hashlib
+from collections import OrderedDict
+from http import HTTPStatus
+from typing import Annotated, BinaryIO
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
+from pydantic import BaseModel, ConfigDict
+from sqlalchemy import delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.requests import ClientDisconnect
+from zimscraperlib import filesystem
+
+from api.constants import constants, logger
+from api.database import Session as DBSession
+from api.database import gen_session
+from api.database.models import Project, Upload
+from api.executor import run_in_io_pool
+from api.files import MIMETYPE_SNIFF_SIZE, IngestedFile, read_file_in_chunks
+from api.routes import authenticated_user_id, fetch_project, validated_project
+from api.routes.files import (
+    FileModel,
+    add_file_to_project,
+    schedule_periodic,
+    validate_project_quota,
+)
+
+router = APIRouter()
+
+# content-type of PATCH requests' body (as in tus protocol)
+OFFSET_OCTET_STREAM = "application/offset+octet-stream"
+
+# sha256 of in-progress uploads along with the offset it has been computed up to.
+# per-process: when a chunk lands on another worker, it is rebuilt from disk.
+# Latest used first, bounded: hashes of abandoned uploads are eventually dropped
+upload_hashers: OrderedDict[UUID, tuple[int, "hashlib._Hash"]] = OrderedDict()
+
+
+class UploadRequest(BaseModel):
+    filename: str
+    filesize: int
+
+
+class UploadModel(BaseModel):
+    id: UUID
+
+    project_id: UUID
+    filename: str
+    filesize: int
+    offset: int
+    created_on: datetime.datetime
+    expire_on: datetime.datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+async def validated_project_upload(
+    project_id: UUID,
+    upload_id: UUID,
+    response: Response,
+    user_id: UUID = Depends(authenticated_user_id),
+    session: AsyncSession = Depends(gen_session),
+) -> tuple[Project, Upload]:
+    """Depends()-able upload and its project from request, ensuring they exist"""
+    return await fetch_project(
+        session,
+        response,
+        user_id=user_id,
+        project_id=project_id,
+        item=(Upload, upload_id),
+    )
+
+
+async def validated_upload(
+    project_upload: tuple[Project, Upload] = Depends(validated_project_upload),
+) -> Upload:
+    """Depends()-able upload from request, ensuring it exists"""
+    return project_upload[1]
+
+
+def get_offset_headers(offset: int, filesize: int) -> dict[str, str]:
+    return {
+        "Upload-Offset": str(offset),
+        "Upload-Length": str(filesize),
+        "Cache-Control": "no-store",
+    }
+
+
+def get_hasher_for(upload: Upload) -> "hashlib._Hash":
+    """sha256 of upload's content up to its current offset
+
+    A copy, that the caller can update without altering the recorded one"""
+    offset, hasher = upload_hashers.get(upload.id, (-1, hashlib.sha256()))
+    if offset == upload.offset:
+        return hasher.copy()
+
+    logger.debug(f"Rebuilding hash of Upload {upload.id} up to {upload.offset}")
+    hasher = hashlib.sha256()
+    remaining = upload.offset
+    with open(upload.local_fpath, "rb") as fh:
+        for chunk in read_file_in_chunks(fh):
+            hasher.update(chunk[:remaining])
+            remaining -= len(chunk)
+            if remaining <= 0:
+                break
+    return hasher
+
+
+def record_hasher(upload_id: UUID, offset: int, hasher: "hashlib._Hash"):
+    """Keep upload's sha256 up to offset, dropping least recently used ones"""
+    upload_hashers[upload_id] = (offset, hasher)
+    upload_hashers.move_to_end(upload_id)
+    while len(upload_hashers) > constants.upload_hashers_max:
+        upload_hashers.popitem(last=False)
+
+
+@router.post(
+    "/{project_id}/uploads",
+    response_model=UploadModel,
+    status_code=HTTPStatus.CREATED,
+)
+async def create_upload(
+    upload_request: UploadRequest,
+    response: Response,
+    project: Project = Depends(validated_project),
+    session: AsyncSession = Depends(gen_session),
+) -> UploadModel:
+    """Start a resumable upload of a File, its content to be sent in chunks"""
+    if not upload_request.filename:
+        raise HTTPException(HTTPStatus.BAD_REQUEST, "Filename is invalid.")
+
+    if upload_request.filesize <= 0:
+        raise HTTPException(HTTPStatus.BAD_REQUEST, "Empty file.")
+
+    if upload_request.filesize > constants.project_quota:
+        raise HTTPException(
+            HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Uploaded File is too large."
+        )
+
+    await run_in_io_pool(validate_project_quota, upload_request.filesize, project)
+
+    now = datetime.datetime.now(tz=datetime.UTC)
+    upload = Upload(
+        filename=upload_request.filename,
+        filesize=upload_request.filesize,
+        offset=0,
+        created_on=now,
+        expire_on=now + constants.upload_expire_after,
+    )
+    # not through project.uploads, which would load all of them
+    upload.project_id = project.id
+    session.add(upload)
+    await session.flush()
+    await session.refresh(upload)
+    await run_in_io_pool(upload.local_fpath.touch)
+    response.headers.update(get_offset_headers(upload.offset, upload.filesize))
+    response.headers["Location"] = (
+        f"{constants.api_version_prefix}/projects/{project.id}/uploads/{upload.id}"
+    )
+    return UploadModel.model_validate(upload)
+
+
+@router.get("/{project_id}/uploads/{upload_id}", response_model=UploadModel)
+async def get_upload(
+    response: Response, upload: Upload = Depends(validated_upload)
+) -> UploadModel:
+    """Get an upload, including the offset it should be resumed from"""
+    response.headers.update(get_offset_headers(upload.offset, upload.filesize))
+    return UploadModel.model_validate(upload)
+
+
+@router.head("/{project_id}/uploads/{upload_id}")
+async def get_upload_offset(upload: Upload = Depends(validated_upload)) -> Response:
+    """Offset to resume upload from, as Upload-Offset header"""
+    return Response(headers=get_offset_headers(upload.offset, upload.filesize))
+
+
+@router.patch("/{project_id}/uploads/{upload_id}", status_code=HTTPStatus.NO_CONTENT)
+async def append_to_upload(
+    request: Request,
+    upload_offset: Annotated[int, Header()],
+    content_type: Annotated[str, Header()] = "",
+    upload: Upload = Depends(validated_upload),
+):
+    """Append request's body to upload's content, at Upload-Offset
+
+    Bytes received before a connection loss are kept: client should query
+    the upload's offset and resume from there."""
+    if content_type != OFFSET_OCTET_STREAM:
+        raise HTTPException(
+            HTTPStatus.UNSUPPORTED_MEDIA_TYPE,
+            f"Content-Type must be {OFFSET_OCTET_STREAM}",
+        )
+
+    fh = await run_in_io_pool(open, upload.local_fpath, "r+b")
+    try:
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError as exc:
+            raise HTTPException(
+                HTTPStatus.CONFLICT, "Upload is being written to by another request"
+            ) from exc
+
+        if upload_offset != upload.offset:
+            raise HTTPException(
+                HTTPStatus.CONFLICT, f"Upload-Offset mismatch: at {upload.offset}"
+            )
+
+        hasher = await run_in_io_pool(get_hasher_for, upload)
+        fh.seek(upload.offset)
+        offset = upload.offset
+
+        def write(data: bytes):
+            fh.write(data)
+            hasher.update(data)
+
+        buffer = bytearray()
+        try:
+            try:
+                async for chunk in request.stream():
+                    if offset + len(buffer) + len(chunk) > upload.filesize:
+                        raise HTTPException(
+                            HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                            "Upload exceeds its declared length",
+                        )
+                    buffer += chunk
+                    if len(buffer) >= constants.chunk_size:
+                        await run_in_io_pool(write, bytes(buffer))
+                        offset += len(buffer)
+                        buffer.clear()
+            except ClientDisconnect:
+                logger.debug(f"Upload {upload.id} interrupted at {offset}")
+            if buffer:
+                await run_in_io_pool(write, bytes(buffer))
+                offset += len(buffer)
+        finally:
+            # record what has been written, even if the request failed midway
+            await run_in_io_pool(record_offset, fh, upload.id, offset, hasher)
+    finally:
+        await run_in_io_pool(fh.close)
+
+    return Response(
+        status_code=HTTPStatus.NO_CONTENT,
+        headers=get_offset_headers(offset, upload.filesize),
+    )
+
+
+def record_offset(fh: BinaryIO, upload_id: UUID, offset: int, hasher: "hashlib._Hash"):
+    """Persist upload's offset once its content has been written up to it
+
+    Upload's expiry is pushed back: it's being resumed"""
+    fh.truncate(offset)
+    fh.flush()
+    # independent session as request's one is rolled-back on failure
+    with DBSession.begin() as session:
+        session.execute(
+            update(Upload)
+            .filter_by(id=upload_id)
+            .values(
+                offset=offset,
+                expire_on=datetime.datetime.now(tz=datetime.UTC)
+                + constants.upload_expire_after,
+            )
+        )
+    record_hasher(upload_id, offset, hasher)
+
+
+@router.post(
+    "/{project_id}/uploads/{upload_id}/finalize",
+    response_model=FileModel,
+    status_code=HTTPStatus.CREATED,
+)
+async def finalize_upload(
+    project_upload: tuple[Project, Upload] = Depends(validated_project_upload),
+    session: AsyncSession = Depends(gen_session),
+) -> FileModel:
+    """Turn a complete upload into a File, requesting its upload to Storage"""
+    project, upload = project_upload
+    if upload.offset != upload.filesize:
+        raise HTTPException(
+            HTTPStatus.CONFLICT,
+            f"Upload is incomplete: {upload.offset}/{upload.filesize} bytes",
+        )
+    await run_in_io_pool(validate_project_quota, upload.filesize, project)
+    file = await run_in_io_pool(finalize, upload, project)
+    await session.execute(delete(Upload).filter_by(id=upload.id))
+    return file
+
+
+def finalize(upload: Upload, project: Project) -> FileModel:
+    """Record upload's content as a new File
+
+    Blocking (disk, DB, redis): to be run in the I/O pool"""
+    with open(upload.local_fpath, "rb") as fh:
+        head = fh.read(MIMETYPE_SNIFF_SIZE)
+    ingested = IngestedFile(
+        fpath=upload.local_fpath,
+        size=upload.filesize,
+        hash=get_hasher_for(upload).hexdigest(),
+        mimetype=filesystem.get_content_mimetype(head),
+    )
+    try:
+        return add_file_to_project(project, ingested=ingested, filename=upload.filename)
+    except BaseException:
+        # content was discarded (or moved) along the way: nothing to resume
+        if not upload.local_fpath.exists():
+            with DBSession.begin() as session:
+                session.execute(delete(Upload).filter_by(id=upload.id))
+        raise
+    finally:
+        upload_hashers.pop(upload.id, None)
+
+
+@router.delete("/{project_id}/uploads/{upload_id}", status_code=HTTPStatus.NO_CONTENT)
+async def delete_upload(
+    upload: Upload = Depends(validated_upload),
+    session: AsyncSession = Depends(gen_session),
+):
+    """Abort an upload, removing what has been received"""
+    upload_hashers.pop(upload.id, None)
+    await run_in_io_pool(upload.local_fpath.unlink, missing_ok=True)
+    await session.delete(upload)
+
+
+def sweep_expired_uploads():
+    """Remove uploads not resumed for too long, rescheduling itself"""
+    now = datetime.datetime.now(tz=datetime.UTC)
+    try:
+        with DBSession.begin() as session:
+            expired = {
+                upload.id: upload.local_fpath
+                for upload in session.scalars(
+                    delete(Upload).filter(Upload.expire_on < now).returning(Upload)
+                )
+            }
+        for upload_id, fpath in expired.items():
+            logger.debug(f"Removing expired Upload {upload_id}")
+            fpath.unlink(missing_ok=True)
+    finally:
+        schedule_upload_sweep()
+
+
+def schedule_upload_sweep():
+    schedule_periodic(sweep_expired_uploads, constants.storage_sweep_interval)
@@ -5,7 +5,7 @@ from uuid import UUID
 from fastapi import APIRouter, Depends, Response
 from pydantic import BaseModel, ConfigDict
 from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from api.constants import constants
 from api.database import gen_session
@@ -23,18 +23,18 @@ class UserModel(BaseModel):
 
 @router.post("", response_model=UserModel, status_code=HTTPStatus.CREATED)
 async def create_user(
-    response: Response, session: Session = Depends(gen_session)
+    response: Response, session: AsyncSession = Depends(gen_session)
 ) -> UserModel:
     """Post this endpoint to create a user."""
     if constants.single_user_id:
-        new_user: User = session.execute(
-            select(User).filter_by(id=constants.single_user)
+        new_user: User = (
+            await session.execute(select(User).filter_by(id=constants.single_user))
         ).scalar_one()
     else:
         new_user = User(created_on=datetime.datetime.now(tz=datetime.UTC), projects=[])
         session.add(new_user)
-        session.flush()
-        session.refresh(new_user)
+        await session.flush()
+        await session.refresh(new_user)
     response.set_cookie(
         key=constants.authentication_cookie_name,
         value=str(new_user.id),
@@ -1,10 +1,27 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
+from pydantic import BaseModel
+from rq import Queue
+from rq.utils import utcnow
 
+from api.executor import run_in_io_pool
+from api.routes import validated_user
 from api.storage import storage
+from api.store import worked_queues
 
 router = APIRouter()
 
 
+class QueueStatsModel(BaseModel):
+    name: str
+    # jobs waiting to be run
+    depth: int
+    started: int
+    scheduled: int
+    failed: int
+    # seconds the oldest waiting job has been waiting for
+    wait: float
+
+
 @router.get("/ping")
 async def pong():
     return {"message": "pong"}
@@ -13,3 +30,29 @@ async def pong():
 @router.get("/config")
 async def info():
     return {"NAUTILUS_STORAGE_URL": storage.public_url}
+
+
+def get_queue_stats(queue: Queue) -> QueueStatsModel:
+    oldest = queue.get_jobs(0, 1)
+    return QueueStatsModel(
+        name=queue.name,
+        depth=queue.count,
+        started=queue.started_job_registry.count,
+        scheduled=queue.scheduled_job_registry.count,
+        failed=queue.failed_job_registry.count,
+        wait=(
+            (utcnow() - oldest[0].enqueued_at).total_seconds()
+            if oldest and oldest[0].enqueued_at
+            else 0
+        ),
+    )
+
+
+@router.get(
+    "/queues",
+    response_model=list[QueueStatsModel],
+    dependencies=[Depends(validated_user)],
+)
+async def queues_stats() -> list[QueueStatsModel]:
+    """Jobs of each queue, by decreasing priority (to authenticated users)"""
+    return [await run_in_io_pool(get_queue_stats, queue) for queue in worked_queues]
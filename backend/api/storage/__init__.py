@@ -1,12 +1,15 @@
 import datetime
 from abc import ABC, abstractmethod, abstractproperty
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, Generator
 from dataclasses import dataclass
 from pathlib import Path
 from typing import BinaryIO
 
+import httpx
+
 from api.constants import StorageType, constants
 from api.database.models import File, Project
+from api.executor import run_in_io_pool
 
 
 @dataclass(kw_only=True)
@@ -19,6 +22,8 @@ class StorageEntry:
 
 
 class StorageInterface(ABC):
+    # whether Files' paths depend only on their content (shared across Files)
+    content_addressed: bool = False
 
     @abstractproperty
     def storage(self): ...
@@ -41,6 +46,9 @@ class StorageInterface(ABC):
     @abstractmethod
     def delete(self, path: str): ...
 
+    @abstractmethod
+    def abort_stale_uploads(self, before: datetime.datetime): ...
+
     @abstractmethod
     def list(self, prefix: str) -> Generator[StorageEntry, None, None]: ...
 
@@ -50,12 +58,82 @@ class StorageInterface(ABC):
     @abstractmethod
     def get_file_path(self, file: File) -> str: ...
 
+    def is_content_path(self, path: str) -> bool:  # noqa: ARG002
+        """Whether a File path is its content's one, shared by Files holding it"""
+        return False
+
     @abstractmethod
     def get_companion_file_path(
         self, project: Project, file_hash: str, suffix: str
     ) -> str: ...
 
 
+class AsyncStorageInterface(ABC):
+    """Awaitable Storage operations, for use in request handlers
+
+    Requests go through a pooled async HTTP client instead of blocking the loop.
+    Paths and public URL are those of the (sync) StorageInterface it wraps,
+    which remains the one to use in rq jobs."""
+
+    def __init__(self, sync_storage: StorageInterface) -> None:
+        self.sync_storage = sync_storage
+        self._client: httpx.AsyncClient | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = self.create_client()
+        return self._client
+
+    async def setup(self):
+        """Set the wrapped Storage up (checking its credentials) off the loop
+
+        Its first use does otherwise, blocking the loop: to await at startup"""
+        await run_in_io_pool(getattr, self.sync_storage, "storage")
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @abstractmethod
+    def create_client(self) -> httpx.AsyncClient: ...
+
+    @property
+    def public_url(self) -> str:
+        return self.sync_storage.public_url
+
+    def get_file_path(self, file: File) -> str:
+        return self.sync_storage.get_file_path(file=file)
+
+    def get_companion_file_path(
+        self, project: Project, file_hash: str, suffix: str
+    ) -> str:
+        return self.sync_storage.get_companion_file_path(
+            project=project, file_hash=file_hash, suffix=suffix
+        )
+
+    @abstractmethod
+    async def has(self, path: str) -> bool: ...
+
+    @abstractmethod
+    async def upload_fileobj(self, fileobj: BinaryIO, path: str): ...
+
+    @abstractmethod
+    async def set_autodelete_on(self, path: str, on: datetime.datetime | None): ...
+
+    @abstractmethod
+    async def delete(self, path: str): ...
+
+    @abstractmethod
+    def list(self, prefix: str) -> AsyncGenerator[StorageEntry, None]: ...
+
+    @abstractmethod
+    async def mkdir(
+        self, path: str, *, parents: bool = True, exists_ok: bool = True
+    ): ...
+
+
 def get_storage() -> StorageInterface:
     if constants.storage_type == StorageType.WEBDAV:
         from api.storage.webdav import WebDAVStorage
@@ -68,3 +146,17 @@ def get_storage() -> StorageInterface:
 
 
 storage = get_storage()
+
+
+def get_async_storage() -> AsyncStorageInterface:
+    if constants.storage_type == StorageType.WEBDAV:
+        from api.storage.webdav import AsyncWebDAVStorage
+
+        return AsyncWebDAVStorage(storage)
+    else:
+        from api.storage.s3 import AsyncS3Storage
+
+        return AsyncS3Storage(storage)
+
+
+async_storage = get_async_storage()
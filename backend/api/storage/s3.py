@@ -1,18 +1,101 @@
 import datetime
+import functools
 import hashlib
-from collections.abc import Generator
+import hmac
+import math
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+from collections.abc import AsyncGenerator, Generator
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
 from pathlib import Path
 from typing import BinaryIO
-from urllib.parse import parse_qs
+from urllib.parse import parse_qs, quote, urlencode
 
+import httpx
+from botocore.auth import S3SigV4Auth
+from botocore.awsrequest import AWSRequest
+from botocore.credentials import Credentials
+from botocore.exceptions import BotoCoreError, ClientError
 from kiwixstorage import KiwixStorage
 
 from api.constants import constants, logger
 from api.database.models import File, Project
-from api.storage import StorageEntry, StorageInterface
+from api.executor import run_in_io_pool
+from api.storage import AsyncStorageInterface, StorageEntry, StorageInterface
+from api.store import redis_conn
+
+# maximum number of parts of a multipart upload (S3 API limit)
+S3_MAX_PARTS = 10000
+# namespace of S3 API XML responses
+S3_XML_NS = "{http://s3.amazonaws.com/doc/2006-03-01/}"
+# key of a File uploaded before content was shared: {project_id}/{digest}
+LEGACY_FILE_KEY = re.compile(r"[0-9a-f-]{36}/[0-9a-f]{64}")
+# prefix of contents' keys, shared by all Files holding them
+BLOB_KEY_PREFIX = "blobs/"
+
+
+def is_no_such_upload(exc: Exception) -> bool:
+    """whether exc is S3 reporting an unknown (aborted, completed) upload ID"""
+    return (
+        isinstance(exc, ClientError)
+        and exc.response.get("Error", {}).get("Code") == "NoSuchUpload"
+    )
+
+
+class MultipartCheckpoint:
+    """Progress of a multipart upload to a key, persisted in redis
+
+    Holds upload ID, part size and ETag of completed parts so that an upload
+    interrupted (worker crash, failed job) can be resumed by another job.
+    Expires with the upload (see s3_multipart_stale_after)"""
+
+    def __init__(self, path: str):
+        self.key = f"multipart-upload:{path}"
+        self.upload_id = ""
+        self.part_size = 0
+        self.etags: dict[int, str] = {}
+
+    def load(self) -> bool:
+        """Read checkpoint from redis, returning whether there was one"""
+        data = {
+            key.decode("utf-8"): value.decode("utf-8")
+            for key, value in redis_conn.hgetall(self.key).items()  # pyright: ignore
+        }
+        if not data.get("upload_id"):
+            return False
+        self.upload_id = data["upload_id"]
+        self.part_size = int(data["part_size"])
+        self.etags = {
+            int(key.removeprefix("part-")): value
+            for key, value in data.items()
+            if key.startswith("part-")
+        }
+        return True
+
+    def start(self, *, upload_id: str, part_size: int):
+        self.upload_id, self.part_size, self.etags = upload_id, part_size, {}
+        with redis_conn.pipeline() as pipe:
+            pipe.delete(self.key)
+            pipe.hset(
+                self.key, mapping={"upload_id": upload_id, "part_size": part_size}
+            )
+            pipe.expire(self.key, constants.s3_multipart_stale_after)
+            pipe.execute()
+
+    def record_part(self, number: int, etag: str):
+        self.etags[number] = etag
+        redis_conn.hset(self.key, f"part-{number}", etag)
+
+    def clear(self):
+        redis_conn.delete(self.key)
 
 
 class S3Storage(StorageInterface):
+    content_addressed = True
+
     def __init__(self) -> None:
         self._storage = None
 
@@ -69,7 +152,126 @@ class S3Storage(StorageInterface):
             self.storage.set_object_autodelete_on(key=path, on=on)
 
     def upload_file(self, fpath: Path, path: str):
-        self.storage.upload_file(fpath=fpath, key=path)
+        if fpath.stat().st_size > constants.s3_multipart_threshold:
+            self.upload_file_multipart(fpath=fpath, path=path)
+        else:
+            self.storage.upload_file(fpath=fpath, key=path)
+
+    def upload_file_multipart(self, fpath: Path, path: str):
+        """Upload file as a multipart object, parts being sent concurrently
+
+        Each part is retried on its own so that a transient error costs a part,
+        not the whole upload.
+        Upload ID and completed parts are checkpointed (see MultipartCheckpoint)
+        so that a retried or re-dispatched upload continues where it stopped.
+        Incomplete uploads are left for resuming ; stale ones are aborted by
+        abort_stale_uploads()"""
+        size = fpath.stat().st_size
+        client = self.storage.client
+        bucket_name = self.storage.bucket_name
+
+        checkpoint = MultipartCheckpoint(path)
+        if checkpoint.load():
+            logger.debug(
+                f"Resuming upload of `{path}`: "
+                f"{len(checkpoint.etags)} parts already uploaded"
+            )
+        else:
+            # larger parts for objects that would exceed S3's parts count limit
+            part_size = max(constants.s3_part_size, math.ceil(size / S3_MAX_PARTS))
+            upload_id = client.create_multipart_upload(Bucket=bucket_name, Key=path)[
+                "UploadId"
+            ]
+            checkpoint.start(upload_id=upload_id, part_size=part_size)
+        nb_parts = max(math.ceil(size / checkpoint.part_size), 1)
+
+        try:
+            with (
+                open(fpath, "rb") as fh,
+                ThreadPoolExecutor(max_workers=constants.s3_upload_workers) as executor,
+            ):
+                executor_results = executor.map(
+                    functools.partial(
+                        self._upload_part,
+                        fileno=fh.fileno(),
+                        path=path,
+                        checkpoint=checkpoint,
+                    ),
+                    [
+                        number
+                        for number in range(1, nb_parts + 1)
+                        if number not in checkpoint.etags
+                    ],
+                )
+                # consume to raise first part failure, if any
+                list(executor_results)
+            client.complete_multipart_upload(
+                Bucket=bucket_name,
+                Key=path,
+                UploadId=checkpoint.upload_id,
+                MultipartUpload={
+                    "Parts": [
+                        {"PartNumber": number, "ETag": checkpoint.etags[number]}
+                        for number in range(1, nb_parts + 1)
+                    ]
+                },
+            )
+        except ClientError as exc:
+            # upload is gone (aborted as stale): restart from scratch on retry
+            if is_no_such_upload(exc):
+                checkpoint.clear()
+            raise
+        checkpoint.clear()
+
+    def abort_stale_uploads(self, before: datetime.datetime):
+        """Abort multipart uploads started before, along with their checkpoint"""
+        client = self.storage.client
+        paginator = client.get_paginator("list_multipart_uploads")
+        for page in paginator.paginate(Bucket=self.storage.bucket_name):
+            for upload in page.get("Uploads", []):
+                if upload["Initiated"] >= before:
+                    continue
+                logger.warning(
+                    f"Aborting stale multipart upload of `{upload['Key']}` "
+                    f"started on {upload['Initiated']}"
+                )
+                client.abort_multipart_upload(
+                    Bucket=self.storage.bucket_name,
+                    Key=upload["Key"],
+                    UploadId=upload["UploadId"],
+                )
+                checkpoint = MultipartCheckpoint(upload["Key"])
+                if checkpoint.load() and checkpoint.upload_id == upload["UploadId"]:
+                    checkpoint.clear()
+
+    def _upload_part(
+        self, number: int, *, fileno: int, path: str, checkpoint: "MultipartCheckpoint"
+    ):
+        """Upload a single part (1-indexed) of a multipart upload, with retries"""
+        part_size = checkpoint.part_size
+        # pread does not share a file position: safe across threads
+        data = os.pread(fileno, part_size, (number - 1) * part_size)
+        attempt = 1
+        while True:
+            try:
+                resp = self.storage.client.upload_part(
+                    Bucket=self.storage.bucket_name,
+                    Key=path,
+                    UploadId=checkpoint.upload_id,
+                    PartNumber=number,
+                    Body=data,
+                )
+                checkpoint.record_part(number, resp["ETag"])
+                return
+            except (BotoCoreError, ClientError) as exc:
+                if attempt >= constants.s3_part_max_tries or is_no_such_upload(exc):
+                    raise
+                logger.warning(
+                    f"Part #{number} of `{path}` failed ({exc}), "
+                    f"retrying ({attempt}/{constants.s3_part_max_tries})"
+                )
+            time.sleep(constants.s3_part_retry_wait * attempt)
+            attempt += 1
 
     def delete(self, path: str):
         self.storage.delete_object(key=path)
@@ -93,12 +295,22 @@ class S3Storage(StorageInterface):
     def mkdir(self, path: str, *, parents: bool = True, exists_ok: bool = True): ...
 
     def get_file_path(self, file: File) -> str:
-        """S3 key for a Project's File"""
-        digest = hashlib.sha256(
-            bytes(f"{file.project_id!s}-{file.hash}-{constants.private_salt}", "utf-8")
+        """S3 key for a File: that of its content, shared by all projects
+
+        Keyed with a secret so that knowing a content's hash is not enough
+        to guess its URL. Files uploaded before that remain at their own key,
+        recorded as their path"""
+        if LEGACY_FILE_KEY.fullmatch(file.path):
+            return file.path
+        digest = hmac.new(
+            bytes(constants.private_salt, "utf-8"),
+            bytes(file.hash, "utf-8"),
+            hashlib.sha256,
         ).hexdigest()
-        # using project_id/ pattern to ease browsing bucket for objects
-        return f"{file.project_id!s}/{digest}"
+        return f"{BLOB_KEY_PREFIX}{digest}"
+
+    def is_content_path(self, path: str) -> bool:
+        return path.startswith(BLOB_KEY_PREFIX)
 
     def get_companion_file_path(
         self, project: Project, file_hash: str, suffix: str
@@ -106,3 +318,110 @@ class S3Storage(StorageInterface):
         """S3 key for a Project's companion file (not a File)"""
         # using project_id/ pattern to ease browsing bucket for objects
         return f"{project.id!s}/{file_hash}_{suffix}"
+
+
+class AsyncS3Storage(AsyncStorageInterface):
+    """S3 operations over a pooled httpx client, signed with botocore's SigV4"""
+
+    sync_storage: S3Storage
+
+    def create_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            timeout=constants.s3_request_timeout_sec,
+            limits=httpx.Limits(max_connections=constants.storage_max_connections),
+        )
+
+    @property
+    def kiwix_storage(self) -> KiwixStorage:
+        return self.sync_storage.storage
+
+    def get_url_for(self, path: str = "") -> str:
+        endpoint_url = self.kiwix_storage.params[KiwixStorage.ENDPOINT_URL]
+        url = f"{endpoint_url}/{self.kiwix_storage.bucket_name}"
+        return f"{url}/{quote(path)}" if path else url
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        params: dict[str, str] | None = None,
+        content: bytes = b"",
+    ) -> httpx.Response:
+        """Send a SigV4-signed request to S3"""
+        if params:
+            url = f"{url}?{urlencode(params, quote_via=quote)}"
+        aws_request = AWSRequest(method=method, url=url, data=content)
+        S3SigV4Auth(
+            Credentials(
+                access_key=self.kiwix_storage.params[KiwixStorage.KEY_ID],
+                secret_key=self.kiwix_storage.params[KiwixStorage.SECRET_KEY],
+            ),
+            "s3",
+            self.kiwix_storage.client.meta.region_name,
+        ).add_auth(aws_request)
+        return await self.client.request(
+            method, url, content=content, headers=dict(aws_request.headers.items())
+        )
+
+    async def has(self, path: str) -> bool:
+        resp = await self.request("HEAD", self.get_url_for(path))
+        if resp.status_code == HTTPStatus.NOT_FOUND:
+            return False
+        resp.raise_for_status()
+        return True
+
+    async def upload_fileobj(self, fileobj: BinaryIO, path: str):
+        content = await run_in_io_pool(fileobj.read)
+        resp = await self.request("PUT", self.get_url_for(path), content=content)
+        resp.raise_for_status()
+
+    async def set_autodelete_on(self, path: str, on: datetime.datetime | None):
+        if on is None:
+            return
+        if not self.kiwix_storage.is_wasabi:
+            raise NotImplementedError("Only Wasabi at the moment")
+        if on.tzinfo != datetime.UTC:
+            on = on.astimezone(datetime.UTC)
+        retention_time = on.isoformat(timespec="seconds").replace("+00:00", "") + "Z"
+        resp = await self.request(
+            "PUT",
+            f"{self.get_url_for(path)}?compliance",
+            content=(
+                "<ObjectComplianceConfiguration>"
+                "<ConditionalHold>false</ConditionalHold>"
+                f"<RetentionTime>{retention_time}</RetentionTime>"
+                "</ObjectComplianceConfiguration>"
+            ).encode(),
+        )
+        resp.raise_for_status()
+
+    async def delete(self, path: str):
+        resp = await self.request("DELETE", self.get_url_for(path))
+        resp.raise_for_status()
+
+    async def list(self, prefix: str) -> AsyncGenerator[StorageEntry, None]:
+        params = {"list-type": "2", "prefix": prefix}
+        while True:
+            resp = await self.request("GET", self.get_url_for(), params=params)
+            resp.raise_for_status()
+            # response from our configured endpoint, not user data
+            root = ET.fromstring(resp.content)  # noqa: S314
+            for content in root.iterfind(f"{S3_XML_NS}Contents"):
+                yield StorageEntry(
+                    path=content.findtext(f"{S3_XML_NS}Key", ""),
+                    size=int(content.findtext(f"{S3_XML_NS}Size", "0")),
+                    mimetype="binary/octet-stream",
+                    modified_on=datetime.datetime.fromisoformat(
+                        content.findtext(f"{S3_XML_NS}LastModified", "")
+                    ),
+                    etag=content.findtext(f"{S3_XML_NS}ETag"),
+                )
+            token = root.findtext(f"{S3_XML_NS}NextContinuationToken")
+            if root.findtext(f"{S3_XML_NS}IsTruncated") != "true" or not token:
+                break
+            params["continuation-token"] = token
+
+    async def mkdir(
+        self, path: str, *, parents: bool = True, exists_ok: bool = True
+    ): ...
@@ -1,17 +1,25 @@
 import datetime
 import mimetypes
-from collections.abc import Generator
+import xml.etree.ElementTree as ET
+from collections.abc import AsyncGenerator, Generator
+from email.utils import parsedate_to_datetime
+from http import HTTPStatus
 from pathlib import Path
 from typing import BinaryIO
-from urllib.parse import ParseResult, urlparse
+from urllib.parse import ParseResult, quote, unquote, urlparse
 
+import httpx
 from webdav4.client import Client as DAVClient
 from webdav4.client import ResourceAlreadyExists
 
 from api.constants import constants, logger
 from api.database.models import File, Project
 from api.database.utils import get_project_by_id
-from api.storage import StorageEntry, StorageInterface
+from api.executor import run_in_io_pool
+from api.storage import AsyncStorageInterface, StorageEntry, StorageInterface
+
+# namespace of WebDAV XML responses
+DAV_XML_NS = "{DAV:}"
 
 
 class WebDAVUrl:
@@ -91,6 +99,8 @@ class WebDAVStorage(StorageInterface):
     def delete(self, path: str):
         self.storage.remove(path)
 
+    def abort_stale_uploads(self, before: datetime.datetime): ...
+
     def list(self, prefix: str) -> Generator[StorageEntry, None, None]:
         for entry in self.storage.ls(prefix, detail=True, allow_listing_resource=True):
             # we should not get there (detail=True) but type checker doesnt know
@@ -149,6 +159,98 @@ class WebDAVStorage(StorageInterface):
         return f"{project.webdav_path!s}/{suffix}"
 
 
+class AsyncWebDAVStorage(AsyncStorageInterface):
+    """WebDAV operations over a pooled httpx client"""
+
+    def create_client(self) -> httpx.AsyncClient:
+        dav_url = WebDAVUrl(constants.webdav_url_with_credentials)
+        return httpx.AsyncClient(
+            base_url=dav_url.public_url,
+            auth=dav_url.auth,
+            timeout=constants.webdav_request_timeout_sec,
+            limits=httpx.Limits(max_connections=constants.storage_max_connections),
+        )
+
+    async def propfind(self, path: str, *, depth: int) -> httpx.Response:
+        return await self.client.request(
+            "PROPFIND", quote(path), headers={"Depth": str(depth)}
+        )
+
+    async def has(self, path: str) -> bool:
+        resp = await self.propfind(path, depth=0)
+        if resp.status_code == HTTPStatus.NOT_FOUND:
+            return False
+        resp.raise_for_status()
+        return True
+
+    async def upload_fileobj(self, fileobj: BinaryIO, path: str):
+        content = await run_in_io_pool(fileobj.read)
+        resp = await self.client.put(quote(path), content=content)
+        resp.raise_for_status()
+
+    async def set_autodelete_on(
+        self, path: str, on: datetime.datetime | None  # noqa: ARG002
+    ):
+        logger.warning(
+            f"requested autodelete for {path} while storage doesnt support it"
+        )
+
+    async def delete(self, path: str):
+        resp = await self.client.delete(quote(path))
+        resp.raise_for_status()
+
+    async def list(self, prefix: str) -> AsyncGenerator[StorageEntry, None]:
+        resp = await self.propfind(prefix, depth=1)
+        resp.raise_for_status()
+        # response from our configured server, not user data
+        root = ET.fromstring(resp.content)  # noqa: S314
+        base_path = urlparse(str(self.client.base_url)).path.rstrip("/")
+        for response in root.iterfind(f"{DAV_XML_NS}response"):
+            href = unquote(response.findtext(f"{DAV_XML_NS}href", ""))
+            name = href.removeprefix(base_path).strip("/")
+            # PROPFIND lists the collection itself
+            if name == prefix.strip("/"):
+                continue
+            prop = response.find(f"{DAV_XML_NS}propstat/{DAV_XML_NS}prop")
+            if prop is None:
+                continue
+            if (
+                prop.find(f"{DAV_XML_NS}resourcetype/{DAV_XML_NS}collection")
+                is not None
+            ):
+                async for entry in self.list(name):
+                    yield entry
+                continue
+            fpath = Path(name)
+            if "__MACOSX" in fpath.parts or "DS_Store" in fpath.parts:
+                continue
+            modified_on = prop.findtext(f"{DAV_XML_NS}getlastmodified")
+            yield StorageEntry(
+                path=name,
+                size=int(prop.findtext(f"{DAV_XML_NS}getcontentlength") or "0"),
+                mimetype=prop.findtext(f"{DAV_XML_NS}getcontenttype")
+                or mimetypes.types_map.get(fpath.suffix)
+                or "binary/octet-stream",
+                modified_on=(
+                    parsedate_to_datetime(modified_on)
+                    if modified_on
+                    else datetime.datetime.now(tz=datetime.UTC)
+                ),
+                etag=prop.findtext(f"{DAV_XML_NS}getetag"),
+            )
+
+    async def mkdir(self, path: str, *, parents: bool = True, exists_ok: bool = True):
+        ppath = Path(path)
+        if parents:
+            for parent in list(reversed(ppath.parents))[1:]:
+                await self.client.request("MKCOL", quote(str(parent)))
+        resp = await self.client.request("MKCOL", quote(path))
+        # 405 Method Not Allowed: collection already exists
+        if resp.status_code == HTTPStatus.METHOD_NOT_ALLOWED and exists_ok:
+            return
+        resp.raise_for_status()
+
+
 def explode_webdav_credentials(url: str) -> tuple[str, tuple[str, str] | None]:
     """ """
     uri = urlparse(url)
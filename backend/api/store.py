@@ -1,7 +1,76 @@
+import threading
+from collections.abc import Generator
+from contextlib import contextmanager
+
 from redis import Redis
+from redis.exceptions import LockError
 from rq import Queue
 
 from api.constants import constants
 
 redis_conn = Redis.from_url(constants.redis_uri, socket_timeout=500)
-task_queue = Queue(constants.channel_name, connection=redis_conn)
+
+
+def get_queue(kind: str) -> Queue:
+    return Queue(f"{constants.channel_name}-{kind}", connection=redis_conn)
+
+
+# by decreasing priority (as listened to by rq-worker)
+deletions_queue = get_queue("deletions")
+# submissions of requested archives, a user awaiting them
+archives_queue = get_queue("archives")
+uploads_queue = get_queue("uploads")
+maintenance_queue = get_queue("maintenance")
+# uploads of projects with many of them pending, not to delay others' ones
+bulk_uploads_queue = get_queue("bulk-uploads")
+queues = [
+    deletions_queue,
+    archives_queue,
+    uploads_queue,
+    maintenance_queue,
+    bulk_uploads_queue,
+]
+# single queue of releases before the split into the above, still worked on
+# (last) for jobs enqueued or scheduled to it before upgrading to be run.
+# Nothing is enqueued to it anymore: to be removed in next release
+legacy_queue = Queue(constants.channel_name, connection=redis_conn)
+worked_queues = [*queues, legacy_queue]
+
+
+def get_uploads_queue_for(nb_pending: int) -> Queue:
+    """Queue for an upload job of a project, with nb_pending uploads before it"""
+    if nb_pending >= constants.bulk_uploads_threshold:
+        return bulk_uploads_queue
+    return uploads_queue
+
+
+@contextmanager
+def held_lock(name: str, *, timeout: int) -> Generator[bool, None, None]:
+    """Redis lock, yielding whether it was acquired (without waiting)
+
+    Lock is kept alive while in context but expires timeout seconds after
+    its holder died so a crashed worker doesn't hold it forever"""
+    # not thread-local: its token is read by the keeper thread to renew it
+    lock = redis_conn.lock(name, timeout=timeout, thread_local=False)
+    if not lock.acquire(blocking=False):
+        yield False
+        return
+
+    released = threading.Event()
+
+    def keep_alive():
+        while not released.wait(timeout / 3):
+            lock.reacquire()
+
+    keeper = threading.Thread(target=keep_alive, daemon=True)
+    keeper.start()
+    try:
+        yield True
+    finally:
+        released.set()
+        keeper.join()
+        try:
+            lock.release()
+        except LockError:
+            # expired in between
+            ...
@@ -0,0 +1,221 @@
+import argparse
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import redis
+from rq import Queue
+from rq.exceptions import DequeueTimeout
+from rq.job import Job
+from rq.timeouts import TimerDeathPenalty
+from rq.worker import SimpleWorker, WorkerStatus
+
+from api.constants import constants, logger
+from api.storage import storage
+from api.store import redis_conn, worked_queues
+
+# how often a worker with a queue at capacity checks for freed slots (seconds)
+SLOT_POLL_INTERVAL = 1
+
+
+class WarmWorker(SimpleWorker):
+    """rq worker running jobs in its own (long-lived) process
+
+    rq's default worker forks a process per job, in which the Storage client
+    has to be set up again (credentials check being several round-trips).
+    This one sets it up once, on start, and jobs reuse it."""
+
+    def warm_up(self):
+        start = time.perf_counter()
+        # jobs' modules, so their imports are done once as well
+        import api.routes.archives
+        import api.routes.files  # noqa: F401
+
+        _ = storage.storage
+        logger.info(f"Worker ready in {time.perf_counter() - start:.3f}s")
+
+    def perform_job(self, job: Job, queue: Queue) -> bool:
+        """Perform job, logging its run time (Storage client being already set up)"""
+        start = time.perf_counter()
+        try:
+            return super().perform_job(job, queue)
+        finally:
+            logger.info(
+                f"Job {job.id} ({job.func_name}) ran in "
+                f"{time.perf_counter() - start:.3f}s"
+            )
+
+
+class ThreadPoolWorker(WarmWorker):
+    """WarmWorker running several jobs at once, in a pool of threads
+
+    Storage jobs mostly wait on the network: a single process can keep many of
+    them in flight. Each queue has its own cap of jobs running at once; a queue
+    at capacity is not dequeued from until one of its jobs ends.
+    Retries and timeouts are rq's, timeouts being enforced with a timer
+    as signals can't interrupt a thread.
+
+    Jobs share this Worker instance, run through rq's perform_job:
+    - job context is per thread: rq's current job and connection are
+      thread-local stacks, so get_current_job() is the thread's own job;
+    - the main thread alone dequeues and heartbeats the worker, also while
+      waiting for a slot to free up;
+    - the worker's current job and state, as shown by rq (info, dashboard),
+      are the latest ones set by any thread: they are informative only;
+    - job counts and working time are incremented in Redis, atomically."""
+
+    death_penalty_class = TimerDeathPenalty
+
+    def __init__(self, queues: list[Queue], *, concurrency: dict[str, int], **kwargs):
+        super().__init__(queues, **kwargs)
+        self.concurrency = {
+            queue.name: concurrency.get(queue.name, 1) for queue in self.queues
+        }
+        self.running = dict.fromkeys(self.concurrency, 0)
+        self.slot_freed = threading.Condition()
+        self.executor = ThreadPoolExecutor(
+            max_workers=sum(self.concurrency.values()), thread_name_prefix="job"
+        )
+
+    def available_queues(self) -> list[Queue]:
+        return [
+            queue
+            for queue in self.queues
+            if self.running[queue.name] < self.concurrency[queue.name]
+        ]
+
+    def dequeue_job_and_maintain_ttl(
+        self, timeout: int | None, max_idle_time: int | None = None
+    ) -> tuple[Job, Queue] | None:
+        """Dequeue a job from queues with spare capacity, by priority
+
+        While one is at capacity, others are polled so the full one is listened
+        to again shortly after it has a slot freed. `timeout` None (burst) means
+        not waiting for jobs to be enqueued, only for running ones to end.
+        None once a stop is requested (warm shutdown)"""
+        self.set_state(WorkerStatus.IDLE)
+        idle_since = time.monotonic()
+        while True:
+            # stop requested while a job was running (worker then being busy)
+            if self._stop_requested:
+                return None
+            self.heartbeat()
+            if self.should_run_maintenance_tasks:
+                self.run_maintenance_tasks()
+
+            with self.slot_freed:
+                if not self.slot_freed.wait_for(
+                    self.available_queues, timeout=SLOT_POLL_INTERVAL
+                ):
+                    continue
+                queues = self.available_queues()
+            has_full_queue = len(queues) < len(self.queues)
+
+            wait = timeout
+            if wait is not None and has_full_queue:
+                wait = min(wait, SLOT_POLL_INTERVAL)
+            if max_idle_time is not None:
+                idle_left = math.ceil(max_idle_time - (time.monotonic() - idle_since))
+                if idle_left <= 0:
+                    return None
+                wait = idle_left if wait is None else min(wait, idle_left)
+
+            try:
+                result = self.queue_class.dequeue_any(
+                    queues,
+                    wait,
+                    connection=self.connection,
+                    job_class=self.job_class,
+                    serializer=self.serializer,
+                    death_penalty_class=self.death_penalty_class,
+                )
+            except DequeueTimeout:
+                continue
+            except redis.exceptions.ConnectionError as exc:
+                logger.error(f"Could not connect to Redis: {exc}")
+                time.sleep(SLOT_POLL_INTERVAL)
+                continue
+
+            if result is not None:
+                job, queue = result
+                job.redis_server_version = self.get_redis_server_version()
+                logger.info(f"{queue.name}: {job.description} ({job.id})")
+                self.heartbeat()
+                return result
+            if timeout is None:
+                if not has_full_queue:
+                    return None
+                # burst: queues with capacity are empty, wait for running ones
+                with self.slot_freed:
+                    self.slot_freed.wait(SLOT_POLL_INTERVAL)
+
+    def execute_job(self, job: Job, queue: Queue):
+        """Start job in the pool, returning as soon as another one can be"""
+        with self.slot_freed:
+            self.running[queue.name] += 1
+        self.executor.submit(self.perform_job_in_thread, job, queue)
+
+    def perform_job_in_thread(self, job: Job, queue: Queue):
+        try:
+            self.perform_job(job, queue)
+        except Exception as exc:
+            logger.exception(exc)
+        finally:
+            with self.slot_freed:
+                self.running[queue.name] -= 1
+                self.slot_freed.notify_all()
+
+    def teardown(self):
+        # warm shutdown: running jobs are completed
+        self.executor.shutdown(wait=True)
+        super().teardown()
+
+
+def parse_queue_arg(value: str) -> tuple[str, int]:
+    """queue name and its concurrency from `name[:concurrency]`"""
+    name, _, concurrency = value.partition(":")
+    try:
+        return name, int(concurrency or constants.worker_concurrency)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(f"Invalid concurrency in {value}") from exc
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        prog="rq-worker", description="Run jobs requested by the API"
+    )
+    parser.add_argument(
+        "queues",
+        nargs="*",
+        type=parse_queue_arg,
+        default=[parse_queue_arg(queue.name) for queue in worked_queues],
+        help="Queues to listen on, in order of priority, as name[:concurrency]. "
+        "Defaults to all the API's queues (and the legacy one). "
+        "Concurrency defaults to WORKER_CONCURRENCY",
+    )
+    parser.add_argument(
+        "--burst",
+        action="store_true",
+        help="Quit once queues are empty instead of waiting for jobs",
+    )
+    args = parser.parse_args()
+
+    concurrency = dict(args.queues)
+    worker_queues = [Queue(name, connection=redis_conn) for name in concurrency]
+    if max(concurrency.values()) > 1:
+        worker = ThreadPoolWorker(
+            worker_queues, concurrency=concurrency, connection=redis_conn
+        )
+    else:
+        worker = WarmWorker(worker_queues, connection=redis_conn)
+    worker.warm_up()
+    worker.work(
+        burst=args.burst,
+        with_scheduler=True,
+        logging_level="DEBUG" if constants.debug else "INFO",
+    )
+
+
+if __name__ == "__main__":
+    run()
@@ -1,3 +1,4 @@
+import contextlib
 import datetime
 import json
 import logging
@@ -8,8 +9,11 @@ from uuid import UUID, uuid4
 
 import requests
 from pydantic import BaseModel
+from redis.exceptions import LockError, RedisError
+from requests.adapters import HTTPAdapter
 
 from api.constants import constants
+from api.store import maintenance_queue, redis_conn
 
 GET = "GET"
 POST = "POST"
@@ -18,6 +22,30 @@ DELETE = "DELETE"
 
 logger = logging.getLogger(__name__)
 
+# Redis key of tokens shared by API and worker processes, and of its renewal lock
+TOKEN_KEY = "zimfarm-token"
+TOKEN_LOCK_NAME = "zimfarm-token-lock"
+# tokens are renewed that much before they expire
+TOKEN_RENEWAL_MARGIN = datetime.timedelta(minutes=2)
+
+
+def get_session() -> requests.Session:
+    """HTTP session to Zimfarm API, keeping its connections alive
+
+    Requests beyond the max number of connections wait for one to be free"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=constants.zimfarm_max_connections,
+        pool_block=True,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+session = get_session()
+
 
 @dataclass(kw_only=True)
 class RequestSchema:
@@ -48,7 +76,9 @@ class WebhookPayload(BaseModel):
 
 
 class TokenData:
-    """In-memory persistence of ZF credentials"""
+    """In-memory persistence of ZF credentials
+
+    Shared with other processes through Redis"""
 
     ACCESS_TOKEN: str = ""
     ACCESS_TOKEN_EXPIRY: datetime.datetime = datetime.datetime(
@@ -59,6 +89,63 @@ class TokenData:
         2000, 1, 1, tzinfo=datetime.UTC
     )
 
+    @classmethod
+    def reset(cls):
+        cls.ACCESS_TOKEN = cls.REFRESH_TOKEN = ""
+        cls.ACCESS_TOKEN_EXPIRY = cls.REFRESH_TOKEN_EXPIRY = datetime.datetime(
+            2000, 1, 1, tzinfo=datetime.UTC
+        )
+
+    @classmethod
+    def update(cls, access_token: str, refresh_token: str):
+        """record newly issued tokens"""
+        now = datetime.datetime.now(tz=datetime.UTC)
+        cls.ACCESS_TOKEN, cls.REFRESH_TOKEN = access_token, refresh_token
+        cls.ACCESS_TOKEN_EXPIRY = now + datetime.timedelta(minutes=59)
+        cls.REFRESH_TOKEN_EXPIRY = now + datetime.timedelta(days=29)
+
+    @classmethod
+    def has_valid_access_token(cls) -> bool:
+        return bool(cls.ACCESS_TOKEN) and cls.ACCESS_TOKEN_EXPIRY > (
+            datetime.datetime.now(tz=datetime.UTC) + TOKEN_RENEWAL_MARGIN
+        )
+
+    @classmethod
+    def has_valid_refresh_token(cls) -> bool:
+        return bool(cls.REFRESH_TOKEN) and cls.REFRESH_TOKEN_EXPIRY > (
+            datetime.datetime.now(tz=datetime.UTC) + TOKEN_RENEWAL_MARGIN
+        )
+
+    @classmethod
+    def load(cls) -> bool:
+        """Update from tokens shared in Redis, returning whether there were some"""
+        shared = redis_conn.get(TOKEN_KEY)
+        if not shared:
+            return False
+        data = json.loads(shared)
+        cls.ACCESS_TOKEN, cls.REFRESH_TOKEN = data["access"], data["refresh"]
+        cls.ACCESS_TOKEN_EXPIRY = datetime.datetime.fromisoformat(data["access_expiry"])
+        cls.REFRESH_TOKEN_EXPIRY = datetime.datetime.fromisoformat(
+            data["refresh_expiry"]
+        )
+        return True
+
+    @classmethod
+    def save(cls):
+        """Share tokens in Redis, until refresh token expires"""
+        redis_conn.set(
+            TOKEN_KEY,
+            json.dumps(
+                {
+                    "access": cls.ACCESS_TOKEN,
+                    "access_expiry": cls.ACCESS_TOKEN_EXPIRY.isoformat(),
+                    "refresh": cls.REFRESH_TOKEN,
+                    "refresh_expiry": cls.REFRESH_TOKEN_EXPIRY.isoformat(),
+                }
+            ),
+            exat=cls.REFRESH_TOKEN_EXPIRY,
+        )
+
 
 class ZimfarmAPIError(Exception):
     def __init__(self, message: str, code: int = -1) -> None:
@@ -89,7 +176,7 @@ def get_token_headers(token: str) -> dict[str, str]:
 
 
 def get_token(username: str, password: str) -> tuple[str, str]:
-    req = requests.post(
+    req = session.post(
         url=get_url("/auth/authorize"),
         headers={
             "username": username,
@@ -102,34 +189,80 @@ def get_token(username: str, password: str) -> tuple[str, str]:
     return req.json().get("access_token", ""), req.json().get("refresh_token", "")
 
 
-def authenticate(*, force: bool = False):
-    if (
-        not force
-        and TokenData.ACCESS_TOKEN
-        and TokenData.ACCESS_TOKEN_EXPIRY
-        > datetime.datetime.now(tz=datetime.UTC) + datetime.timedelta(minutes=2)
-    ):
-        return
+def get_refreshed_token(refresh_token: str) -> tuple[str, str]:
+    req = session.post(
+        url=get_url("/auth/token"),
+        headers={
+            "refresh-token": refresh_token,
+            "Content-type": "application/json",
+        },
+        timeout=constants.zimfarm_request_timeout_sec,
+    )
+    req.raise_for_status()
+    return req.json().get("access_token", ""), req.json().get("refresh_token", "")
+
 
-    logger.debug(f"authenticate() with {force=}")
+def renew_token():
+    """Renew tokens using refresh token if valid, credentials otherwise"""
+    if TokenData.has_valid_refresh_token():
+        try:
+            TokenData.update(*get_refreshed_token(TokenData.REFRESH_TOKEN))
+            return
+        except Exception as exc:
+            logger.warning(f"Unable to refresh token, authorizing again: {exc!s}")
 
     try:
         access_token, refresh_token = get_token(
             username=constants.zimfarm_username, password=constants.zimfarm_password
         )
     except Exception:
-        TokenData.ACCESS_TOKEN = TokenData.REFRESH_TOKEN = ""
-        TokenData.ACCESS_TOKEN_EXPIRY = datetime.datetime(
-            2000, 1, 1, tzinfo=datetime.UTC
-        )
+        TokenData.reset()
     else:
-        TokenData.ACCESS_TOKEN, TokenData.REFRESH_TOKEN = access_token, refresh_token
-        TokenData.ACCESS_TOKEN_EXPIRY = datetime.datetime.now(
-            tz=datetime.UTC
-        ) + datetime.timedelta(minutes=59)
-        TokenData.REFRESH_TOKEN_EXPIRY = datetime.datetime.now(
-            tz=datetime.UTC
-        ) + datetime.timedelta(days=29)
+        TokenData.update(access_token, refresh_token)
+
+
+def authenticate(*, force: bool = False):
+    """Ensure TokenData has a valid access token, renewing it if needed
+
+    Tokens are shared by all processes through Redis: renewal is done by one
+    of them (holding a lock) and the others reuse its tokens.
+    With force, current access token is considered rejected"""
+    if not force and TokenData.has_valid_access_token():
+        return
+
+    rejected_token = TokenData.ACCESS_TOKEN if force else None
+
+    def has_usable_token() -> bool:
+        return (
+            TokenData.ACCESS_TOKEN != rejected_token
+            and TokenData.has_valid_access_token()
+        )
+
+    try:
+        if TokenData.load() and has_usable_token():
+            return
+
+        logger.debug(f"authenticate() with {force=}")
+        lock = redis_conn.lock(
+            TOKEN_LOCK_NAME, timeout=constants.zimfarm_request_timeout_sec * 3
+        )
+        if not lock.acquire(blocking_timeout=constants.zimfarm_request_timeout_sec * 3):
+            raise LockError("Timed out waiting for token renewal by another process")
+        try:
+            # renewed by another process while we waited for the lock
+            if TokenData.load() and has_usable_token():
+                return
+            renew_token()
+            if TokenData.ACCESS_TOKEN:
+                TokenData.save()
+        finally:
+            with contextlib.suppress(LockError):
+                lock.release()
+    except RedisError as exc:
+        # tokens can't be shared, renew them for this process only
+        logger.warning(f"Unable to share Zimfarm token via Redis: {exc!s}")
+        if not has_usable_token():
+            renew_token()
 
 
 def auth_required(func):
@@ -145,16 +278,13 @@ def query_api(
     method: str,
     path: str,
     payload: dict[str, str | list[str]] | None = None,
-    params: dict[str, str] | None = None,
+    params: dict[str, str | list[str]] | None = None,
 ) -> ZimfarmResponse:
-    func = {
-        GET: requests.get,
-        POST: requests.post,
-        PATCH: requests.patch,
-        DELETE: requests.delete,
-    }.get(method.upper(), requests.get)
+    if method.upper() not in (GET, POST, PATCH, DELETE):
+        method = GET
     try:
-        req = func(
+        req = session.request(
+            method=method.upper(),
             url=get_url(path),
             headers=get_token_headers(TokenData.ACCESS_TOKEN),
             json=payload,
@@ -201,9 +331,10 @@ def test_connection():
     return query_api(GET, "/auth/test")
 
 
-def request_task(
+def create_schedule(
     project_id: UUID, archive_id: UUID, request_def: RequestSchema, email: str | None
-) -> UUID:
+) -> str:
+    """Create a unique schedule for that request on the zimfarm, returning its name"""
     ident = uuid4().hex
 
     flags = {
@@ -268,7 +399,6 @@ def request_task(
             }
         )
 
-    # create a unique schedule for that request on the zimfarm
     success, status, resp = query_api("POST", "/schedules/", payload=payload)
     if not success:
         logger.error(f"Unable to create schedule via HTTP {status}: {resp}")
@@ -280,35 +410,88 @@ def request_task(
         else:
             # otherwise, this is most probably an internal problem in our systems
             raise ZimfarmAPIError(message, status)
+    return schedule_name
 
-    # request a task for that newly created schedule
+
+def request_tasks(schedule_names: list[str]) -> dict[str, UUID]:
+    """Request a task for each of those schedules, in a single call
+
+    Returns requested tasks' ID by schedule name. Schedules Zimfarm didn't
+    request a task for are missing"""
     success, status, resp = query_api(
         "POST",
         "/requested-tasks/",
         payload={
-            "schedule_names": [schedule_name],
+            "schedule_names": schedule_names,
             "worker": constants.zimfarm_task_worker,
             "priority": "6",
         },
     )
     if not success:
-        logger.error(f"Unable to request {schedule_name} via HTTP {status}: {resp}")
+        logger.error(f"Unable to request {schedule_names} via HTTP {status}: {resp}")
         raise ZimfarmAPIError(f"Unable to request schedule: {resp}", status)
 
     if not isinstance(resp, dict):
         raise ZimfarmAPIError(f"response is unexpected format ({type(resp)})")
 
     try:
-        task_id = resp["requested"].pop()
-        if not task_id:
-            raise ValueError(f"task_id is empty? `{task_id}`")
+        requested = [UUID(task_id) for task_id in resp["requested"]]
     except Exception as exc:
         raise ZimfarmAPIError(f"Couldn't retrieve requested task id: {exc!s}") from exc
 
-    # remove newly created schedule (not needed anymore)
+    # tasks are requested (and listed) in schedule_names order, skipping
+    # schedules that couldn't be
+    if len(requested) == len(schedule_names):
+        return dict(zip(schedule_names, requested, strict=True))
+
+    success, status, resp = query_api(
+        "GET",
+        "/requested-tasks/",
+        params={"schedule_name": schedule_names, "limit": str(len(schedule_names))},
+    )
+    if not success or not isinstance(resp, dict):
+        raise ZimfarmAPIError(f"Unable to list requested tasks: {resp}", status)
+    return {
+        item["schedule_name"]: UUID(item["_id"])
+        for item in resp.get("items", [])
+        if UUID(item["_id"]) in requested
+    }
+
+
+def request_task(
+    project_id: UUID, archive_id: UUID, request_def: RequestSchema, email: str | None
+) -> UUID:
+    schedule_name = create_schedule(
+        project_id=project_id,
+        archive_id=archive_id,
+        request_def=request_def,
+        email=email,
+    )
+
+    # request a task for that newly created schedule
+    try:
+        task_id = request_tasks([schedule_name]).get(schedule_name)
+        if not task_id:
+            raise ZimfarmAPIError(f"No task requested for {schedule_name}")
+    finally:
+        # remove newly created schedule (not needed anymore)
+        delete_schedules([schedule_name])
+    return task_id
+
+
+def delete_schedules(schedule_names: list[str]):
+    """Delete (requested) schedules, from a job if configured to"""
+    for schedule_name in schedule_names:
+        if constants.zimfarm_delete_schedule_in_background:
+            maintenance_queue.enqueue(delete_schedule, schedule_name)
+        else:
+            delete_schedule(schedule_name)
+
+
+def delete_schedule(schedule_name: str):
+    """Delete a (requested) schedule, logging failures"""
     success, status, resp = query_api("DELETE", f"/schedules/{schedule_name}")
     if not success:
         logger.error(
             f"Unable to remove schedule {schedule_name} via HTTP {status}: {resp}"
         )
-    return UUID(task_id)
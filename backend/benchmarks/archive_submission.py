@@ -0,0 +1,106 @@
+"""Latency of an archive submission's companion uploads: sequential vs concurrent
+
+Uploads an illustration, a main logo and a collection.json to a local S3
+stand-in (moto server, in its own process) the way submissions used to (one
+after the other, each checked for first) then as submit_archive does now
+(concurrently, content-addressed paths not checked for), and reports the time
+each takes before Zimfarm can be called.
+latency (eg. 50ms) is waited before each Storage request to mimic a distant one;
+autodelete, which moto doesn't support, is that wait only.
+
+Usage: python benchmarks/archive_submission.py [latency] [rounds]
+Requires moto[server] (pip install nautilus-api[bench]) and the same
+environment variables as the API (POSTGRES_URI, REDIS_URI, …)
+"""
+
+import datetime
+import io
+import logging
+import statistics
+import sys
+import time
+import uuid
+from types import SimpleNamespace
+
+import humanfriendly
+from kiwixstorage import KiwixStorage
+from worker_throughput import BUCKET_NAME, start_moto_server
+
+from api.files import generate_file_hash
+from api.routes import archives
+from api.storage import storage
+
+COMPANIONS = {
+    "illustration.png": b"\x89PNG" + b"\xff" * 2_000,
+    "main-logo.png": b"\x89PNG" + b"\xff" * 20_000,
+    "collection.json": b"[" + b'{"title": "a file"},' * 2_000 + b"{}]",
+}
+
+
+def with_latency(func, latency: float):
+    def delayed(*args, **kwargs):
+        time.sleep(latency)
+        return func(*args, **kwargs)
+
+    return delayed
+
+
+def sequential(project, companions: dict[str, bytes]):
+    for suffix, content in companions.items():
+        path = storage.get_companion_file_path(
+            project=project,
+            file_hash=generate_file_hash(io.BytesIO(content)),
+            suffix=suffix,
+        )
+        if storage.has(path):
+            continue
+        storage.upload_fileobj(fileobj=io.BytesIO(content), path=path)
+        storage.set_autodelete_on(path, project.expire_on)
+
+
+def concurrent(project, companions: dict[str, bytes]):
+    archives.upload_companions_to_storage(project=project, companions=companions)
+
+
+def main(latency: float, rounds: int):
+    logging.getLogger("api").setLevel(logging.WARNING)
+    server, port = start_moto_server()
+    storage._storage = KiwixStorage(  # pyright: ignore [reportAttributeAccessIssue]
+        f"http://localhost:{port}/?keyId=bench&secretAccessKey=bench"
+        f"&bucketName={BUCKET_NAME}"
+    )
+    storage.storage.client.create_bucket(Bucket=BUCKET_NAME)
+    for name in ("has", "upload_fileobj"):
+        setattr(storage, name, with_latency(getattr(storage, name), latency))
+    # Wasabi-only: its round-trip is only waited for
+    storage.set_autodelete_on = with_latency(  # pyright: ignore
+        lambda *_args: None, latency
+    )
+
+    print(f"{len(COMPANIONS)} companion files, {latency * 1000:.0f}ms latency")
+    print(f"{'method':>12} {'p50 (ms)':>9} {'max (ms)':>9}")
+    try:
+        for name, func in (("sequential", sequential), ("concurrent", concurrent)):
+            durations = []
+            for _ in range(rounds):
+                # a new project each round so nothing's already in Storage
+                project = SimpleNamespace(
+                    id=uuid.uuid4(),
+                    expire_on=datetime.datetime.now(tz=datetime.UTC)
+                    + datetime.timedelta(days=1),
+                )
+                start = time.perf_counter()
+                func(project, COMPANIONS)
+                durations.append(time.perf_counter() - start)
+            print(
+                f"{name:>12} {statistics.median(durations) * 1000:>9.1f} "
+                f"{max(durations) * 1000:>9.1f}"
+            )
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    defaults = ["50ms", "10"]
+    latency, rounds = sys.argv[1:] + defaults[len(sys.argv) - 1 :]
+    main(humanfriendly.parse_timespan(latency), int(rounds))
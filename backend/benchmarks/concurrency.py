@@ -0,0 +1,97 @@
+"""Latency of /ping while uploads are running on the same event loop
+
+Starts N concurrent uploads of SIZE against the in-process app and keeps
+pinging /ping until they complete, then reports /ping latency percentiles.
+The rq queues are bypassed (enqueue is a no-op) so only the API is measured.
+
+Usage: python benchmarks/concurrency.py [N] [SIZE]
+Requires the same environment variables as the API (POSTGRES_URI, …)
+"""
+
+import asyncio
+import statistics
+import sys
+import time
+
+import humanfriendly
+from httpx import ASGITransport, AsyncClient
+
+from api.constants import constants
+from api.entrypoint import app
+from api.store import queues
+
+prefix = constants.api_version_prefix
+
+
+async def ping_until(client: AsyncClient, done: asyncio.Event) -> list[float]:
+    latencies = []
+    while not done.is_set():
+        start = time.perf_counter()
+        await client.get(f"{prefix}/ping")
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.005)
+    return latencies
+
+
+async def upload(client: AsyncClient, project_id: str, data: bytes):
+    resp = await client.post(
+        f"{prefix}/projects/{project_id}/files", files={"uploaded_file": data}
+    )
+    resp.raise_for_status()
+
+
+def skip_enqueue(*_args, **_kwargs):
+    return None
+
+
+async def main(nb_uploads: int, size: int):
+    for queue in queues:
+        queue.enqueue = skip_enqueue  # pyright: ignore
+    # distinct contents so no upload is skipped as a duplicate
+    payloads = [bytes([index % 256]) * size for index in range(nb_uploads)]
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://localhost"
+    ) as client:
+        resp = await client.post(f"{prefix}/users")
+        client.cookies = {"user_id": resp.json()["id"]}
+        project_ids = []
+        for index in range(nb_uploads):
+            resp = await client.post(f"{prefix}/projects", json={"name": f"b{index}"})
+            project_ids.append(resp.json()["id"])
+
+        done = asyncio.Event()
+        pinger = asyncio.create_task(ping_until(client, done))
+        start = time.perf_counter()
+        await asyncio.gather(
+            *[
+                upload(client, project_id, data)
+                for project_id, data in zip(project_ids, payloads, strict=True)
+            ]
+        )
+        duration = time.perf_counter() - start
+        done.set()
+        latencies = await pinger
+
+        for project_id in project_ids:
+            await client.delete(f"{prefix}/projects/{project_id}")
+
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    print(
+        f"{nb_uploads} uploads of {humanfriendly.format_size(size, binary=True)} "
+        f"in {duration:.2f}s"
+    )
+    print(
+        f"/ping x{len(latencies)}: p50={quantiles[49] * 1000:.1f}ms "
+        f"p99={quantiles[98] * 1000:.1f}ms max={max(latencies) * 1000:.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(
+        main(
+            nb_uploads=int(args[0]) if args else 4,
+            size=humanfriendly.parse_size(args[1] if len(args) > 1 else "20MiB"),
+        )
+    )
@@ -0,0 +1,92 @@
+"""Bytes read from the uploaded body per uploaded byte, legacy vs single-pass
+
+Compares the former create_file() sequence (size, mimetype sniff, hash, save)
+with the MultipartIngestor create_file() now streams the request body into,
+on in-memory files of the requested sizes.
+
+Usage: python benchmarks/ingest.py [size …] (humanfriendly sizes, eg. 100MiB)
+Requires the same environment variables as the API (POSTGRES_URI, …)
+"""
+
+import asyncio
+import io
+import sys
+import time
+import uuid
+
+import humanfriendly
+from zimscraperlib import filesystem
+
+from api.constants import constants
+from api.files import calculate_file_size, generate_file_hash, save_file
+from api.multipart import MultipartIngestor
+
+BOUNDARY = "benchmark-boundary"
+
+
+class CountingReader(io.BytesIO):
+    """BytesIO that records how many bytes were read from it"""
+
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size: int | None = -1) -> bytes:
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+def legacy(reader: CountingReader, _project_id: uuid.UUID):
+    calculate_file_size(reader)
+    filesystem.get_content_mimetype(reader.read(2048))
+    reader.seek(0)
+    file_hash = generate_file_hash(reader)
+    save_file(reader, file_hash).unlink()
+
+
+async def stream_body(reader: CountingReader):
+    """reader's content as a multipart body, received as request.stream() does"""
+    yield (
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; "
+        'name="uploaded_file"; filename="bench.bin"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode()
+    while chunk := reader.read(constants.chunk_size):
+        yield chunk
+    yield f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def single_pass(reader: CountingReader, project_id: uuid.UUID):
+    ingestor = MultipartIngestor(
+        f"multipart/form-data; boundary={BOUNDARY}",
+        project_id=project_id,
+        field_name="uploaded_file",
+        max_size=constants.project_quota,
+    )
+    for received in asyncio.run(ingestor.parse(stream_body(reader))):
+        if received.ingested:
+            received.ingested.discard()
+
+
+def main(sizes: list[int]):
+    project_id = uuid.uuid4()
+    print(f"{'size':>10} {'method':>12} {'read/byte':>10} {'seconds':>8}")
+    for size in sizes:
+        data = b"\xff" * size
+        for name, func in (("legacy", legacy), ("single-pass", single_pass)):
+            reader = CountingReader(data)
+            start = time.perf_counter()
+            func(reader, project_id)
+            duration = time.perf_counter() - start
+            print(
+                f"{humanfriendly.format_size(size, binary=True):>10} {name:>12} "
+                f"{reader.bytes_read / size:>10.2f} {duration:>8.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main(
+        [humanfriendly.parse_size(arg) for arg in sys.argv[1:]]
+        or [humanfriendly.parse_size(size) for size in ("1MiB", "10MiB", "100MiB")]
+    )
@@ -0,0 +1,177 @@
+"""Requests/sec of GET /projects/{id}/files: blocking vs async DB sessions
+
+Seeds a project with files then has concurrent clients list them, for a while,
+against the in-process app: first with blocking sessions as routes used to
+(lookups in the thread pool, files loaded on the event loop) then with the
+async ones they now use. Reports requests/sec and latency percentiles.
+latency (eg. 1ms) is waited before each SQL statement to mimic a distant DB.
+
+Usage: python benchmarks/project_files.py [latency] [clients] [duration] [files]
+Requires the same environment variables as the API (POSTGRES_URI, …)
+"""
+
+import asyncio
+import datetime
+import statistics
+import sys
+import time
+from typing import Annotated
+from uuid import UUID
+
+import humanfriendly
+import psycopg
+from fastapi import Cookie, Depends
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import select
+from sqlalchemy.orm import Session as OrmSession
+from starlette.routing import Mount
+
+from api.constants import constants
+from api.database import Session
+from api.database.models import File, Project, User
+from api.entrypoint import app
+from api.routes import validated_project
+
+prefix = constants.api_version_prefix
+# where routes (and their dependencies) are: the app mounted at prefix
+api = next(route.app for route in app.routes if isinstance(route, Mount))
+
+
+def gen_blocking_session():
+    with Session.begin() as session:
+        yield session
+
+
+def blocking_validated_user(
+    user_id: Annotated[UUID, Cookie()],
+    session: OrmSession = Depends(gen_blocking_session),
+) -> User:
+    return session.execute(select(User).filter_by(id=user_id)).scalar_one()
+
+
+def blocking_validated_project(
+    project_id: UUID,
+    user: User = Depends(blocking_validated_user),
+    session: OrmSession = Depends(gen_blocking_session),
+) -> Project:
+    stmt = select(Project).filter_by(id=project_id).filter_by(user_id=user.id)
+    return session.execute(stmt).scalar_one()
+
+
+def add_latency(latency: float):
+    execute, async_execute = psycopg.Cursor.execute, psycopg.AsyncCursor.execute
+
+    def delayed(self, *args, **kwargs):
+        time.sleep(latency)
+        return execute(self, *args, **kwargs)
+
+    async def async_delayed(self, *args, **kwargs):
+        await asyncio.sleep(latency)
+        return await async_execute(self, *args, **kwargs)
+
+    psycopg.Cursor.execute = delayed  # pyright: ignore
+    psycopg.AsyncCursor.execute = async_delayed  # pyright: ignore
+
+
+def create_project(nb_files: int) -> tuple[UUID, UUID]:
+    now = datetime.datetime.now(tz=datetime.UTC)
+    with Session.begin() as session:
+        user = User(created_on=now, projects=[])
+        project = Project(
+            name="bench",
+            created_on=now,
+            expire_on=None,
+            webdav_path=None,
+            files=[
+                File(
+                    filename=f"file{index}.txt",
+                    filesize=1024,
+                    title=f"file{index}.txt",
+                    authors=None,
+                    description=None,
+                    uploaded_on=now,
+                    hash=f"{index:064x}",
+                    path=f"/file{index}.txt",
+                    type="text/plain",
+                    status="STORAGE",
+                    order=index,
+                )
+                for index in range(nb_files)
+            ],
+            archives=[],
+        )
+        user.projects.append(project)
+        session.add(user)
+        session.flush()
+        return user.id, project.id
+
+
+def delete_user(user_id: UUID):
+    with Session.begin() as session:
+        session.delete(session.get(User, user_id))
+
+
+async def request_until(client: AsyncClient, url: str, end: float) -> list[float]:
+    durations = []
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        resp = await client.get(url)
+        resp.raise_for_status()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+async def main(latency: float, nb_clients: int, duration: float, nb_files: int):
+    add_latency(latency)
+    user_id, project_id = create_project(nb_files)
+    url = f"{prefix}/projects/{project_id}/files"
+
+    print(
+        f"{nb_files} files, {nb_clients} clients for {duration:.0f}s, "
+        f"{latency * 1000:.0f}ms DB latency"
+    )
+    print(f"{'sessions':>10} {'req/s':>8} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    try:
+        async with AsyncClient(
+            transport=ASGITransport(app=app),
+            base_url="http://localhost",
+            cookies={"user_id": str(user_id)},
+        ) as client:
+            for name, overrides in (
+                ("blocking", {validated_project: blocking_validated_project}),
+                ("async", {}),
+            ):
+                api.dependency_overrides = overrides  # pyright: ignore
+                # warm-up: connections in pools, statements compiled
+                await request_until(client, url, time.perf_counter() + 1)
+                end = time.perf_counter() + duration
+                durations = [
+                    value
+                    for values in await asyncio.gather(
+                        *[request_until(client, url, end) for _ in range(nb_clients)]
+                    )
+                    for value in values
+                ]
+                quantiles = statistics.quantiles(durations, n=100, method="inclusive")
+                print(
+                    f"{name:>10} {len(durations) / duration:>8.1f} "
+                    f"{quantiles[49] * 1000:>9.1f} {quantiles[98] * 1000:>9.1f}"
+                )
+    finally:
+        api.dependency_overrides = {}  # pyright: ignore
+        delete_user(user_id)
+
+
+if __name__ == "__main__":
+    defaults = ["1ms", "20", "10s", "50"]
+    latency, nb_clients, duration, nb_files = (
+        sys.argv[1:] + defaults[len(sys.argv) - 1 :]
+    )
+    asyncio.run(
+        main(
+            humanfriendly.parse_timespan(latency),
+            int(nb_clients),
+            humanfriendly.parse_timespan(duration),
+            int(nb_files),
+        )
+    )
@@ -0,0 +1,89 @@
+"""S3 upload throughput: single PUT vs boto3 managed transfer vs our multipart
+
+Uploads a file of each requested size to a local S3 stand-in (moto server)
+with each method and reports duration and throughput.
+Part size and concurrency of the multipart mode come from the usual
+S3_PART_SIZE and S3_UPLOAD_WORKERS environment variables.
+
+Usage: python benchmarks/s3_upload.py [size …] (humanfriendly sizes, eg. 1GiB)
+Requires moto[server] (pip install nautilus-api[bench]) and the same
+environment variables as the API (POSTGRES_URI, …)
+"""
+
+import logging
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import humanfriendly
+from kiwixstorage import KiwixStorage
+from moto.server import ThreadedMotoServer
+
+from api.storage.s3 import S3Storage
+
+BUCKET_NAME = "bench"
+
+
+def single_put(storage: S3Storage, fpath: Path, key: str):
+    with open(fpath, "rb") as fh:
+        storage.storage.client.put_object(
+            Bucket=storage.storage.bucket_name, Key=key, Body=fh
+        )
+
+
+def managed_transfer(storage: S3Storage, fpath: Path, key: str):
+    storage.storage.upload_file(fpath=fpath, key=key)
+
+
+def multipart(storage: S3Storage, fpath: Path, key: str):
+    storage.upload_file_multipart(fpath=fpath, path=key)
+
+
+def main(sizes: list[int]):
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = ThreadedMotoServer(port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    storage = S3Storage()
+    storage._storage = KiwixStorage(  # pyright: ignore [reportAttributeAccessIssue]
+        f"http://{host}:{port}/?keyId=bench&secretAccessKey=bench"
+        f"&bucketName={BUCKET_NAME}"
+    )
+    storage.storage.client.create_bucket(Bucket=BUCKET_NAME)
+
+    methods: tuple[tuple[str, Callable[[S3Storage, Path, str], None]], ...] = (
+        ("single-put", single_put),
+        ("managed", managed_transfer),
+        ("multipart", multipart),
+    )
+    print(f"{'size':>10} {'method':>12} {'seconds':>8} {'MiB/s':>8}")
+    try:
+        for size in sizes:
+            with tempfile.NamedTemporaryFile() as fh:
+                for _ in range(0, size, 2**20):
+                    fh.write(b"\xff" * min(2**20, size - fh.tell()))
+                fh.flush()
+                for name, func in methods:
+                    start = time.perf_counter()
+                    func(storage, Path(fh.name), f"{name}-{size}")
+                    duration = time.perf_counter() - start
+                    print(
+                        f"{humanfriendly.format_size(size, binary=True):>10} "
+                        f"{name:>12} {duration:>8.3f} "
+                        f"{size / 2**20 / duration:>8.1f}"
+                    )
+                    storage.delete(f"{name}-{size}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main(
+        [humanfriendly.parse_size(arg) for arg in sys.argv[1:]]
+        or [
+            humanfriendly.parse_size(size)
+            for size in ("1MiB", "16MiB", "128MiB", "1GiB")
+        ]
+    )
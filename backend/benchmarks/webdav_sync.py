@@ -0,0 +1,103 @@
+"""Duration of a project's WebDAV refresh, by number of entries in its folder
+
+Refreshes a project from synthetic listings (the Storage is not queried):
+first its initial sync (all entries new) then a later one where a tenth of the
+entries changed (half removed, half added) and the others are updated.
+
+Usage: python benchmarks/webdav_sync.py [entries …]
+Requires the same environment variables as the API (POSTGRES_URI, …)
+"""
+
+import asyncio
+import datetime
+import sys
+import time
+from uuid import UUID
+
+from sqlalchemy import select
+
+from api.database import AsyncSession, Session
+from api.database.models import Project, User
+from api.routes import projects
+from api.storage import StorageEntry
+
+webdav_path = "bench"
+
+
+def gen_listing(names: range) -> list[StorageEntry]:
+    now = datetime.datetime.now(tz=datetime.UTC)
+    return [
+        StorageEntry(
+            path=f"{webdav_path}/file{index}.txt",
+            size=100,
+            mimetype="text/plain",
+            modified_on=now,
+            etag=None,
+        )
+        for index in names
+    ]
+
+
+def use_listing(entries: list[StorageEntry]):
+    async def has(path: str) -> bool:  # noqa: ARG001
+        return True
+
+    async def list_(prefix: str):  # noqa: ARG001
+        for entry in entries:
+            yield entry
+
+    projects.async_storage.has = has  # pyright: ignore
+    projects.async_storage.list = list_  # pyright: ignore
+
+
+def create_project() -> tuple[UUID, UUID]:
+    now = datetime.datetime.now(tz=datetime.UTC)
+    with Session.begin() as session:
+        user = User(created_on=now, projects=[])
+        project = Project(
+            name="bench",
+            created_on=now,
+            expire_on=None,
+            webdav_path=webdav_path,
+            files=[],
+            archives=[],
+        )
+        user.projects.append(project)
+        session.add(user)
+        session.flush()
+        return user.id, project.id
+
+
+def delete_user(user_id: UUID):
+    with Session.begin() as session:
+        session.delete(session.get(User, user_id))
+
+
+async def refresh(project_id: UUID) -> float:
+    start = time.perf_counter()
+    async with AsyncSession.begin() as session:
+        project = (
+            await session.execute(select(Project).filter_by(id=project_id))
+        ).scalar_one()
+        await projects.update_project_files_from_webdav(session, project)
+    return time.perf_counter() - start
+
+
+async def main(sizes: list[int]):
+    print(f"{'entries':>8} {'initial (s)':>12} {'refresh (s)':>12}")
+    for size in sizes:
+        user_id, project_id = create_project()
+        try:
+            use_listing(gen_listing(range(size)))
+            initial = await refresh(project_id)
+            # first 5% removed, as many new ones, others updated
+            changed = size // 20
+            use_listing(gen_listing(range(changed, size + changed)))
+            later = await refresh(project_id)
+        finally:
+            delete_user(user_id)
+        print(f"{size:>8} {initial:>12.2f} {later:>12.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main([int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 100_000]))
@@ -0,0 +1,118 @@
+"""rq worker throughput on storage jobs: one job at a time vs thread pool
+
+Runs a burst of jobs, each uploading then deleting a small object on a local S3
+stand-in (moto server, in its own process so it doesn't compete with the
+worker's threads), with a WarmWorker then ThreadPoolWorkers of increasing
+concurrency, and reports jobs per second.
+moto answers from loopback in a few ms and is itself CPU-bound: latency (eg. 50ms)
+is waited before each Storage request to mimic a distant Storage.
+
+Usage: python benchmarks/worker_throughput.py [nb_jobs] [object size] [latency]
+Requires moto[server] (pip install nautilus-api[bench]), a Redis server and the
+same environment variables as the API (POSTGRES_URI, REDIS_URI, …)
+"""
+
+import io
+import logging
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+import humanfriendly
+from kiwixstorage import KiwixStorage
+from rq import Queue
+
+from api.storage import storage
+from api.store import redis_conn
+from api.worker import ThreadPoolWorker, WarmWorker
+
+BUCKET_NAME = "bench"
+QUEUE_NAME = "bench-worker"
+CONCURRENCIES = (4, 16, 32)
+
+
+def upload_and_delete(size: int, latency: float):
+    key = f"bench-{uuid.uuid4().hex}"
+    time.sleep(latency)
+    storage.upload_fileobj(fileobj=io.BytesIO(b"\xff" * size), path=key)
+    time.sleep(latency)
+    storage.delete(key)
+
+
+def run_burst(
+    worker: WarmWorker, queue: Queue, nb_jobs: int, size: int, latency: float
+) -> float:
+    queue.empty()
+    queue.enqueue_many(
+        [Queue.prepare_data(upload_and_delete, (size, latency)) for _ in range(nb_jobs)]
+    )
+    start = time.perf_counter()
+    worker.work(burst=True, logging_level="WARNING")
+    return time.perf_counter() - start
+
+
+def start_moto_server() -> tuple[subprocess.Popen, int]:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        port = sock.getsockname()[1]
+    server = subprocess.Popen(
+        [sys.executable, "-m", "moto.server", "-p", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    while True:
+        try:
+            socket.create_connection(("localhost", port)).close()
+            return server, port
+        except ConnectionRefusedError:
+            time.sleep(0.1)
+
+
+def main(nb_jobs: int, size: int, latency: float):
+    logging.getLogger("api").setLevel(logging.WARNING)
+    server, port = start_moto_server()
+    storage._storage = KiwixStorage(  # pyright: ignore [reportAttributeAccessIssue]
+        f"http://localhost:{port}/?keyId=bench&secretAccessKey=bench"
+        f"&bucketName={BUCKET_NAME}"
+    )
+    storage.storage.client.create_bucket(Bucket=BUCKET_NAME)
+    queue = Queue(QUEUE_NAME, connection=redis_conn)
+
+    workers: list[tuple[str, WarmWorker]] = [
+        ("single", WarmWorker([queue], connection=redis_conn))
+    ]
+    workers += [
+        (
+            f"threads:{concurrency}",
+            ThreadPoolWorker(
+                [queue],
+                concurrency={QUEUE_NAME: concurrency},
+                connection=redis_conn,
+            ),
+        )
+        for concurrency in CONCURRENCIES
+    ]
+    print(
+        f"{nb_jobs} jobs of {humanfriendly.format_size(size, binary=True)}, "
+        f"{latency * 1000:.0f}ms latency"
+    )
+    print(f"{'worker':>12} {'seconds':>8} {'jobs/s':>8}")
+    try:
+        for name, worker in workers:
+            duration = run_burst(worker, queue, nb_jobs, size, latency)
+            print(f"{name:>12} {duration:>8.3f} {nb_jobs / duration:>8.1f}")
+    finally:
+        queue.delete(delete_jobs=True)
+        server.terminate()
+
+
+if __name__ == "__main__":
+    defaults = ["200", "64KiB", "0s"]
+    nb_jobs, size, latency = sys.argv[1:] + defaults[len(sys.argv) - 1 :]
+    main(
+        int(nb_jobs),
+        humanfriendly.parse_size(size),
+        humanfriendly.parse_timespan(latency),
+    )
@@ -8,11 +8,12 @@ from io import BytesIO
 from pathlib import Path
 from typing import Any
 
+import fakeredis
 import pytest  # pyright: ignore [reportMissingImports]
-import requests
 from httpx import AsyncClient
 from starlette.testclient import TestClient
 
+from api import store, zimfarm
 from api.database import Session
 from api.database.models import (
     Archive,
@@ -22,8 +23,17 @@ from api.database.models import (
     Project,
     User,
 )
+from api.database.utils import (
+    adjust_project_space,
+    purge_blobs,
+    reference_blob,
+    release_blobs,
+    reserve_project_space,
+)
 from api.entrypoint import app
 from api.files import save_file
+from api.routes import files
+from api.storage import s3
 
 pytestmark = pytest.mark.asyncio(scope="package")
 
@@ -106,7 +116,7 @@ def logged_in_client(client, user_id: str) -> str:
 @pytest.fixture()
 def file_id(project_id, test_file, test_file_hash):
     now = datetime.datetime.now(datetime.UTC)
-    location = save_file(BytesIO(test_file), test_file_hash, project_id)
+    location = save_file(BytesIO(test_file), test_file_hash)
     new_file = File(
         filename="test filename",
         filesize=123,
@@ -125,6 +135,8 @@ def file_id(project_id, test_file, test_file_hash):
         if project:
             project.files.append(new_file)
         session.add(new_file)
+        reference_blob(session, file_hash=test_file_hash, filesize=123, expire_on=None)
+        reserve_project_space(session, project_id, filesize=123)
         session.flush()
         session.refresh(new_file)
         created_id = new_file.id
@@ -135,6 +147,8 @@ def file_id(project_id, test_file, test_file_hash):
             file_location = Path(file.path)
             if file_location.exists():
                 os.remove(file_location)
+            purge_blobs(session, release_blobs(session, [file.hash]))
+            adjust_project_space(session, project_id, filesize=-123, count=-1)
             session.delete(file)
 
 
@@ -184,6 +198,9 @@ def project_id(test_project_name, user_id):
     with Session.begin() as session:
         project = session.get(Project, created_id)
         if project:
+            purge_blobs(
+                session, release_blobs(session, [file.hash for file in project.files])
+            )
             session.delete(project)
 
 
@@ -292,6 +309,15 @@ def expiring_archive_id(test_archive_name, expiring_project_id):
             session.delete(archive)
 
 
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """In-memory Redis in place of the API's one, for locks and jobs"""
+    conn = fakeredis.FakeRedis()
+    for module in (store, files, s3):
+        monkeypatch.setattr(module, "redis_conn", conn)
+    return conn
+
+
 class FakeKiwixStorage:
     def check_credentials(self, *args, **kwargs):
         print("FAKE::KiwixStorage::check_credentials")
@@ -346,7 +372,7 @@ def successful_storage_upload_file(monkeypatch):
         self, project: Project, file_hash: str, suffix: str
     ) -> str:
         print("FAKE::S3Storage::fake_get_companion_file_path")
-        return suffix
+        return f"{file_hash}_{suffix}"
 
     from api.storage.s3 import S3Storage
 
@@ -364,6 +390,35 @@ def successful_storage_upload_file(monkeypatch):
         S3Storage, "get_companion_file_path", fake_get_companion_file_path
     )
 
+    async def fake_async_upload_fileobj(*args, **kwargs): ...
+
+    async def fake_async_set_autodelete_on(*args, **kwargs): ...
+
+    async def fake_async_has(*args, **kwargs):
+        print("FAKE::AsyncS3Storage::has")
+        return False
+
+    async def fake_async_delete(*args, **kwargs): ...
+
+    async def fake_async_list(self, prefix: str):
+        for entry in ():
+            yield entry
+
+    async def fake_async_mkdir(
+        self, path: str, *, parents: bool = True, exists_ok: bool = True
+    ): ...
+
+    from api.storage.s3 import AsyncS3Storage
+
+    monkeypatch.setattr(AsyncS3Storage, "upload_fileobj", fake_async_upload_fileobj)
+    monkeypatch.setattr(
+        AsyncS3Storage, "set_autodelete_on", fake_async_set_autodelete_on
+    )
+    monkeypatch.setattr(AsyncS3Storage, "has", fake_async_has)
+    monkeypatch.setattr(AsyncS3Storage, "delete", fake_async_delete)
+    monkeypatch.setattr(AsyncS3Storage, "list", fake_async_list)
+    monkeypatch.setattr(AsyncS3Storage, "mkdir", fake_async_mkdir)
+
     yield True
 
 
@@ -412,21 +467,19 @@ class ScheduleDeletedResponse(SuccessfulRequestResponse):
 
 @pytest.fixture
 def successful_zimfarm_request_task(monkeypatch):
-    """Requests.get() mocked to return {'mock_key':'mock_response'}."""
+    """Zimfarm session's requests mocked to return successful responses."""
 
-    def requests_post(**kwargs):
-        uri = urllib.parse.urlparse(kwargs.get("url"))
-        if uri.path == "/v1/auth/authorize":
+    def session_request(method, url, **kwargs):
+        uri = urllib.parse.urlparse(url)
+        if method == "POST" and uri.path == "/v1/auth/authorize":
             return SuccessfulAuthResponse()
-        if uri.path == "/v1/schedules/":
+        if method == "POST" and uri.path == "/v1/schedules/":
             return ScheduleCreatedResponse()
-        if uri.path == "/v1/requested-tasks/":
+        if method == "POST" and uri.path == "/v1/requested-tasks/":
             return TaskRequestedResponse()
-        raise ValueError(f"Unhandled {kwargs}")
-
-    def requests_delete(*args, **kwargs):
-        return ScheduleDeletedResponse()
+        if method == "DELETE" and uri.path.startswith("/v1/schedules/"):
+            return ScheduleDeletedResponse()
+        raise ValueError(f"Unhandled {method} {url}")
 
-    monkeypatch.setattr(requests, "post", requests_post)
-    monkeypatch.setattr(requests, "delete", requests_delete)
+    monkeypatch.setattr(zimfarm.session, "request", session_request)
     yield True
@@ -1,10 +1,21 @@
+import datetime
+import io
+import json
 import uuid
 from http import HTTPStatus
 
 import pytest
 from httpx import AsyncClient
+from rq.exceptions import NoSuchJobError
+from rq.job import Job
 
+from api import zimfarm
 from api.constants import constants
+from api.database import Session as DBSession
+from api.database.models import Archive, ArchiveStatus
+from api.routes import archives
+from api.routes.archives import archives_queue, submit_archive
+from api.storage import storage
 
 
 def test_get_all_archive_correct_data(logged_in_client, project_id, archive_id):
@@ -40,6 +51,17 @@ def test_get_archive_correct_id(logged_in_client, project_id, archive_id):
     assert uuid.UUID(json_result.get("id"))
 
 
+def test_get_archive_single_query(
+    logged_in_client, project_id, archive_id, monkeypatch
+):
+    monkeypatch.setattr(constants, "debug", True)
+    response = logged_in_client.get(
+        f"{constants.api_version_prefix}/projects/{project_id}/archives/{archive_id}",
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["X-Query-Count"] == "1"
+
+
 def test_get_archive_wrong_id(logged_in_client, project_id, missing_archive_id):
     response = logged_in_client.get(
         f"{constants.api_version_prefix}/projects/{project_id}/archives/{missing_archive_id}",
@@ -239,11 +261,281 @@ async def test_request_archive_ready(
     expiring_archive_id,
     successful_storage_upload_file,
     successful_zimfarm_request_task,
+    mocker,
+    monkeypatch,
 ):
+    monkeypatch.setattr(constants, "zimfarm_batch_window", datetime.timedelta(0))
+    task_queue_mock = mocker.patch.object(archives_queue, "enqueue")
+    response = await alogged_in_client.post(
+        f"{constants.api_version_prefix}/projects/"
+        f"{expiring_project_id}/archives/{expiring_archive_id}/request",
+        json={"email": ""},
+    )
+    assert response.status_code == HTTPStatus.ACCEPTED
+    assert response.json()["status"] == ArchiveStatus.SUBMITTING
+    task_queue_mock.assert_called_once()
+    assert task_queue_mock.call_args.args == (submit_archive, str(expiring_archive_id))
 
+    # requested once only
     response = await alogged_in_client.post(
         f"{constants.api_version_prefix}/projects/"
         f"{expiring_project_id}/archives/{expiring_archive_id}/request",
         json={"email": ""},
     )
-    assert response.status_code == HTTPStatus.CREATED
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+    # companion files already in Storage (requested before) are not overwritten
+    has_mock = mocker.patch.object(storage, "has", return_value=True)
+    upload_mock = mocker.patch.object(storage, "upload_fileobj")
+    submit_archive(str(expiring_archive_id))
+    assert has_mock.call_count == 2
+    upload_mock.assert_not_called()
+    with DBSession.begin() as session:
+        archive = session.get(Archive, expiring_archive_id)
+        assert archive
+        assert archive.status == ArchiveStatus.REQUESTED
+        assert archive.zimfarm_task_id
+        assert archive.collection_json_path
+
+
+def test_upload_companion_already_in_storage(successful_storage_upload_file, mocker):
+    # not overwritten, whatever the Storage: objects are retention-locked
+    has_mock = mocker.patch.object(storage, "has", return_value=True)
+    upload_mock = mocker.patch.object(storage, "upload_fileobj")
+    archives.upload_companion_to_storage(
+        project=mocker.MagicMock(), file=io.BytesIO(b"{}"), storage_path="path"
+    )
+    has_mock.assert_called_once_with("path")
+    upload_mock.assert_not_called()
+
+
+def test_submit_archive_in_zimfarm_batch(
+    expiring_archive_id,
+    successful_storage_upload_file,
+    successful_zimfarm_request_task,
+    mocker,
+):
+    with DBSession.begin() as session:
+        archive = session.get(Archive, expiring_archive_id)
+        assert archive
+        archive.status = ArchiveStatus.SUBMITTING
+    redis_mock = mocker.patch.object(archives, "redis_conn")
+    enqueue_at_mock = mocker.patch.object(archives_queue, "enqueue_at")
+
+    submit_archive(str(expiring_archive_id))
+    with DBSession.begin() as session:
+        archive = session.get(Archive, expiring_archive_id)
+        assert archive
+        assert archive.status == ArchiveStatus.SUBMITTING
+    redis_mock.rpush.assert_called_once()
+    key, pending = redis_mock.rpush.call_args.args
+    assert key == archives.ZIMFARM_BATCH_KEY
+    enqueue_at_mock.assert_called_once()
+    assert enqueue_at_mock.call_args.args[1] == archives.submit_zimfarm_batch
+
+    pipeline_mock = redis_mock.pipeline.return_value
+    # moved to the processing list, then a None per missing item
+    pipeline_mock.execute.return_value = [pending, None]
+    redis_mock.llen.return_value = 0
+    request_spy = mocker.spy(archives, "request_tasks")
+    archives.submit_zimfarm_batch()
+    request_spy.assert_called_once()
+    with DBSession.begin() as session:
+        archive = session.get(Archive, expiring_archive_id)
+        assert archive
+        assert archive.status == ArchiveStatus.REQUESTED
+        assert archive.zimfarm_task_id
+    # removed from the processing list once requested only
+    pipeline_mock.lmove.assert_called_with(
+        archives.ZIMFARM_BATCH_KEY, archives.ZIMFARM_BATCH_PROCESSING_KEY
+    )
+    pipeline_mock.lrem.assert_called_once_with(
+        archives.ZIMFARM_BATCH_PROCESSING_KEY, 1, pending
+    )
+
+
+def test_revert_stuck_submissions(expiring_archive_id, mocker):
+    with DBSession.begin() as session:
+        archive = session.get(Archive, expiring_archive_id)
+        assert archive
+        archive.status = ArchiveStatus.SUBMITTING
+        archive.submitted_on = (
+            datetime.datetime.now(tz=datetime.UTC)
+            - constants.archive_submission_deadline * 2
+        )
+    redis_mock = mocker.patch.object(archives, "redis_conn")
+    schedule_mock = mocker.patch.object(archives, "schedule_submission_watchdog")
+    stuck = archives.PendingZimfarmRequest(
+        archive_id=expiring_archive_id,
+        project_id=uuid.uuid4(),
+        email=None,
+        request_def=zimfarm.RequestSchema(
+            collection_url="",
+            name="name",
+            title="title",
+            description="description",
+            long_description=None,
+            language="eng",
+            creator="creator",
+            publisher="publisher",
+            tags=[],
+            main_logo_url="",
+            illustration_url="",
+        ),
+        collection_json_path="collection.json",
+        filesize=1,
+    ).model_dump_json()
+    redis_mock.lrange.side_effect = lambda key, *_args: (
+        [stuck] if key == archives.ZIMFARM_BATCH_PROCESSING_KEY else []
+    )
+
+    archives.revert_stuck_submissions()
+    schedule_mock.assert_called_once()
+    with DBSession.begin() as session:
+        archive = session.get(Archive, expiring_archive_id)
+        assert archive
+        assert archive.status == ArchiveStatus.PENDING
+    redis_mock.pipeline.return_value.lrem.assert_called_once_with(
+        archives.ZIMFARM_BATCH_PROCESSING_KEY, 1, stuck
+    )
+
+
+def test_request_tasks_maps_task_ids(mocker):
+    task_ids = [uuid.uuid4(), uuid.uuid4()]
+    responses = {
+        "POST": mocker.MagicMock(
+            status_code=HTTPStatus.CREATED,
+            text="text",
+            **{"json.return_value": {"requested": [task.hex for task in task_ids]}},
+        ),
+    }
+    mocker.patch.object(zimfarm, "authenticate")
+    mocker.patch.object(
+        zimfarm.session,
+        "request",
+        side_effect=lambda method, **_kwargs: responses[method],
+    )
+    assert zimfarm.request_tasks(["a", "b"]) == {"a": task_ids[0], "b": task_ids[1]}
+
+    # schedule a couldn't be requested
+    responses["POST"].json.return_value = {"requested": [task_ids[1].hex]}
+    responses["GET"] = mocker.MagicMock(
+        status_code=HTTPStatus.OK,
+        text="text",
+        **{
+            "json.return_value": {
+                "items": [{"_id": task_ids[1].hex, "schedule_name": "b"}]
+            }
+        },
+    )
+    assert zimfarm.request_tasks(["a", "b"]) == {"b": task_ids[1]}
+
+
+def test_get_archive_submission(logged_in_client, project_id, archive_id, mocker):
+    job = mocker.MagicMock(meta={"step": "companion_files"}, retries_left=2)
+    job.get_status.return_value = "started"
+    fetch_mock = mocker.patch.object(Job, "fetch", return_value=job)
+    response = logged_in_client.get(
+        f"{constants.api_version_prefix}/projects/"
+        f"{project_id}/archives/{archive_id}/request",
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {
+        "status": "started",
+        "step": "companion_files",
+        "retries_left": 2,
+    }
+    assert fetch_mock.call_args.args == (f"submit-archive-{archive_id}",)
+
+    fetch_mock.side_effect = NoSuchJobError
+    response = logged_in_client.get(
+        f"{constants.api_version_prefix}/projects/"
+        f"{project_id}/archives/{archive_id}/request",
+    )
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+def test_request_task_deletes_schedule_in_background(
+    successful_zimfarm_request_task, mocker, monkeypatch
+):
+    monkeypatch.setattr(constants, "zimfarm_delete_schedule_in_background", True)
+    enqueue_mock = mocker.patch.object(zimfarm.maintenance_queue, "enqueue")
+    archive_id = uuid.uuid4()
+    task_id = zimfarm.request_task(
+        project_id=uuid.uuid4(),
+        archive_id=archive_id,
+        request_def=zimfarm.RequestSchema(
+            collection_url="http://localhost/collection.json",
+            name="a_name",
+            title="A Title",
+            description="A Description",
+            long_description=None,
+            language="eng",
+            creator="a creator",
+            publisher="a publisher",
+            tags=[],
+            main_logo_url="",
+            illustration_url="http://localhost/illustration.png",
+        ),
+        email=None,
+    )
+    assert task_id
+    enqueue_mock.assert_called_once()
+    func, schedule_name = enqueue_mock.call_args.args
+    assert func == zimfarm.delete_schedule
+    assert schedule_name.startswith(f"nautilus_{archive_id}_")
+
+
+def test_zimfarm_token_shared_across_processes(mocker):
+    zimfarm.TokenData.reset()
+    expiry = datetime.datetime.now(datetime.UTC) + datetime.timedelta(minutes=30)
+    redis_mock = mocker.patch.object(zimfarm, "redis_conn")
+    redis_mock.get.return_value = json.dumps(
+        {
+            "access": "shared-access",
+            "access_expiry": expiry.isoformat(),
+            "refresh": "shared-refresh",
+            "refresh_expiry": (expiry + datetime.timedelta(days=1)).isoformat(),
+        }
+    )
+    request_mock = mocker.patch.object(zimfarm.session, "request")
+
+    zimfarm.authenticate()
+    assert zimfarm.TokenData.ACCESS_TOKEN == "shared-access"
+    request_mock.assert_not_called()
+    redis_mock.lock.assert_not_called()
+
+
+def test_zimfarm_token_renewed_with_refresh_token(mocker):
+    zimfarm.TokenData.reset()
+    now = datetime.datetime.now(datetime.UTC)
+    redis_mock = mocker.patch.object(zimfarm, "redis_conn")
+    redis_mock.get.return_value = json.dumps(
+        {
+            "access": "expired-access",
+            "access_expiry": now.isoformat(),
+            "refresh": "shared-refresh",
+            "refresh_expiry": (now + datetime.timedelta(days=1)).isoformat(),
+        }
+    )
+    redis_mock.lock.return_value.acquire.return_value = True
+    response = mocker.MagicMock()
+    response.json.return_value = {
+        "access_token": "new-access",
+        "refresh_token": "new-refresh",
+    }
+    request_mock = mocker.patch.object(
+        zimfarm.session, "request", return_value=response
+    )
+
+    zimfarm.authenticate()
+    assert zimfarm.TokenData.ACCESS_TOKEN == "new-access"
+    assert zimfarm.TokenData.REFRESH_TOKEN == "new-refresh"
+    request_mock.assert_called_once()
+    assert request_mock.call_args.args[1].endswith("/auth/token")
+    assert request_mock.call_args.kwargs["headers"]["refresh-token"] == (
+        "shared-refresh"
+    )
+    redis_mock.set.assert_called_once()
+    assert json.loads(redis_mock.set.call_args.args[1])["access"] == "new-access"
+    redis_mock.lock.return_value.release.assert_called_once()
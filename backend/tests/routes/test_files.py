@@ -1,17 +1,31 @@
+import datetime
+import json
+import threading
 import uuid
 from http import HTTPStatus
 
+import pytest
 from dateutil import parser
+from sqlalchemy import delete, update
 
 from api.constants import constants
-from api.database import get_local_fpath_for
-from api.routes.files import task_queue
+from api.database import Session as DBSession
+from api.database import get_blob_fpath
+from api.database.models import Blob, File, Project
+from api.database.utils import (
+    purge_blobs,
+    reference_blob,
+    release_blobs,
+    reserve_project_space,
+)
+from api.routes import files
+from api.routes.files import upload_project_files_to_storage, uploads_queue
 
 
 def test_upload_file_correct_data(
     logged_in_client, project_id, test_file, test_file_hash, mocker
 ):
-    task_queue_mock = mocker.patch.object(task_queue, "enqueue")
+    task_queue_mock = mocker.patch.object(uploads_queue, "enqueue")
     task_queue_mock.return_value = True
     params = {"project_id": project_id}
     file = {"uploaded_file": test_file}
@@ -23,6 +37,8 @@ def test_upload_file_correct_data(
     json_result = response.json()
     assert response.status_code == HTTPStatus.CREATED
     assert json_result.get("hash") == test_file_hash
+    assert json_result.get("filesize") == len(test_file)
+    assert get_blob_fpath(test_file_hash).read_bytes() == test_file
 
 
 def test_upload_empty_file(logged_in_client, project_id):
@@ -47,10 +63,27 @@ def test_upload_too_large_file(logged_in_client, project_id):
     json_result = response.json()
     assert response.status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
     assert json_result["detail"] == "Uploaded File is too large."
+    assert not list(constants.transient_storage_path.glob(f"{project_id}-*"))
+
+
+def test_upload_missing_file(logged_in_client, project_id):
+    response = logged_in_client.post(
+        f"{constants.api_version_prefix}/projects/{project_id}/files",
+        files={"other_field": b"content"},
+    )
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def test_upload_not_multipart(logged_in_client, project_id):
+    response = logged_in_client.post(
+        f"{constants.api_version_prefix}/projects/{project_id}/files",
+        content=b"content",
+    )
+    assert response.status_code == HTTPStatus.BAD_REQUEST
 
 
 def test_upload_file_excess_project_quota(logged_in_client, project_id, mocker):
-    task_queue_mock = mocker.patch.object(task_queue, "enqueue")
+    task_queue_mock = mocker.patch.object(uploads_queue, "enqueue")
     task_queue_mock.return_value = True
     params = {"project_id": project_id}
     file = {"uploaded_file": b"\xff" * (constants.project_quota - 1)}
@@ -71,7 +104,7 @@ def test_upload_file_excess_project_quota(logged_in_client, project_id, mocker):
 
 
 def test_upload_same_file(logged_in_client, project_id, test_file, mocker):
-    task_queue_mock = mocker.patch.object(task_queue, "enqueue")
+    task_queue_mock = mocker.patch.object(uploads_queue, "enqueue")
     task_queue_mock.return_value = True
     params = {"project_id": project_id}
     file = {"uploaded_file": test_file}
@@ -88,6 +121,181 @@ def test_upload_same_file(logged_in_client, project_id, test_file, mocker):
     assert response.status_code == HTTPStatus.CREATED
 
 
+def test_upload_files_batch(
+    logged_in_client, project_id, test_file, test_file_hash, mocker
+):
+    task_queue_mock = mocker.patch.object(uploads_queue, "enqueue")
+    files = [
+        ("uploaded_file", ("first.txt", test_file)),
+        ("uploaded_file", ("empty.txt", b"")),
+        ("uploaded_file", ("second.txt", b"second")),
+    ]
+    response = logged_in_client.post(
+        f"{constants.api_version_prefix}/projects/{project_id}/files/batch",
+        files=files,
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["content-type"] == "application/x-ndjson"
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [result["filename"] for result in results] == [
+        "first.txt",
+        "empty.txt",
+        "second.txt",
+    ]
+    assert [result["status"] for result in results] == [
+        HTTPStatus.CREATED,
+        HTTPStatus.BAD_REQUEST,
+        HTTPStatus.CREATED,
+    ]
+    assert results[0]["file"]["hash"] == test_file_hash
+    assert results[1]["detail"] == "Empty file."
+    assert get_blob_fpath(test_file_hash).read_bytes() == test_file
+    # a single job uploads all of the project's new files
+    task_queue_mock.assert_called_once()
+    assert task_queue_mock.call_args.args == (
+        upload_project_files_to_storage,
+        str(project_id),
+    )
+    # given time for both
+    assert task_queue_mock.call_args.kwargs["job_timeout"] == (
+        constants.upload_job_timeout + 2 * constants.upload_job_timeout_per_file
+    )
+
+    response = logged_in_client.get(
+        f"{constants.api_version_prefix}/projects/{project_id}/files"
+    )
+    assert len(response.json()) == 2
+
+
+def test_upload_files_batch_excess_project_quota(logged_in_client, project_id, mocker):
+    task_queue_mock = mocker.patch.object(uploads_queue, "enqueue")
+    files = [
+        ("uploaded_file", ("first.txt", b"\xff" * (constants.project_quota - 1))),
+        ("uploaded_file", ("second.txt", b"\xff" * 2)),
+    ]
+    response = logged_in_client.post(
+        f"{constants.api_version_prefix}/projects/{project_id}/files/batch",
+        files=files,
+    )
+    assert response.status_code == HTTPStatus.OK
+    results = [json.loads(line) for line in response.text.splitlines()]
+    # quota is checked as each file is received
+    assert [result["status"] for result in results] == [
+        HTTPStatus.CREATED,
+        HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+    ]
+    assert results[1]["detail"] == "Uploaded files exceeded project quota"
+    assert not list(constants.transient_storage_path.glob(f"{project_id}-*"))
+    task_queue_mock.assert_called_once()
+
+
+def test_upload_files_batch_invalid_body(logged_in_client, project_id):
+    response = logged_in_client.post(
+        f"{constants.api_version_prefix}/projects/{project_id}/files/batch",
+        content=b"--boundary\r\nnot a part",
+        headers={"Content-Type": "multipart/form-data; boundary=boundary"},
+    )
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert not list(constants.transient_storage_path.glob(f"{project_id}-*"))
+
+
+def test_precheck_files(logged_in_client, project_id, file_id, test_file_hash, mocker):
+    task_queue_mock = mocker.patch.object(uploads_queue, "enqueue")
+    response = logged_in_client.post(
+        f"{constants.api_version_prefix}/projects/{project_id}/files/precheck",
+        json=[
+            {"filename": "known.png", "filesize": 123, "hash": test_file_hash},
+            {"filename": "unknown.png", "filesize": 123, "hash": "0" * 64},
+        ],
+    )
+    json_result = response.json()
+    assert response.status_code == HTTPStatus.OK
+    assert [result["known"] for result in json_result] == [True, False]
+    assert json_result[0]["file"]["filename"] == "known.png"
+    assert json_result[0]["file"]["id"] != str(file_id)
+    assert json_result[1]["file"] is None
+    task_queue_mock.assert_called_once()
+
+    response = logged_in_client.get(
+        f"{constants.api_version_prefix}/projects/{project_id}/files"
+    )
+    assert len(response.json()) == 2
+
+
+def test_precheck_files_other_project(
+    logged_in_client,
+    file_id,
+    test_file_hash,
+    successful_storage_upload_file,
+    fake_redis,
+    mocker,
+):
+    task_queue_mock = mocker.patch.object(uploads_queue, "enqueue")
+    response = logged_in_client.post(
+        f"{constants.api_version_prefix}/projects", json={"name": "other project"}
+    )
+    other_project_id = response.json()["id"]
+    response = logged_in_client.post(
+        f"{constants.api_version_prefix}/projects/{other_project_id}/files/precheck",
+        json=[
+            {"filename": "known.png", "filesize": 123, "hash": test_file_hash},
+            {"filename": "resized.png", "filesize": 124, "hash": test_file_hash},
+        ],
+    )
+    json_result = response.json()
+    assert response.status_code == HTTPStatus.OK
+    # content of file_id, in another project
+    assert [result["known"] for result in json_result] == [True, False]
+    assert json_result[0]["file"]["id"] != str(file_id)
+    assert json_result[0]["file"]["type"] == "image/png"
+    assert json_result[0]["file"]["status"] == "LOCAL"
+    # requested for upload, finding content in Storage or at its blob path
+    task_queue_mock.assert_called_once()
+    # first Files of the project: it now expires, as content it shares
+    with DBSession.begin() as session:
+        other_project = session.get(Project, other_project_id)
+        assert other_project and other_project.expire_on
+        blob = session.get(Blob, test_file_hash)
+        assert blob and blob.expire_on == other_project.expire_on
+    files.upload_pending_files(uuid.UUID(other_project_id))
+    response = logged_in_client.get(
+        f"{constants.api_version_prefix}/projects/{other_project_id}/files"
+    )
+    assert [file["status"] for file in response.json()] == ["STORAGE"]
+
+    response = logged_in_client.delete(
+        f"{constants.api_version_prefix}/projects/{other_project_id}"
+    )
+    assert response.status_code == HTTPStatus.NO_CONTENT
+
+
+def test_precheck_files_expiring_content(
+    logged_in_client, project_id, file_id, test_file_hash
+):
+    # in Storage, but autodeleted before it could be extended
+    with DBSession.begin() as session:
+        session.execute(update(File).filter_by(id=file_id).values(status="STORAGE"))
+        session.execute(
+            update(Blob)
+            .filter_by(hash=test_file_hash)
+            .values(expire_on=datetime.datetime.now(datetime.UTC))
+        )
+    response = logged_in_client.post(
+        f"{constants.api_version_prefix}/projects/{project_id}/files/precheck",
+        json=[{"filename": "known.png", "filesize": 123, "hash": test_file_hash}],
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert [result["known"] for result in response.json()] == [False]
+
+
+def test_precheck_files_wrong_hash(logged_in_client, project_id):
+    response = logged_in_client.post(
+        f"{constants.api_version_prefix}/projects/{project_id}/files/precheck",
+        json=[{"filename": "file.png", "filesize": 123, "hash": "not-a-hash"}],
+    )
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
 def test_upload_file_wrong_authorization(client, project_id, missing_user_cookie):
     response = client.post(
         f"{constants.api_version_prefix}/projects/{project_id}/files"
@@ -113,6 +321,26 @@ def test_get_all_files_correct_data(logged_in_client, project_id, file_id):
     assert json_result[0].get("id") == str(file_id)
 
 
+def test_get_all_files_single_query(logged_in_client, project_id, file_id, monkeypatch):
+    monkeypatch.setattr(constants, "debug", True)
+    response = logged_in_client.get(
+        f"{constants.api_version_prefix}/projects/{project_id}/files"
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert [file["id"] for file in response.json()] == [str(file_id)]
+    # user, project and its files
+    assert response.headers["X-Query-Count"] == "1"
+
+
+def test_get_file_single_query(logged_in_client, project_id, file_id, monkeypatch):
+    monkeypatch.setattr(constants, "debug", True)
+    response = logged_in_client.get(
+        f"{constants.api_version_prefix}/projects/{project_id}/files/{file_id}"
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["X-Query-Count"] == "1"
+
+
 def test_get_all_files_wrong_authorization(client, missing_user_cookie, project_id):
     response = client.get(f"{constants.api_version_prefix}/projects/{project_id}/files")
     assert response.status_code == HTTPStatus.UNAUTHORIZED
@@ -164,10 +392,162 @@ def test_delete_file_correct_id(logged_in_client, project_id, file_id, test_file
         f"{constants.api_version_prefix}/projects/{project_id}/files/{file_id}"
     )
     assert response.status_code == HTTPStatus.NO_CONTENT
-    fpath = get_local_fpath_for(test_file_hash, project_id)
+    fpath = get_blob_fpath(test_file_hash)
     assert not fpath.is_file()
 
 
+def test_delete_file_commits_release(
+    logged_in_client, project_id, file_id, test_file_hash
+):
+    response = logged_in_client.delete(
+        f"{constants.api_version_prefix}/projects/{project_id}/files/{file_id}"
+    )
+    assert response.status_code == HTTPStatus.NO_CONTENT
+    with DBSession.begin() as session:
+        assert not session.get(File, file_id)
+        assert not session.get(Blob, test_file_hash)
+        project = session.get(Project, project_id)
+        assert project and project.used_space == 0 and project.file_count == 0
+
+
+def test_delete_file_rolled_back(
+    logged_in_client, project_id, file_id, test_file_hash, mocker
+):
+    release_files = files.release_files
+
+    def release_files_then_fail(session, released):
+        release_files(session, released)
+        raise RuntimeError("Failed once released")
+
+    mocker.patch.object(files, "release_files", release_files_then_fail)
+    with pytest.raises(RuntimeError):
+        logged_in_client.delete(
+            f"{constants.api_version_prefix}/projects/{project_id}/files/{file_id}"
+        )
+    # release is rolled back with the rest, content is not purged
+    assert get_blob_fpath(test_file_hash).exists()
+    with DBSession.begin() as session:
+        assert session.get(File, file_id)
+        blob = session.get(Blob, test_file_hash)
+        assert blob and blob.refcount == 1
+        project = session.get(Project, project_id)
+        assert project and project.used_space == 123 and project.file_count == 1
+
+
+def test_delete_file_without_blob(
+    logged_in_client, project_id, file_id, test_file_hash
+):
+    # content not referenced through a Blob has no other reference
+    with DBSession.begin() as session:
+        session.execute(delete(Blob).filter_by(hash=test_file_hash))
+    response = logged_in_client.delete(
+        f"{constants.api_version_prefix}/projects/{project_id}/files/{file_id}"
+    )
+    assert response.status_code == HTTPStatus.NO_CONTENT
+    assert not get_blob_fpath(test_file_hash).exists()
+
+
+def test_delete_file_shared_across_projects(
+    logged_in_client, project_id, test_file, test_file_hash, mocker
+):
+    mocker.patch.object(uploads_queue, "enqueue")
+    response = logged_in_client.post(
+        f"{constants.api_version_prefix}/projects", json={"name": "other project"}
+    )
+    other_project_id = response.json()["id"]
+    file_urls = []
+    for pid in (project_id, other_project_id):
+        response = logged_in_client.post(
+            f"{constants.api_version_prefix}/projects/{pid}/files",
+            files={"uploaded_file": test_file},
+        )
+        assert response.status_code == HTTPStatus.CREATED
+        file_urls.append(
+            f"{constants.api_version_prefix}/projects/{pid}/files/"
+            f"{response.json()['id']}"
+        )
+
+    response = logged_in_client.delete(file_urls[0])
+    assert response.status_code == HTTPStatus.NO_CONTENT
+    assert get_blob_fpath(test_file_hash).read_bytes() == test_file
+
+    response = logged_in_client.delete(
+        f"{constants.api_version_prefix}/projects/{other_project_id}"
+    )
+    assert response.status_code == HTTPStatus.NO_CONTENT
+    assert not get_blob_fpath(test_file_hash).exists()
+
+
+def test_delete_file_at_legacy_key(
+    logged_in_client, project_id, file_id, test_file_hash, mocker
+):
+    deletions_mock = mocker.patch.object(files.deletions_queue, "enqueue")
+    # uploaded before content was shared, its content referenced elsewhere
+    legacy_key = f"{project_id}/{'0' * 64}"
+    with DBSession.begin() as session:
+        session.execute(
+            update(File).filter_by(id=file_id).values(status="STORAGE", path=legacy_key)
+        )
+        reference_blob(session, file_hash=test_file_hash, filesize=123, expire_on=None)
+    response = logged_in_client.delete(
+        f"{constants.api_version_prefix}/projects/{project_id}/files/{file_id}"
+    )
+    assert response.status_code == HTTPStatus.NO_CONTENT
+    # its own key is removed, content being kept
+    deletions_mock.assert_called_once_with(files.delete_from_storage, legacy_key)
+    with DBSession.begin() as session:
+        blob = session.get(Blob, test_file_hash)
+        assert blob and blob.refcount == 1
+        purge_blobs(session, release_blobs(session, [test_file_hash]))
+
+
+def test_purge_content_referenced_again(file_id, test_file_hash):
+    # last File released, then content referenced again before its purge
+    with DBSession.begin() as session:
+        assert release_blobs(session, [test_file_hash]) == [test_file_hash]
+    with DBSession.begin() as session:
+        reference_blob(session, file_hash=test_file_hash, filesize=123, expire_on=None)
+    files.purge_contents({test_file_hash: set()})
+    assert get_blob_fpath(test_file_hash).exists()
+    with DBSession.begin() as session:
+        blob = session.get(Blob, test_file_hash)
+        assert blob and blob.refcount == 1
+
+
+def test_purge_content_waits_for_reference(file_id, test_file_hash):
+    with DBSession.begin() as session:
+        release_blobs(session, [test_file_hash])
+    purged: list[str] = []
+
+    def purge():
+        with DBSession.begin() as session:
+            purged.extend(purge_blobs(session, [test_file_hash]))
+
+    # a File being added has referenced content, not committed yet
+    with DBSession.begin() as session:
+        reference_blob(session, file_hash=test_file_hash, filesize=123, expire_on=None)
+        purger = threading.Thread(target=purge)
+        purger.start()
+        purger.join(timeout=0.5)
+        assert purger.is_alive()
+        assert get_blob_fpath(test_file_hash).exists()
+    purger.join()
+    assert purged == []
+    assert get_blob_fpath(test_file_hash).exists()
+
+
+def test_sweep_unreferenced_blobs(file_id, test_file_hash, mocker):
+    schedule_mock = mocker.patch.object(files, "schedule_blob_sweep")
+    # released but not purged (API process stopped meanwhile)
+    with DBSession.begin() as session:
+        release_blobs(session, [test_file_hash])
+    files.sweep_unreferenced_blobs()
+    assert not get_blob_fpath(test_file_hash).exists()
+    with DBSession.begin() as session:
+        assert not session.get(Blob, test_file_hash)
+    schedule_mock.assert_called_once()
+
+
 def test_delete_file_wrong_id(logged_in_client, project_id, non_existent_file_id):
     params = {"project_id": project_id}
     response = logged_in_client.delete(
@@ -266,3 +646,141 @@ def test_update_file_wrong_authorization(
         f"{constants.api_version_prefix}/projects/{project_id}/files/{file_id}"
     )
     assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def get_project_counters(project_id) -> tuple[int, int]:
+    with DBSession.begin() as session:
+        project = session.get(Project, project_id)
+        assert project
+        return project.used_space, project.file_count
+
+
+def test_project_counters_maintained(logged_in_client, project_id, test_file, mocker):
+    mocker.patch.object(uploads_queue, "enqueue")
+    assert get_project_counters(project_id) == (0, 0)
+    response = logged_in_client.post(
+        f"{constants.api_version_prefix}/projects/{project_id}/files",
+        files={"uploaded_file": test_file},
+    )
+    assert response.status_code == HTTPStatus.CREATED
+    assert get_project_counters(project_id) == (len(test_file), 1)
+
+    response = logged_in_client.delete(
+        f"{constants.api_version_prefix}/projects/{project_id}/files/"
+        f"{response.json()['id']}"
+    )
+    assert response.status_code == HTTPStatus.NO_CONTENT
+    assert get_project_counters(project_id) == (0, 0)
+
+
+def test_reserve_project_space_within_quota(project_id):
+    half = constants.project_quota // 2
+    with DBSession.begin() as session:
+        assert reserve_project_space(session, project_id, filesize=half)
+        assert reserve_project_space(session, project_id, filesize=half)
+        # would exceed quota: nothing recorded
+        assert not reserve_project_space(session, project_id, filesize=half)
+        project = session.get(Project, project_id)
+        assert project
+        session.refresh(project)
+        assert (project.used_space, project.file_count) == (half * 2, 2)
+        session.rollback()
+
+
+def test_get_worker_identity(mocker):
+    job_mock = mocker.patch.object(files, "get_current_job")
+    job_mock.return_value = mocker.MagicMock(worker_name="worker", id="first")
+    first = files.get_worker_identity()
+    job_mock.return_value = mocker.MagicMock(worker_name="worker", id="second")
+    # jobs run at once by a same worker hold distinct leases
+    assert files.get_worker_identity() != first
+    assert first == "worker:first"
+
+
+def lease_file(project_id, file_id, *, leased_by: str, expire_in: datetime.timedelta):
+    """Set file PROCESSING, leased to leased_by, in an expiring project"""
+    now = datetime.datetime.now(datetime.UTC)
+    with DBSession.begin() as session:
+        session.execute(
+            update(Project)
+            .filter_by(id=project_id)
+            .values(expire_on=now + datetime.timedelta(days=1))
+        )
+        session.execute(
+            update(File)
+            .filter_by(id=file_id)
+            .values(
+                status="PROCESSING",
+                leased_by=leased_by,
+                lease_expire_on=now + expire_in,
+            )
+        )
+
+
+def get_lease(file_id) -> str | None:
+    with DBSession.begin() as session:
+        file = session.get(File, file_id)
+        return file.leased_by if file else None
+
+
+def test_expired_lease_claimed_again(
+    project_id, file_id, successful_storage_upload_file, fake_redis, mocker
+):
+    # job holding the lease died: it was not renewed
+    lease_file(
+        project_id,
+        file_id,
+        leased_by="worker:dead-job",
+        expire_in=-datetime.timedelta(minutes=1),
+    )
+    mocker.patch.object(files, "get_worker_identity", return_value="worker:new-job")
+    leases: list[str | None] = []
+    mocker.patch.object(
+        files.storage,
+        "upload_file",
+        side_effect=lambda **_: leases.append(get_lease(file_id)),
+    )
+
+    files.upload_pending_files(project_id)
+
+    assert leases == ["worker:new-job"]
+    with DBSession.begin() as session:
+        file = session.get(File, file_id)
+        assert file and file.status == "STORAGE"
+        assert file.leased_by is None
+
+
+def test_live_lease_left_to_holder(
+    project_id, file_id, successful_storage_upload_file, fake_redis, mocker
+):
+    lease_file(
+        project_id,
+        file_id,
+        leased_by="worker:running-job",
+        expire_in=datetime.timedelta(minutes=1),
+    )
+    mocker.patch.object(files, "get_worker_identity", return_value="worker:new-job")
+    upload_mock = mocker.patch.object(files.storage, "upload_file")
+
+    files.upload_pending_files(project_id)
+
+    upload_mock.assert_not_called()
+    with DBSession.begin() as session:
+        file = session.get(File, file_id)
+        assert file and file.status == "PROCESSING"
+        assert file.leased_by == "worker:running-job"
+
+
+def test_requeue_expired_leases(project_id, file_id, mocker):
+    enqueue_mock = mocker.patch.object(files, "enqueue_project_upload")
+    mocker.patch.object(files, "schedule_lease_watchdog")
+    lease_file(
+        project_id,
+        file_id,
+        leased_by="worker:dead-job",
+        expire_in=-datetime.timedelta(minutes=1),
+    )
+
+    files.requeue_expired_leases()
+
+    enqueue_mock.assert_called_once_with(project_id, nb_pending=1)
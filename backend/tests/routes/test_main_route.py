@@ -1,9 +1,13 @@
 from http import HTTPStatus
+from unittest.mock import PropertyMock
 
 from fastapi.testclient import TestClient
+from rq import Queue
+from rq.registry import BaseRegistry
 
 from api.constants import constants
 from api.entrypoint import app
+from api.store import worked_queues
 
 client = TestClient(app)
 
@@ -17,3 +21,23 @@ def test_ping():
     response = client.get(f"{constants.api_version_prefix}/ping")
     assert response.status_code == HTTPStatus.OK
     assert response.json() == {"message": "pong"}
+
+
+def test_queues_stats_anonymous():
+    response = client.get(f"{constants.api_version_prefix}/queues")
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def test_queues_stats(logged_in_client, mocker):
+    mocker.patch.object(Queue, "count", new_callable=PropertyMock, return_value=3)
+    mocker.patch.object(Queue, "get_jobs", return_value=[])
+    mocker.patch.object(
+        BaseRegistry, "count", new_callable=PropertyMock, return_value=1
+    )
+    response = logged_in_client.get(f"{constants.api_version_prefix}/queues")
+    assert response.status_code == HTTPStatus.OK
+    stats = response.json()
+    assert [queue["name"] for queue in stats] == [queue.name for queue in worked_queues]
+    assert stats[0]["depth"] == 3
+    assert stats[0]["failed"] == 1
+    assert stats[0]["wait"] == 0
@@ -1,9 +1,18 @@
+import datetime
 import uuid
 from http import HTTPStatus
 
+import pytest
 from dateutil import parser
+from sqlalchemy import select, update
 
 from api.constants import constants
+from api.database import AsyncSession as AsyncDBSession
+from api.database import Session as DBSession
+from api.database import get_blob_fpath
+from api.database.models import Blob, File, Project
+from api.routes import files, projects
+from api.storage import StorageEntry
 
 
 def test_create_project_correct_data(logged_in_client, test_project_name):
@@ -95,6 +104,51 @@ def test_delete_project_correct_id(logged_in_client, project_id):
     assert response.status_code == HTTPStatus.NO_CONTENT
 
 
+def test_delete_project_sharing_content(
+    logged_in_client, project_id, test_file, test_file_hash, mocker
+):
+    mocker.patch.object(files.uploads_queue, "enqueue")
+    for filename in ("first.txt", "second.txt"):
+        response = logged_in_client.post(
+            f"{constants.api_version_prefix}/projects/{project_id}/files",
+            files={"uploaded_file": (filename, test_file)},
+        )
+        assert response.status_code == HTTPStatus.CREATED
+    with DBSession.begin() as session:
+        blob = session.get(Blob, test_file_hash)
+        assert blob and blob.refcount == 2
+
+    response = logged_in_client.delete(
+        f"{constants.api_version_prefix}/projects/{project_id!s}"
+    )
+    assert response.status_code == HTTPStatus.NO_CONTENT
+    with DBSession.begin() as session:
+        assert not session.get(Blob, test_file_hash)
+    assert not get_blob_fpath(test_file_hash).exists()
+
+
+def test_delete_project_rolled_back(
+    logged_in_client, project_id, file_id, test_file_hash, mocker
+):
+    release_files = projects.release_files
+
+    def release_files_then_fail(session, released):
+        release_files(session, released)
+        raise RuntimeError("Failed once released")
+
+    mocker.patch.object(projects, "release_files", release_files_then_fail)
+    with pytest.raises(RuntimeError):
+        logged_in_client.delete(
+            f"{constants.api_version_prefix}/projects/{project_id!s}"
+        )
+    assert get_blob_fpath(test_file_hash).exists()
+    with DBSession.begin() as session:
+        assert session.get(Project, project_id)
+        assert session.get(File, file_id)
+        blob = session.get(Blob, test_file_hash)
+        assert blob and blob.refcount == 1
+
+
 def test_delete_project_wrong_id(logged_in_client, non_existent_project_id):
     response = logged_in_client.delete(
         f"{constants.api_version_prefix}/projects/{non_existent_project_id}"
@@ -158,3 +212,61 @@ def test_update_project_wrong_authorization(
         f"{constants.api_version_prefix}/projects/{non_existent_project_id}"
     )
     assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+@pytest.mark.anyio
+async def test_update_project_files_from_webdav(
+    project_id, file_id, test_file_hash, monkeypatch
+):
+    with DBSession.begin() as session:
+        session.execute(
+            update(Project).filter_by(id=project_id).values(webdav_path="dav")
+        )
+        session.execute(update(File).filter_by(id=file_id).values(path="gone.txt"))
+
+    async def has(path: str) -> bool:
+        return True
+
+    def use_listing(sizes: dict[str, int]):
+        async def list_(prefix: str):
+            for name, size in sizes.items():
+                yield StorageEntry(
+                    path=f"{prefix}/{name}",
+                    size=size,
+                    mimetype="text/plain",
+                    modified_on=datetime.datetime.now(datetime.UTC),
+                    etag=None,
+                )
+
+        monkeypatch.setattr(projects.async_storage, "list", list_)
+
+    async def refresh() -> tuple[Project, dict[str, int]]:
+        async with AsyncDBSession.begin() as session:
+            project = await session.get_one(Project, project_id)
+            contents = await projects.update_project_files_from_webdav(session, project)
+        projects.purge_contents(contents)
+        with DBSession.begin() as session:
+            project = session.get_one(Project, project_id)
+            session.expunge(project)
+            files = session.execute(
+                select(File.path, File.filesize).filter_by(project_id=project_id)
+            )
+            return project, dict(files.tuples().all())
+
+    monkeypatch.setattr(projects.async_storage, "has", has)
+
+    # its uploaded File removed, releasing its content
+    use_listing({"a.txt": 10})
+    project, files = await refresh()
+    assert files == {"a.txt": 10}
+    assert (project.used_space, project.file_count) == (10, 1)
+    assert project.expire_on
+    with DBSession.begin() as session:
+        assert not session.get(Blob, test_file_hash)
+    assert not get_blob_fpath(test_file_hash).exists()
+
+    # updated and added at once
+    use_listing({"a.txt": 20, "b.txt": 30})
+    project, files = await refresh()
+    assert files == {"a.txt": 20, "b.txt": 30}
+    assert (project.used_space, project.file_count) == (50, 2)
@@ -0,0 +1,149 @@
+"""Query plans of routes' hot lookups, on a populated database
+
+Tables are seeded (in a transaction rolled back afterwards) with enough rows
+for Postgres to prefer an index over a sequential scan when one fits."""
+
+import uuid
+
+import pytest
+from sqlalchemy import Select, select, text
+from sqlalchemy.orm import Session
+
+from api.database import Session as DBSession
+from api.database.models import Archive, File, Project
+from api.routes import select_project
+from api.routes.files import select_known_files
+
+NB_USERS = 2_000
+PROJECTS_PER_USER = 10
+FILES_PER_PROJECT = 3
+
+
+@pytest.fixture(scope="module")
+def seeded_session():
+    with DBSession() as session:
+        transaction = session.begin()
+        session.execute(
+            text(
+                'INSERT INTO "user" (id, created_on) '
+                "SELECT uuid_generate_v4(), now() FROM generate_series(1, :nb)"
+            ),
+            {"nb": NB_USERS},
+        )
+        # before referencing rows: foreign key checks are otherwise planned for
+        # (or were, cached in the pooled connection) empty tables, scanning them
+        session.execute(text('ANALYZE "user"'))
+        session.execute(
+            text(
+                "INSERT INTO project (user_id, name, created_on) "
+                "SELECT u.id, 'project ' || i, now() - i * interval '1 minute' "
+                'FROM "user" u CROSS JOIN generate_series(1, :nb) i'
+            ),
+            {"nb": PROJECTS_PER_USER},
+        )
+        session.execute(text("ANALYZE project"))
+        session.execute(
+            text(
+                "INSERT INTO file (project_id, filename, filesize, title, "
+                'uploaded_on, hash, path, type, status, "order") '
+                "SELECT p.id, 'file' || i, 1024, 'file' || i, now(), "
+                "md5(p.id::text || i), '/file' || i, 'text/plain', 'STORAGE', i "
+                "FROM project p CROSS JOIN generate_series(1, :nb) i"
+            ),
+            {"nb": FILES_PER_PROJECT},
+        )
+        session.execute(
+            text(
+                "INSERT INTO archive (project_id, created_on, status, config) "
+                "SELECT id, now(), 'PENDING', '{}'::jsonb FROM project"
+            )
+        )
+        session.execute(text("ANALYZE file, archive"))
+        yield session
+        transaction.rollback()
+
+
+@pytest.fixture(scope="module")
+def seeded_project(seeded_session: Session) -> Project:
+    project = seeded_session.execute(select(Project).limit(1)).scalar_one()
+    return project
+
+
+def explain(session: Session, stmt: Select) -> str:
+    compiled = stmt.compile(
+        dialect=session.get_bind().dialect,
+        compile_kwargs={"render_postcompile": True},
+    )
+    rows = session.connection().exec_driver_sql(f"EXPLAIN {compiled}", compiled.params)
+    return "\n".join(row[0] for row in rows)
+
+
+def assert_uses_index(plan: str, index_name: str):
+    assert "Seq Scan" not in plan, plan
+    assert index_name in plan, plan
+
+
+def test_validated_project_plan(seeded_session, seeded_project):
+    stmt = select_project(user_id=seeded_project.user_id, project_id=seeded_project.id)
+    assert_uses_index(explain(seeded_session, stmt), "pk_project")
+
+
+def test_validated_project_with_files_plan(seeded_session, seeded_project):
+    stmt = select_project(
+        user_id=seeded_project.user_id,
+        project_id=seeded_project.id,
+        load=Project.files,
+    )
+    assert_uses_index(explain(seeded_session, stmt), "ix_file_project_id_")
+
+
+def test_user_projects_plan(seeded_session, seeded_project):
+    # as User.projects
+    stmt = (
+        select(Project)
+        .filter_by(user_id=seeded_project.user_id)
+        .order_by(Project.created_on.desc())
+    )
+    assert_uses_index(
+        explain(seeded_session, stmt), "ix_project_user_id_project_created_on"
+    )
+
+
+def test_project_files_plan(seeded_session, seeded_project):
+    # as Project.files
+    stmt = select(File).filter_by(project_id=seeded_project.id).order_by(File.order)
+    # with few files per project, any project_id index is as good
+    assert_uses_index(explain(seeded_session, stmt), "ix_file_project_id_")
+
+
+def test_project_file_at_path_plan(seeded_session, seeded_project):
+    # as in WebDAV sync
+    stmt = select(File).filter_by(project_id=seeded_project.id).filter_by(path="/file1")
+    assert_uses_index(explain(seeded_session, stmt), "ix_file_project_id_file_path")
+
+
+def test_project_known_files_plan(seeded_session, seeded_project):
+    stmt = select_known_files(seeded_project.id, ["0" * 64, "1" * 64])
+    assert_uses_index(explain(seeded_session, stmt), "ix_file_project_id_file_hash")
+
+
+def test_project_archives_plan(seeded_session, seeded_project):
+    # as Project.archives
+    stmt = (
+        select(Archive)
+        .filter_by(project_id=seeded_project.id)
+        .order_by(Archive.created_on.desc())
+    )
+    assert_uses_index(
+        explain(seeded_session, stmt), "ix_archive_project_id_archive_created_on"
+    )
+
+
+def test_archive_of_project_plan(seeded_session, seeded_project):
+    stmt = select_project(
+        user_id=seeded_project.user_id,
+        project_id=seeded_project.id,
+        item=(Archive, uuid.uuid4()),
+    )
+    # with few archives per project, the project_id index is as good as the pkey
+    assert_uses_index(explain(seeded_session, stmt), "pk_project")
@@ -0,0 +1,172 @@
+import datetime
+from http import HTTPStatus
+
+import pytest
+from sqlalchemy import update
+
+from api.constants import constants
+from api.database import Session as DBSession
+from api.database import get_blob_fpath
+from api.database.models import Upload
+from api.database.utils import reserve_project_space
+from api.routes.files import uploads_queue
+from api.routes.uploads import sweep_expired_uploads
+
+
+@pytest.fixture
+def upload_url(logged_in_client, project_id, test_file):
+    response = logged_in_client.post(
+        f"{constants.api_version_prefix}/projects/{project_id}/uploads",
+        json={"filename": "test filename", "filesize": len(test_file)},
+    )
+    assert response.status_code == HTTPStatus.CREATED
+    assert response.headers["Upload-Offset"] == "0"
+    return response.headers["Location"]
+
+
+def patch_chunk(client, url: str, offset: int, chunk: bytes):
+    return client.patch(
+        url,
+        content=chunk,
+        headers={
+            "Upload-Offset": str(offset),
+            "Content-Type": "application/offset+octet-stream",
+        },
+    )
+
+
+def test_resumable_upload(
+    logged_in_client, project_id, upload_url, test_file, test_file_hash, mocker
+):
+    task_queue_mock = mocker.patch.object(uploads_queue, "enqueue")
+    task_queue_mock.return_value = True
+
+    response = patch_chunk(logged_in_client, upload_url, 0, test_file[:10])
+    assert response.status_code == HTTPStatus.NO_CONTENT
+    assert response.headers["Upload-Offset"] == "10"
+
+    response = logged_in_client.head(upload_url)
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["Upload-Offset"] == "10"
+    assert response.headers["Upload-Length"] == str(len(test_file))
+
+    response = patch_chunk(logged_in_client, upload_url, 10, test_file[10:])
+    assert response.status_code == HTTPStatus.NO_CONTENT
+    assert response.headers["Upload-Offset"] == str(len(test_file))
+
+    response = logged_in_client.post(f"{upload_url}/finalize")
+    json_result = response.json()
+    assert response.status_code == HTTPStatus.CREATED
+    assert json_result.get("hash") == test_file_hash
+    assert json_result.get("filename") == "test filename"
+    assert get_blob_fpath(test_file_hash).read_bytes() == test_file
+    task_queue_mock.assert_called_once()
+
+    response = logged_in_client.get(upload_url)
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+def test_resumable_upload_rebuilds_hash(
+    logged_in_client, upload_url, test_file, test_file_hash, mocker
+):
+    mocker.patch.object(uploads_queue, "enqueue")
+    patch_chunk(logged_in_client, upload_url, 0, test_file[:10])
+    # as if next chunk was received by another process
+    mocker.patch.dict("api.routes.uploads.upload_hashers", clear=True)
+    patch_chunk(logged_in_client, upload_url, 10, test_file[10:])
+
+    response = logged_in_client.post(f"{upload_url}/finalize")
+    assert response.status_code == HTTPStatus.CREATED
+    assert response.json().get("hash") == test_file_hash
+
+
+def test_resumable_upload_wrong_offset(logged_in_client, upload_url, test_file):
+    response = patch_chunk(logged_in_client, upload_url, 5, test_file)
+    assert response.status_code == HTTPStatus.CONFLICT
+
+
+def test_resumable_upload_exceeding_length(logged_in_client, upload_url, test_file):
+    response = patch_chunk(logged_in_client, upload_url, 0, test_file + b"extra")
+    assert response.status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+
+
+def test_finalize_incomplete_upload(logged_in_client, upload_url, test_file):
+    patch_chunk(logged_in_client, upload_url, 0, test_file[:10])
+    response = logged_in_client.post(f"{upload_url}/finalize")
+    assert response.status_code == HTTPStatus.CONFLICT
+
+
+def test_finalize_upload_exceeding_quota(
+    logged_in_client, project_id, upload_url, test_file, mocker
+):
+    patch_chunk(logged_in_client, upload_url, 0, test_file)
+    # quota filled by another request once early check passed
+    mocker.patch("api.routes.uploads.validate_project_quota")
+    with DBSession.begin() as session:
+        reserve_project_space(session, project_id, filesize=constants.project_quota)
+    response = logged_in_client.post(f"{upload_url}/finalize")
+    assert response.status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+    # its content discarded, upload is gone
+    response = logged_in_client.head(upload_url)
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+def test_sweep_expired_uploads(logged_in_client, upload_url, test_file, mocker):
+    schedule_mock = mocker.patch("api.routes.uploads.schedule_upload_sweep")
+    patch_chunk(logged_in_client, upload_url, 0, test_file[:10])
+    upload_id = upload_url.rsplit("/", 1)[-1]
+    with DBSession.begin() as session:
+        upload = session.get(Upload, upload_id)
+        assert upload
+        fpath = upload.local_fpath
+        assert upload.expire_on > upload.created_on
+        session.execute(
+            update(Upload)
+            .filter_by(id=upload_id)
+            .values(expire_on=datetime.datetime.now(tz=datetime.UTC))
+        )
+    assert fpath.exists()
+
+    sweep_expired_uploads()
+    schedule_mock.assert_called_once()
+    assert not fpath.exists()
+    response = logged_in_client.head(upload_url)
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+def test_create_empty_upload(logged_in_client, project_id):
+    response = logged_in_client.post(
+        f"{constants.api_version_prefix}/projects/{project_id}/uploads",
+        json={"filename": "test filename", "filesize": 0},
+    )
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_create_too_large_upload(logged_in_client, project_id):
+    response = logged_in_client.post(
+        f"{constants.api_version_prefix}/projects/{project_id}/uploads",
+        json={"filename": "test filename", "filesize": constants.project_quota + 1},
+    )
+    assert response.status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+
+
+def test_delete_upload(logged_in_client, upload_url):
+    response = logged_in_client.delete(upload_url)
+    assert response.status_code == HTTPStatus.NO_CONTENT
+    response = logged_in_client.head(upload_url)
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+def test_upload_wrong_authorization(client, missing_user_cookie, project_id):
+    response = client.post(
+        f"{constants.api_version_prefix}/projects/{project_id}/uploads",
+        json={"filename": "test filename", "filesize": 10},
+    )
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+    client.cookies = missing_user_cookie
+    response = client.post(
+        f"{constants.api_version_prefix}/projects/{project_id}/uploads",
+        json={"filename": "test filename", "filesize": 10},
+    )
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
@@ -0,0 +1,65 @@
+import os
+import threading
+import time
+
+import anyio
+import pytest
+
+from api import executor
+from api.constants import constants
+
+
+@pytest.fixture
+def io_workers(monkeypatch):
+    monkeypatch.setattr(constants, "io_workers", 2)
+    executor.get_io_limiter.cache_clear()
+    yield constants.io_workers
+    executor.get_io_limiter.cache_clear()
+
+
+@pytest.mark.anyio
+async def test_io_pool_leaves_loop_running(io_workers):
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            await anyio.sleep(0.01)
+            ticks += 1
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(tick)
+        thread = await executor.run_in_io_pool(
+            lambda: time.sleep(0.3) or threading.current_thread()
+        )
+        tg.cancel_scope.cancel()
+
+    assert thread is not threading.current_thread()
+    # loop kept on running other tasks meanwhile
+    assert ticks >= 10
+
+
+@pytest.mark.anyio
+async def test_io_pool_bounded(io_workers):
+    running, max_running = 0, 0
+    lock = threading.Lock()
+
+    def blocking():
+        nonlocal running, max_running
+        with lock:
+            running += 1
+            max_running = max(max_running, running)
+        time.sleep(0.1)
+        with lock:
+            running -= 1
+
+    async with anyio.create_task_group() as tg:
+        for _ in range(io_workers * 3):
+            tg.start_soon(executor.run_in_io_pool, blocking)
+
+    assert max_running == io_workers
+
+
+@pytest.mark.anyio
+async def test_cpu_pool_runs_in_process():
+    assert await executor.run_in_cpu_pool(os.getpid) != os.getpid()
@@ -0,0 +1,139 @@
+import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+from api.constants import constants
+from api.storage.s3 import MultipartCheckpoint, S3Storage
+
+BUCKET_NAME = "test-bucket"
+# smallest part size S3 accepts (all parts but the last)
+PART_SIZE = 5 * 2**20
+
+
+@pytest.fixture
+def s3_storage(monkeypatch, fake_redis):
+    monkeypatch.setattr(constants, "s3_part_size", PART_SIZE)
+    monkeypatch.setattr(constants, "s3_part_retry_wait", 0)
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET_NAME)
+        storage = S3Storage()
+        storage._storage = SimpleNamespace(client=client, bucket_name=BUCKET_NAME)
+        yield storage
+
+
+@pytest.fixture
+def three_parts_file(tmp_path) -> Path:
+    fpath = tmp_path / "content"
+    fpath.write_bytes(b"a" * PART_SIZE + b"b" * PART_SIZE + b"c" * 10)
+    return fpath
+
+
+def fail_parts(
+    monkeypatch,
+    storage: S3Storage,
+    failures: dict[int, int],
+    code: str = "InternalError",
+):
+    """Make upload_part fail (with code) failures[number] times for those parts
+
+    Returns part numbers sent, in order"""
+    client = storage.storage.client
+    upload_part = client.upload_part
+    sent: list[int] = []
+
+    def flaky_upload_part(**kwargs):
+        number = kwargs["PartNumber"]
+        sent.append(number)
+        if failures.get(number, 0) > 0:
+            failures[number] -= 1
+            raise ClientError(
+                {"Error": {"Code": code, "Message": "Failed"}},
+                "UploadPart",
+            )
+        return upload_part(**kwargs)
+
+    monkeypatch.setattr(client, "upload_part", flaky_upload_part)
+    return sent
+
+
+def get_content(storage: S3Storage, path: str) -> bytes:
+    return storage.storage.client.get_object(Bucket=BUCKET_NAME, Key=path)[
+        "Body"
+    ].read()
+
+
+def test_upload_part_retried(monkeypatch, s3_storage, three_parts_file):
+    sent = fail_parts(monkeypatch, s3_storage, {2: 2})
+    s3_storage.upload_file_multipart(fpath=three_parts_file, path="key")
+
+    assert sorted(sent) == [1, 2, 2, 2, 3]
+    assert get_content(s3_storage, "key") == three_parts_file.read_bytes()
+    assert not MultipartCheckpoint("key").load()
+
+
+def test_upload_resumed_from_checkpoint(monkeypatch, s3_storage, three_parts_file):
+    monkeypatch.setattr(constants, "s3_part_max_tries", 2)
+    fail_parts(monkeypatch, s3_storage, {3: 2})
+    with pytest.raises(ClientError):
+        s3_storage.upload_file_multipart(fpath=three_parts_file, path="key")
+
+    checkpoint = MultipartCheckpoint("key")
+    assert checkpoint.load()
+    assert sorted(checkpoint.etags) == [1, 2]
+
+    sent = fail_parts(monkeypatch, s3_storage, {})
+    s3_storage.upload_file_multipart(fpath=three_parts_file, path="key")
+
+    assert sent == [3]
+    assert get_content(s3_storage, "key") == three_parts_file.read_bytes()
+    assert not MultipartCheckpoint("key").load()
+
+
+def test_abort_stale_uploads(monkeypatch, s3_storage, three_parts_file):
+    monkeypatch.setattr(constants, "s3_part_max_tries", 1)
+    fail_parts(monkeypatch, s3_storage, {3: 1})
+    with pytest.raises(ClientError):
+        s3_storage.upload_file_multipart(fpath=three_parts_file, path="key")
+    client = s3_storage.storage.client
+    (upload,) = client.list_multipart_uploads(Bucket=BUCKET_NAME)["Uploads"]
+
+    s3_storage.abort_stale_uploads(before=upload["Initiated"])
+    assert client.list_multipart_uploads(Bucket=BUCKET_NAME).get("Uploads")
+    assert MultipartCheckpoint("key").load()
+
+    s3_storage.abort_stale_uploads(
+        before=upload["Initiated"] + datetime.timedelta(seconds=1)
+    )
+    assert not client.list_multipart_uploads(Bucket=BUCKET_NAME).get("Uploads")
+    assert not MultipartCheckpoint("key").load()
+
+
+def test_upload_restarted_once_aborted(monkeypatch, s3_storage, three_parts_file):
+    monkeypatch.setattr(constants, "s3_part_max_tries", 1)
+    fail_parts(monkeypatch, s3_storage, {3: 1})
+    with pytest.raises(ClientError):
+        s3_storage.upload_file_multipart(fpath=three_parts_file, path="key")
+    checkpoint = MultipartCheckpoint("key")
+    checkpoint.load()
+    # aborted behind our back (eg. by a lifecycle rule)
+    s3_storage.storage.client.abort_multipart_upload(
+        Bucket=BUCKET_NAME, Key="key", UploadId=checkpoint.upload_id
+    )
+    # moto fails parts of aborted uploads with a KeyError, S3 with NoSuchUpload
+    sent = fail_parts(monkeypatch, s3_storage, {3: 1}, code="NoSuchUpload")
+
+    with pytest.raises(ClientError, match="NoSuchUpload"):
+        s3_storage.upload_file_multipart(fpath=three_parts_file, path="key")
+    assert sent == [3]
+    assert not MultipartCheckpoint("key").load()
+
+    sent = fail_parts(monkeypatch, s3_storage, {})
+    s3_storage.upload_file_multipart(fpath=three_parts_file, path="key")
+    assert sorted(sent) == [1, 2, 3]
+    assert get_content(s3_storage, "key") == three_parts_file.read_bytes()
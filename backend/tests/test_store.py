@@ -0,0 +1,22 @@
+import time
+
+from api.store import held_lock
+
+
+def test_held_lock_outlives_timeout(fake_redis):
+    with held_lock("lock-test", timeout=1) as acquired:
+        assert acquired
+        time.sleep(2)
+        assert fake_redis.exists("lock-test")
+        with held_lock("lock-test", timeout=1) as acquired_again:
+            assert not acquired_again
+    assert not fake_redis.exists("lock-test")
+
+
+def test_held_lock_expires_after_holder(fake_redis):
+    fake_redis.set("lock-test", "dead-holder", px=100)
+    with held_lock("lock-test", timeout=1) as acquired:
+        assert not acquired
+    time.sleep(0.2)
+    with held_lock("lock-test", timeout=1) as acquired:
+        assert acquired
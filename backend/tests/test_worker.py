@@ -0,0 +1,128 @@
+import os
+import signal
+import threading
+import time
+from collections import Counter
+
+import pytest
+from rq import Queue
+from rq.job import JobStatus
+from rq.worker import WorkerStatus
+
+from api.worker import ThreadPoolWorker
+
+# jobs running at once, per queue, and the most seen so far
+running: Counter[str] = Counter()
+max_running: Counter[str] = Counter()
+running_lock = threading.Lock()
+
+
+def tracked_job(queue_name: str, duration: float):
+    with running_lock:
+        running[queue_name] += 1
+        max_running[queue_name] = max(max_running[queue_name], running[queue_name])
+        max_running["all"] = max(max_running["all"], running.total())
+    try:
+        wait_job(duration)
+    finally:
+        with running_lock:
+            running[queue_name] -= 1
+
+
+def wait_job(duration: float):
+    # short sleeps: a timeout exception is only raised between them
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def counters():
+    running.clear()
+    max_running.clear()
+    yield
+
+
+@pytest.fixture
+def signal_handlers():
+    """Restore SIGINT/SIGTERM handlers, set by the worker"""
+    handlers = {
+        signum: signal.getsignal(signum) for signum in (signal.SIGINT, signal.SIGTERM)
+    }
+    yield
+    for signum, handler in handlers.items():
+        signal.signal(signum, handler)
+
+
+def make_worker(connection, concurrency: dict[str, int]) -> ThreadPoolWorker:
+    return ThreadPoolWorker(
+        [Queue(name, connection=connection) for name in concurrency],
+        concurrency=concurrency,
+        connection=connection,
+    )
+
+
+def test_concurrency_per_queue(fake_redis, counters, signal_handlers):
+    worker = make_worker(fake_redis, {"fast": 3, "slow": 1})
+    jobs = [
+        queue.enqueue(tracked_job, queue.name, 0.3)
+        for queue in worker.queues
+        for _ in range(5)
+    ]
+
+    assert worker.work(burst=True)
+
+    assert all(job.get_status() == JobStatus.FINISHED for job in jobs)
+    assert max_running["fast"] == 3
+    assert max_running["slow"] == 1
+    assert max_running["all"] == 4
+    assert worker.running == {"fast": 0, "slow": 0}
+
+
+def test_job_timeout(fake_redis, signal_handlers):
+    worker = make_worker(fake_redis, {"default": 2})
+    queue = worker.queues[0]
+    timed_out = queue.enqueue(wait_job, 5, job_timeout=1)
+    finished = queue.enqueue(wait_job, 0.1, job_timeout=1)
+
+    start = time.monotonic()
+    worker.work(burst=True)
+
+    assert time.monotonic() - start < 4
+    assert timed_out.get_status() == JobStatus.FAILED
+    assert "JobTimeoutException" in timed_out.latest_result().exc_string
+    assert finished.get_status() == JobStatus.FINISHED
+    assert worker.running == {"default": 0}
+
+
+def test_warm_shutdown(fake_redis, signal_handlers):
+    worker = make_worker(fake_redis, {"default": 1})
+    queue = worker.queues[0]
+    running_job = queue.enqueue(wait_job, 1)
+    queued_job = queue.enqueue(wait_job, 1)
+    threading.Timer(0.3, os.kill, (os.getpid(), signal.SIGTERM)).start()
+
+    worker.work()
+
+    # running job was completed, next one not started
+    assert running_job.get_status() == JobStatus.FINISHED
+    assert queued_job.get_status() == JobStatus.QUEUED
+
+
+def test_warm_shutdown_while_busy(fake_redis, signal_handlers):
+    worker = make_worker(fake_redis, {"default": 1})
+    queue = worker.queues[0]
+    running_job = queue.enqueue(wait_job, 1)
+    queued_job = queue.enqueue(wait_job, 1)
+
+    def request_stop():
+        # as last set by a job's thread: stop is then only flagged
+        worker.set_state(WorkerStatus.BUSY)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    threading.Timer(0.3, request_stop).start()
+
+    worker.work()
+
+    assert running_job.get_status() == JobStatus.FINISHED
+    assert queued_job.get_status() == JobStatus.QUEUED
@@ -214,6 +214,7 @@ export type ArchiveMetadataFormType = {
 
 export enum ArchiveStatus {
   PENDING = 'PENDING',
+  SUBMITTING = 'SUBMITTING',
   REQUESTED = 'REQUESTED',
   READY = 'READY',
   FAILED = 'FAILED'